@@ -23,13 +23,19 @@ import pandas as pd  # Pandas is a powerful data manipulation library
 from sklearn.metrics.pairwise import cosine_similarity
 import operator  # Operator module provides a set of convenient built-in functions
 
+# Import the local, cached dataset loaders
+from data_loader import filter_ratings, load_animes, load_ratings
+
+# Import the sparse rating matrix used by the recommendation functions
+from rating_matrix import SparseRatingMatrix
+
 """# 2. Load Data
 
 ## **2.1 Load Anime Data**
 """
 
-url_animes = "https://raw.githubusercontent.com/nuraulaola/Anime-Recommendation-System/main/Datasets/anime.csv"
-animes = pd.read_csv(url_animes)
+# Load the local Datasets/anime.csv with compact dtypes (cached as .npz after the first parse)
+animes = load_animes()
 animes.head()
 
 """**Content**
@@ -52,9 +58,8 @@ animes.head()
 ## **2.2 Load Ratings Data**
 """
 
-url_ratings = "https://raw.githubusercontent.com/nuraulaola/Anime-Recommendation-System/main/Datasets/rating.csv"
-ratings = pd.read_csv(url_ratings)
-ratings = ratings[ratings["rating"] != -1]
+# Stream the local Datasets/rating.csv in chunks (int32 ids, int8 ratings), dropping rating == -1
+ratings = load_ratings()
 ratings.head()
 
 """**Content**
@@ -355,18 +360,9 @@ plt.ylabel('Anime Name')
 plt.tight_layout()
 plt.show()
 
-# Create DataFrame for Ratings Per Anime
-ratings_per_anime_df = pd.DataFrame(ratings_per_anime)
-filtered_ratings_per_anime_df = ratings_per_anime_df[ratings_per_anime_df.rating >= 1000]
-popular_anime_ratings = filtered_ratings_per_anime_df.index.tolist()
-
-# Create DataFrame for Ratings Per User
-ratings_per_user_df = pd.DataFrame(ratings_per_user)
-filtered_ratings_per_user_df = ratings_per_user_df[ratings_per_user_df.rating <= 1000]
-prolific_user_ratings = filtered_ratings_per_user_df.index.tolist()
-
-# Filter based on both popular anime and prolific users
-filtered_ratings = ratings[ratings.anime_id.isin(popular_anime_ratings) & ratings.user_id.isin(prolific_user_ratings)]
+# Filter based on both popular anime (>= 1000 ratings) and users with <= 1000 ratings:
+# one np.bincount per side over integer codes and a single boolean mask, cached per threshold pair
+filtered_ratings = filter_ratings(ratings, min_anime_ratings=1000, max_user_ratings=1000)
 
 """#### **Top 10 Users with the Most Ratings**
 
@@ -436,136 +432,22 @@ plt.show()
 ## **4.1 Data Preparation and Matrix Creation**
 """
 
-rating_matrix = filtered_ratings.pivot_table(index='user_id', columns='anime_id', values='rating')
-rating_matrix = rating_matrix.fillna(0)
-rating_matrix.head()
+# Sparse users x anime matrix (CSR by user, CSC by anime); memory scales with the number of ratings
+rating_matrix = SparseRatingMatrix.from_ratings(filtered_ratings)
+rating_matrix
 
 """## **4.2 Similar User Identification**"""
 
-def similar_users(user_id, matrix, k=5):
-
-    # Find similar users to the given user based on cosine similarity.
-
-    # Parameters:
-    # - user_id (int): The target user ID.
-    # - matrix (pd.DataFrame): The rating matrix.
-    # - k (int): Number of similar users to retrieve.
-
-    # Returns:
-    # - List of similar user indices.
-    # - List of (user_index, cosine_similarity_score) tuples.
-
-    # Check if the user has any ratings
-    if user_id not in matrix.index:
-        print(f"User {user_id} has no ratings.")
-        return [], []
-
-    user = matrix.loc[matrix.index == user_id]
-    other_users = matrix.loc[matrix.index != user_id]
-
-    # Check if the other_users DataFrame is not empty
-    if other_users.empty:
-        print("No other users with ratings.")
-        return [], []
-
-    similarities = cosine_similarity(user, other_users)[0].tolist()
-    indices = other_users.index.tolist()
-    index_similarity = dict(zip(indices, similarities))
-    index_similarity_sorted = sorted(index_similarity.items(), key=operator.itemgetter(1), reverse=True)
-    top_users_similarities = index_similarity_sorted[:k]
-    users = [u[0] for u in top_users_similarities]
-
-    return users, top_users_similarities
+# similar_users accepts either the dense pivot table or a SparseRatingMatrix
+from recommender import similar_users
 
 """## **4.3 Recommendation Function Definition**"""
 
-def recommend_item(user_index, similar_user_indices, matrix, items=5, anime_data=None):
-
-    # Generate item recommendations for a given user based on similar users' ratings.
-
-    # Parameters:
-    # - user_index (int): Index of the target user.
-    # - similar_user_indices (list): List of indices of similar users.
-    # - matrix (pd.DataFrame): The rating matrix.
-    # - items (int): Number of items to recommend.
-
-    # Returns:
-    # - pd.Series: Series containing mean ratings of similar users for unseen items.
-    # - list: List of top N recommended item indices.
-
-   # Get ratings of similar users
-    similar_users = matrix[matrix.index.isin(similar_user_indices)]
-    similar_users_mean = similar_users.mean(axis=0)
-
-    # Ensure the user_index is converted to integer (if needed)
-    user_index = int(user_index)
-
-    # Filter ratings of unseen animes from similar users directly in the mean calculation
-    similar_users_ratings = similar_users_mean[similar_users_mean.index.isin(matrix.loc[user_index][matrix.loc[user_index] == 0].index)]
-
-    # Sort by mean rating in descending order
-    similar_users_ratings_sorted = similar_users_ratings.sort_values(ascending=False)
-
-    # Get top N recommendations
-    top_n_anime_indices = similar_users_ratings_sorted.head(items).index.tolist()
-
-    # If anime_data is provided, add anime names to the recommendations
-    if anime_data is not None:
-        recommendations_with_names = pd.merge(
-            pd.DataFrame({'mean_rating': similar_users_ratings_sorted}),
-            anime_data[['anime_id', 'name']],
-            left_index=True,
-            right_on='anime_id'
-        )
-        return recommendations_with_names, top_n_anime_indices
-    else:
-        return similar_users_ratings_sorted, top_n_anime_indices
+from recommender import recommend_item
 
 """## **4.4 Recommendation Function Definition (Specifically for 'Movie' Anime Type)**"""
 
-def recommend_movie(user_index, similar_user_indices, matrix, items=5, anime_data=None):
-    # Generate item recommendations for a given user based on similar users' ratings.
-
-    # Parameters:
-    # - user_index (int): Index of the target user.
-    # - similar_user_indices (list): List of indices of similar users.
-    # - matrix (pd.DataFrame): The rating matrix.
-    # - items (int): Number of items to recommend.
-    # - anime_data (pd.DataFrame): Dataframe containing anime information.
-
-    # Returns:
-    # - pd.DataFrame: DataFrame containing mean ratings of similar users for unseen 'Movie' items with names.
-    # - list: List of top N recommended 'Movie' item indices.
-
-    # Get ratings of similar users
-    similar_users = matrix[matrix.index.isin(similar_user_indices)]
-    similar_users_mean = similar_users.mean(axis=0)
-
-    # Ensure the user_index is converted to integer (if needed)
-    user_index = int(user_index)
-
-    # Filter ratings of unseen 'Movie' animes from similar users directly in the mean calculation
-    unseen_movies = matrix.loc[user_index][matrix.loc[user_index] == 0].index
-    similar_users_ratings = similar_users_mean[unseen_movies]
-
-    # Sort by mean rating in descending order
-    similar_users_ratings_sorted = similar_users_ratings.sort_values(ascending=False)
-
-    # Get top N recommendations
-    top_n_movie_indices = similar_users_ratings_sorted.head(items).index.tolist()
-
-    # If anime_data is provided, add 'Movie' names to the recommendations
-    if anime_data is not None:
-        recommendations_with_names = pd.merge(
-            pd.DataFrame({'mean_rating': similar_users_ratings_sorted}),
-            anime_data[['anime_id', 'name', 'type']],
-            left_index=True,
-            right_on='anime_id'
-        )
-        recommendations_movies = recommendations_with_names[recommendations_with_names['type'] == 'Movie']
-        return recommendations_movies, top_n_movie_indices
-    else:
-        return similar_users_ratings_sorted, top_n_movie_indices
+from recommender import recommend_movie
 
 """## **4.5 Specific Recommendations for User ID 226**
 
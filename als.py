@@ -0,0 +1,252 @@
+# Import libraries for running solves across threads
+from concurrent.futures import ThreadPoolExecutor
+
+# Import numerical computation libraries
+import numpy as np
+import pandas as pd
+
+# Import sparse matrix containers
+from scipy import sparse
+
+from anime_index import anime_index_for
+from instrumentation import instrumented, span
+from neighbors import top_k_rows
+
+# Upper bound on the (ratings x factors x factors) outer-product buffer of one solve block
+BLOCK_BYTES = 64 * 2 ** 20
+
+
+def _blocks(indptr, max_nnz, max_rows):
+    # Split rows into contiguous ranges holding at most max_nnz entries (a single heavier row gets its own range)
+    bounds = [0]
+    n_rows = len(indptr) - 1
+    while bounds[-1] < n_rows:
+        start = bounds[-1]
+        stop = int(np.searchsorted(indptr, indptr[start] + max_nnz, side='right')) - 1
+        bounds.append(min(max(stop, start + 1), start + max_rows, n_rows))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _solve_block(out, other, indptr, indices, data, start, stop, regularization, implicit, alpha, gram):
+    # Least-squares update of rows start:stop given the fixed factors of the other side.
+
+    # Explicit feedback minimizes sum (r - x.y)^2 + regularization * n_ratings * |x|^2 over the rated entries;
+    # implicit feedback (Hu, Koren & Volinsky) weights every entry with confidence 1 + alpha * r.
+
+    lo, hi = indptr[start], indptr[stop]
+    counts = np.diff(indptr[start:stop + 1])
+    factors = other.shape[1]
+    y = other[indices[lo:hi]]
+    values = data[lo:hi]
+
+    if implicit:
+        weights, targets = alpha * values, 1 + alpha * values
+    else:
+        weights, targets = np.ones_like(values), values
+
+    rows = stop - start
+    if rows == 1:
+        # One (possibly heavy) row: plain matrix products instead of per-rating outer products
+        a = (y.T @ (weights[:, None] * y))[None]
+        b = (y.T @ targets)[None]
+    else:
+        # Segment sums of the per-rating outer products as one sparse (rows x ratings) product
+        segments = np.repeat(np.arange(rows), counts)
+        columns = np.arange(hi - lo)
+        weighted = sparse.csr_matrix((weights, (segments, columns)), shape=(rows, hi - lo))
+        targeted = sparse.csr_matrix((targets, (segments, columns)), shape=(rows, hi - lo))
+        outer = (y[:, :, None] * y[:, None, :]).reshape(hi - lo, factors * factors)
+        a = np.asarray(weighted @ outer, dtype=np.float32).reshape(rows, factors, factors)
+        b = np.asarray(targeted @ y, dtype=np.float32)
+
+    identity = np.eye(factors, dtype=np.float32)
+    if implicit:
+        a += gram + regularization * identity
+    else:
+        a += regularization * np.maximum(counts, 1)[:, None, None] * identity
+    out[start:stop] = np.linalg.solve(a, b[:, :, None])[:, :, 0]
+
+
+class ALSModel:
+    # Matrix-factorization model trained with alternating least squares.
+    #
+    # Every user and anime gets a dense factor vector; a user's predicted score
+    # for an anime is the dot product of the two, so recommending is one
+    # (users x factors) x (factors x anime) product instead of a neighbor search
+    # over raw rating vectors.
+    #
+    # Attributes:
+    # - user_factors (np.ndarray): (n_users, factors) float32, row i is user_ids[i].
+    # - item_factors (np.ndarray): (n_anime, factors) float32, row j is anime_ids[j].
+    # - user_ids, anime_ids (np.ndarray): IDs of the rating matrix the model was trained on.
+
+    def __init__(self, user_factors, item_factors, user_ids, anime_ids):
+        self.user_factors = np.asarray(user_factors, dtype=np.float32)
+        self.item_factors = np.asarray(item_factors, dtype=np.float32)
+        self.user_ids = np.asarray(user_ids)
+        self.anime_ids = np.asarray(anime_ids)
+
+    @classmethod
+    @instrumented('als_fit')
+    def fit(cls, matrix, factors=64, regularization=0.1, iterations=15, implicit=False, alpha=40.0,
+            threads=None, seed=0):
+        # Train on a SparseRatingMatrix (e.g. built from filtered_ratings).
+
+        # Parameters:
+        # - matrix (SparseRatingMatrix): The rating matrix.
+        # - factors (int): Latent dimensions.
+        # - regularization (float): L2 penalty (scaled by the rating count per row for explicit feedback).
+        # - iterations (int): Alternating user / anime sweeps.
+        # - implicit (bool): Treat ratings as confidence-weighted implicit feedback instead of explicit scores.
+        # - alpha (float): Confidence scale for implicit feedback.
+        # - threads (int, optional): Threads solving blocks concurrently (NumPy releases the GIL); defaults to 1.
+        # - seed (int): Random seed for the initial factors.
+
+        # Returns:
+        # - ALSModel: The trained model.
+
+        rng = np.random.default_rng(seed)
+        n_users, n_anime = matrix.shape
+        user_factors = np.zeros((n_users, factors), dtype=np.float32)
+        item_factors = (rng.standard_normal((n_anime, factors)) * 0.01).astype(np.float32)
+
+        csr, csc = matrix.csr, matrix.csc
+        max_nnz = max(1, BLOCK_BYTES // (4 * factors * factors))
+        user_blocks = _blocks(csr.indptr, max_nnz, max_nnz)
+        item_blocks = _blocks(csc.indptr, max_nnz, max_nnz)
+        sides = [
+            (user_factors, item_factors, csr.indptr, csr.indices, csr.data.astype(np.float32), user_blocks),
+            (item_factors, user_factors, csc.indptr, csc.indices, csc.data.astype(np.float32), item_blocks),
+        ]
+
+        with ThreadPoolExecutor(max_workers=threads or 1) as pool:
+            for _ in range(iterations):
+                for out, other, indptr, indices, data, blocks in sides:
+                    gram = other.T @ other if implicit else None
+                    futures = [
+                        pool.submit(_solve_block, out, other, indptr, indices, data, start, stop,
+                                    regularization, implicit, alpha, gram)
+                        for start, stop in blocks
+                    ]
+                    for future in futures:
+                        future.result()
+
+        return cls(user_factors, item_factors, matrix.user_ids, matrix.anime_ids)
+
+    def save(self, path):
+        # Persist the factor matrices and their IDs to an .npz file
+        np.savez(
+            path,
+            user_factors=self.user_factors,
+            item_factors=self.item_factors,
+            user_ids=self.user_ids,
+            anime_ids=self.anime_ids,
+        )
+
+    @classmethod
+    def load(cls, path, mmap=False):
+        # Load a model saved with save(); mmap=True maps the factors from an uncompressed file lazily
+        with np.load(path, mmap_mode='r' if mmap else None) as data:
+            return cls(data['user_factors'], data['item_factors'], data['user_ids'], data['anime_ids'])
+
+    def scores(self, rows):
+        # (len(rows), n_anime) predicted scores for the users at the given row positions
+        return self.user_factors[np.asarray(rows, dtype=np.intp)] @ self.item_factors.T
+
+    def recommend(self, matrix, rows, items=10, mask=None, block_size=1024):
+        # Batched top-N for many users with seen-item masking.
+
+        # Parameters:
+        # - matrix (SparseRatingMatrix): Rating matrix used to mask the anime each user has rated.
+        # - rows (np.ndarray): Row positions of the users.
+        # - items (int): Recommendations per user.
+        # - mask (np.ndarray, optional): (n_anime,) bool mask of allowed anime (e.g. AnimeIndex.mask_for).
+        # - block_size (int): Users scored per product; peak memory is about block_size x n_anime floats.
+
+        # Returns:
+        # - np.ndarray: (len(rows), items) anime column positions, best first, -1 where fewer are available.
+        # - np.ndarray: (len(rows), items) float32 scores, NaN where padded.
+
+        rows = np.asarray(rows, dtype=np.intp)
+        n_anime = self.item_factors.shape[0]
+        n = min(items, n_anime)
+        positions = np.full((len(rows), items), -1, dtype=np.int64)
+        scores_out = np.full((len(rows), items), np.nan, dtype=np.float32)
+
+        for start in range(0, len(rows), block_size):
+            block = rows[start:start + block_size]
+            with span('als_score'):
+                scores = self.scores(block)
+                seen = matrix.csr[block]
+                scores[np.repeat(np.arange(len(block)), np.diff(seen.indptr)), seen.indices] = -np.inf
+                if mask is not None:
+                    scores[:, ~mask] = -np.inf
+
+            with span('top_n'):
+                top = top_k_rows(scores, n)
+                top_scores = np.take_along_axis(scores, top, axis=1)
+            valid = np.isfinite(top_scores)
+            positions[start:start + len(block), :n] = np.where(valid, top, -1)
+            scores_out[start:start + len(block), :n] = np.where(valid, top_scores, np.nan)
+        return positions, scores_out
+
+
+def default_model(matrix):
+    # ALS model with default parameters, trained once per rating matrix (and retrained after updates)
+    return matrix.cached_model('als', ALSModel.fit)
+
+
+@instrumented()
+def recommend_als(user_index, similar_user_indices, matrix, items=5, anime_data=None, weights=None, filters=None,
+                  model=None):
+
+    # Generate item recommendations for a given user from ALS factors.
+
+    # Drop-in replacement for recommend_item: the neighbor arguments are accepted so the
+    # call site does not change, but the scores come from the factor model.
+
+    # Parameters:
+    # - user_index (int): Index of the target user.
+    # - similar_user_indices (list): Ignored (kept for the recommend_item signature).
+    # - matrix (SparseRatingMatrix): The rating matrix the model was trained on.
+    # - items (int): Number of items to recommend.
+    # - anime_data (pd.DataFrame or AnimeIndex): Anime information used to attach names.
+    # - weights (list, optional): Ignored (kept for the recommend_item signature).
+    # - filters (dict, optional): Type / genre filters, see AnimeIndex.mask (requires anime_data).
+    # - model (ALSModel, optional): Trained model; a default one is trained and cached if omitted.
+
+    # Returns:
+    # - pd.Series (or pd.DataFrame with names): Predicted scores for the top N unseen items.
+    # - list: List of top N recommended item indices.
+
+    if model is None:
+        model = default_model(matrix)
+    if not (np.array_equal(model.anime_ids, matrix.anime_ids) and np.array_equal(model.user_ids, matrix.user_ids)):
+        raise ValueError("ALS model was trained on a different rating matrix.")
+
+    position = matrix.user_position(int(user_index))
+    if position is None:
+        print(f"User {user_index} has no ratings.")
+        empty = pd.Series(dtype=np.float32, name='predicted_rating')
+        return (pd.DataFrame(columns=['predicted_rating', 'anime_id', 'name']) if anime_data is not None else empty), []
+
+    mask = None
+    if filters:
+        if anime_data is None:
+            raise ValueError("anime_data is required to apply filters.")
+        mask = anime_index_for(anime_data).mask_for(matrix.anime_ids, filters)
+
+    positions, scores = model.recommend(matrix, [position], items=items, mask=mask)
+    valid = positions[0] >= 0
+    anime_ids = matrix.anime_ids[positions[0][valid]]
+    recommendations = pd.Series(scores[0][valid], index=pd.Index(anime_ids, name='anime_id'), name='predicted_rating')
+    top_n_anime_indices = anime_ids.tolist()
+
+    if anime_data is not None:
+        recommendations_with_names = pd.DataFrame({
+            'predicted_rating': recommendations.to_numpy(),
+            'anime_id': anime_ids,
+            'name': anime_index_for(anime_data).names_for(anime_ids),
+        })
+        return recommendations_with_names, top_n_anime_indices
+    return recommendations, top_n_anime_indices
@@ -0,0 +1,184 @@
+# Import libraries for caching
+import weakref
+
+# Import numerical computation libraries
+import numpy as np
+import pandas as pd
+
+# Recognized keys of a filters dict passed to the recommend functions
+FILTER_KEYS = {'type', 'genres_all', 'genres_any'}
+
+
+def parse_genres(genres):
+    # Split comma-separated genre strings into lists (missing genres become [])
+    return [[g.strip() for g in value.split(',') if g.strip()] if isinstance(value, str) else [] for value in genres]
+
+
+def pack_genres(genre_lists, genre_names):
+    # Encode genre lists as packed bit vectors.
+
+    # Parameters:
+    # - genre_lists (list of list of str): Genres of each anime.
+    # - genre_names (list of str): Genre vocabulary; genre i is bit i % 64 of word i // 64.
+
+    # Returns:
+    # - np.ndarray: (n_anime, n_words) uint64 bit vectors.
+
+    lookup = {name: i for i, name in enumerate(genre_names)}
+    n_words = max(1, (len(genre_names) + 63) // 64)
+    bits = np.zeros((len(genre_lists), n_words * 64), dtype=bool)
+    for row, genres in enumerate(genre_lists):
+        bits[row, [lookup[g] for g in genres if g in lookup]] = True
+    return np.packbits(bits, axis=1, bitorder='little').view(np.uint64)
+
+
+class AnimeIndex:
+    # Prebuilt per-anime lookup arrays, sorted by anime_id.
+    #
+    # Replaces per-call pd.merge with anime_data: IDs are mapped to positions
+    # with a binary search and attributes are gathered by integer index. Type
+    # and genre filters are evaluated as boolean masks over these arrays.
+    #
+    # Attributes:
+    # - anime_ids (np.ndarray): Sorted anime IDs.
+    # - names (np.ndarray): Anime names (object array) aligned with anime_ids.
+    # - type_names (list): Distinct anime types; type_codes index into it (-1 if missing).
+    # - type_codes (np.ndarray): int8 type code per anime.
+    # - genre_names (list): Distinct genres; genre i is bit i of genre_masks.
+    # - genre_masks (np.ndarray): (n_anime, n_words) uint64 genre bit vectors.
+    # - members (np.ndarray): Community member count per anime (0 if unknown).
+
+    def __init__(self, anime_ids, names, type_names=(), type_codes=None, genre_names=(), genre_masks=None, members=None):
+        self.anime_ids = np.asarray(anime_ids)
+        self.names = np.asarray(names, dtype=object)
+        self.type_names = list(type_names)
+        self.type_codes = np.full(len(self.anime_ids), -1, dtype=np.int8) if type_codes is None else np.asarray(type_codes)
+        self.genre_names = list(genre_names)
+        self.genre_masks = np.zeros((len(self.anime_ids), 1), dtype=np.uint64) if genre_masks is None else np.asarray(genre_masks)
+        self.members = np.zeros(len(self.anime_ids), dtype=np.int32) if members is None else np.asarray(members)
+
+    @classmethod
+    def from_frame(cls, anime_data):
+        # Build the index from an anime DataFrame (e.g. animes loaded from anime.csv)
+        anime_data = anime_data.drop_duplicates('anime_id').sort_values('anime_id')
+
+        types = anime_data['type'] if 'type' in anime_data else pd.Series(np.nan, index=anime_data.index)
+        type_codes, type_names = pd.factorize(types, sort=True)
+
+        genre_lists = parse_genres(anime_data['genre'] if 'genre' in anime_data else [None] * len(anime_data))
+        genre_names = sorted({g for genres in genre_lists for g in genres})
+
+        return cls(
+            anime_data['anime_id'].to_numpy(),
+            anime_data['name'].to_numpy(dtype=object),
+            type_names=list(type_names),
+            type_codes=type_codes.astype(np.int8),
+            genre_names=genre_names,
+            genre_masks=pack_genres(genre_lists, genre_names),
+            members=anime_data['members'].fillna(0).to_numpy(dtype=np.int32) if 'members' in anime_data else None,
+        )
+
+    def save(self, path):
+        # Persist the index to an .npz file; names and vocabularies are stored as fixed-width strings, not pickles
+        np.savez(
+            path,
+            anime_ids=self.anime_ids,
+            names=np.array([name if isinstance(name, str) else '' for name in self.names], dtype=str),
+            type_names=np.array(self.type_names, dtype=str),
+            type_codes=self.type_codes,
+            genre_names=np.array(self.genre_names, dtype=str),
+            genre_masks=self.genre_masks,
+            members=self.members,
+        )
+
+    @classmethod
+    def load(cls, path):
+        # Load an index saved with save()
+        with np.load(path) as data:
+            return cls(
+                data['anime_ids'], data['names'], data['type_names'].tolist(), data['type_codes'],
+                data['genre_names'].tolist(), data['genre_masks'], data['members'],
+            )
+
+    def positions(self, anime_ids):
+        # Positions of anime IDs in the index plus a mask of which IDs were found
+        anime_ids = np.asarray(anime_ids)
+        if len(self.anime_ids) == 0:
+            return np.zeros(anime_ids.shape, dtype=np.intp), np.zeros(anime_ids.shape, dtype=bool)
+        positions = np.minimum(np.searchsorted(self.anime_ids, anime_ids), len(self.anime_ids) - 1)
+        return positions, self.anime_ids[positions] == anime_ids
+
+    def names_for(self, anime_ids):
+        # Names for anime IDs; None where the ID is unknown
+        positions, found = self.positions(anime_ids)
+        return np.where(found, self.names[positions], None)
+
+    def types_for(self, anime_ids):
+        # Types for anime IDs; None where the ID or its type is unknown
+        positions, found = self.positions(anime_ids)
+        codes = np.where(found, self.type_codes[positions], -1)
+        type_names = np.array(self.type_names + [None], dtype=object)
+        return type_names[codes]
+
+    def genre_query(self, genres):
+        # Packed bit vector (one row of genre_masks) for a set of genre names
+        unknown = set(genres) - set(self.genre_names)
+        if unknown:
+            raise ValueError(f"Unknown genres: {sorted(unknown)}")
+        return pack_genres([list(genres)], self.genre_names)[0]
+
+    def mask(self, filters, positions=None):
+        # Boolean mask over the index of the anime that pass the filters.
+
+        # Parameters:
+        # - filters (dict): Any of
+        #   - 'type': collection of allowed types, e.g. {'Movie'}.
+        #   - 'genres_all': genres that must all be present.
+        #   - 'genres_any': genres of which at least one must be present.
+        # - positions (np.ndarray, optional): Only test these index positions.
+
+        # Returns:
+        # - np.ndarray: Boolean mask aligned with anime_ids (or with positions).
+
+        unknown = set(filters) - FILTER_KEYS
+        if unknown:
+            raise ValueError(f"Unknown filters: {sorted(unknown)}")
+
+        type_codes = self.type_codes if positions is None else self.type_codes[positions]
+        genre_masks = self.genre_masks if positions is None else self.genre_masks[positions]
+        keep = np.ones(len(type_codes), dtype=bool)
+        if filters.get('type'):
+            allowed = [self.type_names.index(t) for t in filters['type'] if t in self.type_names]
+            keep &= np.isin(type_codes, allowed)
+        if filters.get('genres_all'):
+            query = self.genre_query(filters['genres_all'])
+            keep &= ((genre_masks & query) == query).all(axis=1)
+        if filters.get('genres_any'):
+            query = self.genre_query(filters['genres_any'])
+            keep &= (genre_masks & query).any(axis=1)
+        return keep
+
+    def mask_for(self, anime_ids, filters):
+        # Filter mask aligned with an arbitrary anime ID array (e.g. the rating matrix columns)
+        positions, found = self.positions(anime_ids)
+        return found & self.mask(filters)[positions]
+
+
+_frame_indexes = {}
+
+
+def anime_index_for(anime_data):
+    # AnimeIndex for anime_data, which may already be an AnimeIndex or a DataFrame.
+    # Indexes built from a DataFrame are cached for as long as that DataFrame is alive.
+
+    if isinstance(anime_data, AnimeIndex):
+        return anime_data
+
+    key = id(anime_data)
+    cached = _frame_indexes.get(key)
+    if cached is not None and cached[0]() is anime_data:
+        return cached[1]
+
+    index = AnimeIndex.from_frame(anime_data)
+    _frame_indexes[key] = (weakref.ref(anime_data, lambda _, key=key: _frame_indexes.pop(key, None)), index)
+    return index
@@ -0,0 +1,181 @@
+# Import numerical computation libraries
+import numpy as np
+import time
+
+from neighbors import neighbor_positions, top_k_rows
+
+
+class LSHIndex:
+    # Approximate nearest-neighbor index over normalized user rating vectors.
+    #
+    # Random-hyperplane LSH: each of n_tables tables hashes a user to the sign
+    # pattern of n_bits random projections. Users sharing a bucket (or, with
+    # probes=1, a bucket one bit away) become candidates, which are re-ranked
+    # with exact cosine similarity. More tables/probes raise recall, more bits
+    # shrink the buckets and speed up queries.
+    #
+    # Attributes:
+    # - matrix (SparseRatingMatrix): The indexed rating matrix.
+    # - hyperplanes (np.ndarray): (n_anime, n_tables * n_bits) float32 projections.
+    # - sorted_codes (np.ndarray): (n_tables, n_users) bucket codes in ascending order.
+    # - order (np.ndarray): (n_tables, n_users) row positions matching sorted_codes.
+
+    def __init__(self, matrix, hyperplanes, sorted_codes, order, n_tables, n_bits, probes=1):
+        self.matrix = matrix
+        self.hyperplanes = hyperplanes
+        self.sorted_codes = sorted_codes
+        self.order = order
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.probes = probes
+
+    @classmethod
+    def build(cls, matrix, n_tables=16, n_bits=12, probes=1, seed=0):
+        # Hash every user of a SparseRatingMatrix into n_tables LSH tables.
+
+        # Parameters:
+        # - matrix (SparseRatingMatrix): The rating matrix.
+        # - n_tables (int): Number of independent hash tables.
+        # - n_bits (int): Hyperplanes per table (at most 63).
+        # - probes (int): 0 to look up the exact bucket only, 1 to also probe buckets one bit away.
+        # - seed (int): Seed for the random hyperplanes.
+
+        # Returns:
+        # - LSHIndex: The built index.
+
+        if not 0 < n_bits < 64:
+            raise ValueError("n_bits must be between 1 and 63")
+
+        rng = np.random.default_rng(seed)
+        hyperplanes = rng.standard_normal((matrix.shape[1], n_tables * n_bits)).astype(np.float32)
+        codes = cls._hash(matrix.normalized() @ hyperplanes, n_tables, n_bits)
+
+        order = np.argsort(codes, axis=1, kind='stable')
+        sorted_codes = np.take_along_axis(codes, order, axis=1)
+        return cls(matrix, hyperplanes, sorted_codes, order, n_tables, n_bits, probes)
+
+    @staticmethod
+    def _hash(projections, n_tables, n_bits):
+        # Pack the sign bits of (n, n_tables * n_bits) projections into (n_tables, n) codes
+        bits = (np.asarray(projections) > 0).reshape(-1, n_tables, n_bits)
+        weights = np.left_shift(np.uint64(1), np.arange(n_bits, dtype=np.uint64))
+        return (bits.astype(np.uint64) * weights).sum(axis=2, dtype=np.uint64).T
+
+    def save(self, path):
+        # Persist the index to an .npz file (the rating matrix itself is not stored)
+        np.savez(
+            path,
+            hyperplanes=self.hyperplanes,
+            sorted_codes=self.sorted_codes,
+            order=self.order,
+            user_ids=self.matrix.user_ids,
+            params=np.array([self.n_tables, self.n_bits, self.probes]),
+        )
+
+    @classmethod
+    def load(cls, path, matrix):
+        # Load an index saved with save() and attach it to the matrix it was built from
+        with np.load(path) as data:
+            if not np.array_equal(data['user_ids'], matrix.user_ids):
+                raise ValueError("Index was built for a different rating matrix.")
+            n_tables, n_bits, probes = (int(p) for p in data['params'])
+            return cls(matrix, data['hyperplanes'], data['sorted_codes'], data['order'], n_tables, n_bits, probes)
+
+    def candidates(self, position):
+        # Row positions sharing (or, with probes, neighboring) a bucket with the given row
+        projections = self.matrix.normalized()[position] @ self.hyperplanes
+        codes = self._hash(projections, self.n_tables, self.n_bits)[:, 0]
+
+        if self.probes:
+            flips = np.left_shift(np.uint64(1), np.arange(self.n_bits, dtype=np.uint64))
+            probe_codes = np.concatenate([codes[:, None], codes[:, None] ^ flips[None, :]], axis=1)
+        else:
+            probe_codes = codes[:, None]
+
+        n_users = self.order.shape[1]
+        lo = np.empty(probe_codes.shape, dtype=np.int64)
+        hi = np.empty(probe_codes.shape, dtype=np.int64)
+        for table in range(self.n_tables):
+            lo[table] = np.searchsorted(self.sorted_codes[table], probe_codes[table], side='left')
+            hi[table] = np.searchsorted(self.sorted_codes[table], probe_codes[table], side='right')
+
+        # Expand every [lo, hi) bucket range into flat offsets of self.order without a Python loop
+        starts = (lo + np.arange(self.n_tables)[:, None] * n_users).ravel()
+        lengths = (hi - lo).ravel()
+        total = lengths.sum()
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        ends = np.cumsum(lengths)
+        offsets = np.arange(total) - np.repeat(ends - lengths, lengths) + np.repeat(starts, lengths)
+
+        candidates = np.unique(self.order.ravel()[offsets])
+        return candidates[candidates != position]
+
+    def query(self, position, k=5):
+        # Approximate top-k neighbors of a row position.
+
+        # Parameters:
+        # - position (int): Row position of the query user.
+        # - k (int): Number of neighbors.
+
+        # Returns:
+        # - np.ndarray: Up to k neighbor row positions, best first.
+        # - np.ndarray: Matching cosine similarities.
+
+        candidates = self.candidates(position)
+        if len(candidates) == 0:
+            return candidates, np.empty(0, dtype=np.float32)
+
+        normalized = self.matrix.normalized()
+        scores = np.asarray((normalized[candidates] @ normalized[position].T).todense(), dtype=np.float32).T
+        top = top_k_rows(scores, min(k, len(candidates)))[0]
+        return candidates[top], scores[0, top]
+
+    def recall(self, k=5, sample=500, seed=0):
+        # Measure recall@k of the index against exact brute-force search, see index_recall
+        return index_recall(self, k=k, sample=sample, seed=seed)
+
+
+def index_recall(index, k=5, sample=500, seed=0):
+    # Measure recall@k of a candidate index against exact brute-force search.
+
+    # Parameters:
+    # - index (LSHIndex or UserClusterIndex): Anything with matrix, candidates(position) and query(position, k).
+    # - k (int): Number of neighbors compared.
+    # - sample (int): Number of random users to evaluate.
+    # - seed (int): Seed for the user sample.
+
+    # Returns:
+    # - dict: recall, mean candidates per query, and mean exact / approximate seconds per query.
+
+    rng = np.random.default_rng(seed)
+    n_users = index.matrix.shape[0]
+    rows = rng.choice(n_users, size=min(sample, n_users), replace=False)
+
+    start = time.perf_counter()
+    exact, _ = neighbor_positions(index.matrix, rows, k=k, block_size=1)
+    exact_seconds = time.perf_counter() - start
+
+    hits, total, candidates = 0, 0, 0
+    start = time.perf_counter()
+    for row, truth in zip(rows, exact):
+        approximate, _ = index.query(row, k=k)
+        truth = truth[truth >= 0]
+        hits += len(np.intersect1d(approximate, truth))
+        total += len(truth)
+    approximate_seconds = time.perf_counter() - start
+
+    for row in rows:
+        candidates += len(index.candidates(row))
+
+    return {
+        'recall': hits / total if total else 1.0,
+        'mean_candidates': candidates / len(rows),
+        'exact_seconds_per_query': exact_seconds / len(rows),
+        'approximate_seconds_per_query': approximate_seconds / len(rows),
+    }
+
+
+def default_index(matrix):
+    # LSH index with default parameters, built once per rating matrix (and rebuilt after updates)
+    return matrix.cached_model('lsh_index', LSHIndex.build)
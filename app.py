@@ -1,19 +1,56 @@
-# Import necessary libraries
+# Import necessary libraries (serving only: no plotting, sklearn or CSV parsing at startup)
 import streamlit as st
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
-import seaborn as sns
-from sklearn.metrics.pairwise import cosine_similarity
-import operator
-
-# Load pickled recommendations and indices
-try:
-    recommendations = pd.read_pickle("recommendations.pkl")
-    top_recommendations_indices = np.load("top_recommendations_indices.pkl")
-except FileNotFoundError:
-    # Handle the case when the files are not found
-    recommendations = pd.DataFrame(columns=["anime_id", "name", "mean_rating"])
-    top_recommendations_indices = np.array([])
+
+import serving
+from ttl_cache import TTLCache, make_key
+
+
+@st.cache_resource
+def load_models():
+    # Load data and model objects once per process (Streamlit reruns this script on every interaction);
+    # the rating matrix and anime index are memory-mapped from `python serving.py export` artifacts
+    return serving.load_models()
+
+
+@st.cache_resource
+def result_cache():
+    # Per-request results shared by all sessions: bounded LRU with a 10 minute TTL
+    return TTLCache(maxsize=4096, ttl=600)
+
+
+models = load_models()
+store, anime_index, rating_matrix, clusters, cold_start = models
+cache = result_cache()
 
 # Recommendation System Functions
+st.title("Anime Recommendation System")
+
+if store is None and rating_matrix is None:
+    st.warning("No recommendation store or rating data found. Run `python recommendation_store.py` to export one.")
+else:
+    user_id = st.number_input("User ID", min_value=0, value=226, step=1)
+    k = st.slider("Number of similar users", min_value=1, max_value=50, value=5)
+    items = st.slider("Number of recommendations", min_value=1, max_value=50, value=5)
+
+    filters = {}
+    if anime_index is not None and rating_matrix is not None:
+        filters['type'] = st.multiselect("Type", anime_index.type_names)
+        filters['genres_all'] = st.multiselect("Genres (all of)", anime_index.genre_names)
+        filters = {name: set(values) for name, values in filters.items() if values}
+
+    recommendations = cache.get_or_compute(make_key(user_id, k, items, filters), lambda: serving.recommend(models, user_id, k, items, filters))
+    if recommendations is None:
+        st.info("Live recommendations need Datasets/rating.csv; only precomputed results are available.")
+    elif len(recommendations):
+        if 'weighted_rating' in recommendations:
+            st.caption(f"User {user_id} has too few ratings for similar users; showing the top-rated anime instead.")
+        st.dataframe(recommendations)
+    else:
+        st.info(f"User {user_id} has no ratings." if cold_start is None else "No anime match the filters.")
+
+    stats = cache.stats()
+    st.sidebar.header("Result cache")
+    st.sidebar.metric("Hits", stats['hits'])
+    st.sidebar.metric("Misses", stats['misses'])
+    st.sidebar.metric("Evictions", stats['evictions'])
+    st.sidebar.caption(f"{stats['size']}/{stats['maxsize']} entries, {stats['expirations']} expired")
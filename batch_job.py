@@ -0,0 +1,202 @@
+# Import libraries for process management, hashing and command-line use
+import argparse
+import hashlib
+import multiprocessing
+import os
+import time
+from multiprocessing import shared_memory
+
+# Import numerical computation libraries
+import numpy as np
+
+# Import sparse matrix containers
+from scipy import sparse
+
+from data_loader import filter_ratings, load_animes, load_compact_ratings
+from rating_matrix import SparseRatingMatrix
+from recommendation_store import create_store, mark_complete, read_meta, write_recommendations
+
+PROGRESS_FILE = 'progress.npy'
+
+
+class SharedArrays:
+    # NumPy arrays copied once into multiprocessing.shared_memory blocks.
+    #
+    # The spec (block names, shapes, dtypes) is all a worker needs to map the
+    # same memory, so the rating matrix is never pickled per worker or per task.
+
+    def __init__(self, arrays):
+        self.blocks = []
+        self.spec = {}
+        for key, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            self.blocks.append(block)
+            self.spec[key] = (block.name, array.shape, array.dtype.str)
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+def attach_shared_arrays(spec):
+    # Map the arrays described by a SharedArrays spec; returns (arrays, blocks to keep alive)
+    arrays, blocks = {}, []
+    for key, (name, shape, dtype) in spec.items():
+        # Pool workers share the parent's resource tracker, so attaching does not
+        # hand ownership of the block to the worker; the parent unlinks it
+        block = shared_memory.SharedMemory(name=name)
+        blocks.append(block)
+        arrays[key] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    return arrays, blocks
+
+
+def share_matrix(matrix):
+    # Put the CSR arrays, the row norms and the id maps in shared memory
+    return SharedArrays({
+        'data': matrix.csr.data,
+        'norms': matrix.row_norms(),
+        'indices': matrix.csr.indices,
+        'indptr': matrix.csr.indptr,
+        'user_ids': matrix.user_ids,
+        'anime_ids': matrix.anime_ids,
+    })
+
+
+def matrix_from_shared(arrays):
+    # Rebuild a SparseRatingMatrix on top of shared buffers without copying them
+    shape = (len(arrays['user_ids']), len(arrays['anime_ids']))
+    matrix = SparseRatingMatrix.__new__(SparseRatingMatrix)
+    matrix.csr = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']), shape=shape, copy=False)
+    matrix.csr.has_sorted_indices = True
+    matrix.user_ids = arrays['user_ids']
+    matrix.anime_ids = arrays['anime_ids']
+    matrix.version = 0
+    matrix._norms = arrays['norms']
+    matrix.clear_caches()
+    return matrix
+
+
+_worker = {}
+
+
+def _init_worker(spec, path, k, items, block_size):
+    arrays, blocks = attach_shared_arrays(spec)
+    _worker.update(matrix=matrix_from_shared(arrays), blocks=blocks, path=path, k=k, items=items, block_size=block_size)
+
+
+def _run_chunk(task):
+    chunk, start, stop = task
+    write_recommendations(
+        _worker['path'], _worker['matrix'], np.arange(start, stop),
+        k=_worker['k'], items=_worker['items'], block_size=_worker['block_size'],
+    )
+
+    # Each chunk owns one byte of the progress file, so concurrent workers never collide
+    progress = np.load(os.path.join(_worker['path'], PROGRESS_FILE), mmap_mode='r+')
+    progress[chunk] = 1
+    progress.flush()
+    return chunk, stop - start
+
+
+def matrix_fingerprint(matrix):
+    # Digest of the ratings and ID maps, recorded in the store so a run is only resumed on the same data
+    digest = hashlib.blake2b(digest_size=16)
+    for array in (matrix.csr.indptr, matrix.csr.indices, matrix.csr.data, matrix.user_ids, matrix.anime_ids):
+        digest.update(np.ascontiguousarray(array).view(np.uint8))
+    return f"{matrix.nnz}-{digest.hexdigest()}"
+
+
+def _can_resume(matrix, path, k, items, chunk_size, fingerprint):
+    # An unfinished store for the same ratings and parameters; a finished one is always rewritten
+    meta = read_meta(path)
+    if meta is None or meta.get('complete') or not os.path.exists(os.path.join(path, PROGRESS_FILE)):
+        return False
+    if meta.get('fingerprint') != fingerprint:
+        return False
+    offsets = np.load(os.path.join(path, 'offsets.npy'), mmap_mode='r')
+    same_users = meta['n_users'] == matrix.shape[0] and np.array_equal(
+        np.nonzero(np.asarray(offsets) >= 0)[0], matrix.user_ids
+    )
+    return same_users and (meta['k'], meta['items'], meta.get('chunk_size')) == (k, items, chunk_size)
+
+
+def run_batch_job(matrix, path, k=5, items=10, anime_data=None, workers=None, chunk_size=4096, resume=True,
+                  block_size=512):
+    # Regenerate recommendations for every user across a process pool.
+
+    # Parameters:
+    # - matrix (SparseRatingMatrix): The rating matrix.
+    # - path (str): Output recommendation store (see recommendation_store.create_store).
+    # - k (int): Number of similar users per user.
+    # - items (int): Number of recommendations per user.
+    # - anime_data (pd.DataFrame, optional): Dataframe containing anime information.
+    # - workers (int, optional): Worker processes; defaults to the CPU count.
+    # - chunk_size (int): Users per task.
+    # - resume (bool): Skip chunks already finished by an interrupted run with the same ratings and parameters.
+    # - block_size (int): Users scored together inside a task; bounds each worker's peak memory.
+
+    # Returns:
+    # - int: Number of users processed in this run.
+
+    n_users = matrix.shape[0]
+    n_chunks = (n_users + chunk_size - 1) // chunk_size
+
+    fingerprint = matrix_fingerprint(matrix)
+    if not (resume and _can_resume(matrix, path, k, items, chunk_size, fingerprint)):
+        create_store(matrix, path, k=k, items=items, anime_data=anime_data,
+                     extra_meta={'chunk_size': chunk_size, 'fingerprint': fingerprint})
+        np.save(os.path.join(path, PROGRESS_FILE), np.zeros(n_chunks, dtype=np.uint8))
+
+    done = np.load(os.path.join(path, PROGRESS_FILE)).astype(bool)
+    tasks = [(c, c * chunk_size, min((c + 1) * chunk_size, n_users)) for c in range(n_chunks) if not done[c]]
+    if done.any():
+        print(f"Resuming: {int(done.sum())}/{n_chunks} chunks already done.")
+
+    processed = 0
+    shared = share_matrix(matrix)
+    try:
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(shared.spec, path, k, items, block_size)) as pool:
+            start = time.perf_counter()
+            for finished, (_, count) in enumerate(pool.imap_unordered(_run_chunk, tasks), start=1):
+                processed += count
+                elapsed = time.perf_counter() - start
+                print(f"{int(done.sum()) + finished}/{n_chunks} chunks, {processed / elapsed:,.0f} users/s", flush=True)
+    finally:
+        shared.close()
+
+    mark_complete(path)
+    return processed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Nightly recommendation job for every user in the rating matrix.")
+    parser.add_argument('--ratings', default='Datasets/rating.csv')
+    parser.add_argument('--anime', default='Datasets/anime.csv')
+    parser.add_argument('--out', default='recommendation_store')
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--items', type=int, default=10)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=4096, help="Users per task")
+    parser.add_argument('--block-size', type=int, default=512, help="Users scored together inside a task")
+    parser.add_argument('--no-resume', action='store_true')
+    parser.add_argument('--min-anime-ratings', type=int, default=1000, help="Keep anime with at least this many ratings")
+    parser.add_argument('--max-user-ratings', type=int, default=1000, help="Keep users with at most this many ratings")
+    args = parser.parse_args()
+
+    animes = load_animes(args.anime)
+    rating_matrix = SparseRatingMatrix.from_ratings(filter_ratings(
+        load_compact_ratings(args.ratings), args.min_anime_ratings, args.max_user_ratings
+    ))
+    processed = run_batch_job(
+        rating_matrix, args.out, k=args.k, items=args.items, anime_data=animes,
+        workers=args.workers, chunk_size=args.chunk_size, resume=not args.no_resume, block_size=args.block_size,
+    )
+    print(f"Wrote recommendations for {processed} users to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+# Import libraries for timing, memory measurement and command-line use
+import argparse
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+# Import numerical computation libraries
+import numpy as np
+import pandas as pd
+
+from anime_index import AnimeIndex
+from neighbors import all_similar_users
+from rating_matrix import SparseRatingMatrix
+from recommender import recommend_batch, recommend_item, recommend_movie, similar_users
+from serving import export_artifacts, measure_startup
+
+# Share of each rating value (1..10) among the explicit ratings in rating.csv
+RATING_DISTRIBUTION = np.array([
+    16649, 23150, 41453, 104291, 282806, 637775, 1375287, 1646019, 1254096, 955715,
+], dtype=np.float64)
+RATING_DISTRIBUTION /= RATING_DISTRIBUTION.sum()
+
+ANIME_TYPES = np.array(['TV', 'OVA', 'Movie', 'Special', 'ONA', 'Music'])
+ANIME_TYPE_SHARES = np.array([3787, 3311, 2348, 1676, 659, 488], dtype=np.float64)
+GENRES = np.array(['Action', 'Adventure', 'Comedy', 'Drama', 'Fantasy', 'Romance', 'Sci-Fi', 'School',
+                   'Shounen', 'Slice of Life', 'Supernatural', 'Mystery', 'Mecha', 'Sports', 'Music'])
+
+# Dense stages are skipped above this many matrix cells
+DENSE_CELL_LIMIT = 50_000_000
+
+
+def synthetic_ratings(n_users, n_anime, density, seed=0):
+    # Seeded synthetic ratings with heavy-tailed per-user and per-anime counts.
+
+    # User activity is log-normal and anime popularity follows a Zipf-like power law,
+    # mirroring rating.csv; rating values follow its 1..10 distribution.
+
+    # Parameters:
+    # - n_users, n_anime (int): Matrix dimensions.
+    # - density (float): Target fraction of (user, anime) cells that are rated.
+    # - seed (int): Random seed.
+
+    # Returns:
+    # - pd.DataFrame: Ratings (user_id, anime_id, rating) without duplicate pairs.
+    # - pd.DataFrame: Anime data (anime_id, name, genre, type, members).
+
+    rng = np.random.default_rng(seed)
+    n_ratings = int(n_users * n_anime * density)
+
+    activity = rng.lognormal(mean=0.0, sigma=1.2, size=n_users)
+    popularity = 1.0 / np.arange(1, n_anime + 1) ** 0.9
+    popularity = rng.permutation(popularity)
+
+    user_codes = rng.choice(n_users, size=n_ratings, p=activity / activity.sum())
+    anime_codes = rng.choice(n_anime, size=n_ratings, p=popularity / popularity.sum())
+    ratings = pd.DataFrame({
+        'user_id': (user_codes + 1).astype(np.int32),
+        'anime_id': (anime_codes + 1).astype(np.int32),
+        'rating': rng.choice(np.arange(1, 11, dtype=np.int8), size=n_ratings, p=RATING_DISTRIBUTION),
+    }).drop_duplicates(['user_id', 'anime_id'])
+
+    anime_ids = np.arange(1, n_anime + 1, dtype=np.int32)
+    genre_counts = rng.integers(1, 5, size=n_anime)
+    animes = pd.DataFrame({
+        'anime_id': anime_ids,
+        'name': [f'Anime {i}' for i in anime_ids],
+        'genre': [', '.join(rng.choice(GENRES, size=c, replace=False)) for c in genre_counts],
+        'type': rng.choice(ANIME_TYPES, size=n_anime, p=ANIME_TYPE_SHARES / ANIME_TYPE_SHARES.sum()),
+        'members': np.bincount(anime_codes, minlength=n_anime).astype(np.int32) * 10,
+    })
+    return ratings, animes
+
+
+def measure(stage, function, calls):
+    # Time a stage and record its peak traced allocation.
+
+    # Parameters:
+    # - stage (str): Stage name.
+    # - function (callable): f(i) running the i-th call of the stage.
+    # - calls (int): Number of timed calls.
+
+    # Returns:
+    # - dict: Latency percentiles (ms), throughput (calls/s) and peak traced MB.
+
+    # The process RSS high-water mark is not reported: it only ever grows over the
+    # run, so it would belong to whichever earlier stage peaked, not to this one.
+
+    latencies = np.empty(calls)
+    for i in range(calls):
+        start = time.perf_counter()
+        function(i)
+        latencies[i] = time.perf_counter() - start
+
+    # One extra, untimed call under tracemalloc for the stage's own peak allocation
+    tracemalloc.start()
+    function(0)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    p50, p95, p99 = np.percentile(latencies * 1000, [50, 95, 99])
+    return {
+        'stage': stage,
+        'calls': calls,
+        'p50_ms': p50,
+        'p95_ms': p95,
+        'p99_ms': p99,
+        'mean_ms': latencies.mean() * 1000,
+        'throughput_per_s': calls / latencies.sum() if latencies.sum() > 0 else float('inf'),
+        'peak_alloc_mb': peak / 2 ** 20,
+    }
+
+
+def measure_startup_stage(matrix, anime_index, runs):
+    # Cold start of the serving path (fresh interpreter, imports + load_models) on exported artifacts
+    with tempfile.TemporaryDirectory() as path:
+        artifacts = os.path.join(path, 'artifacts')
+        export_artifacts(matrix, artifacts, anime_index)
+        missing = os.path.join(path, 'missing')
+        startups = measure_startup(artifacts, missing, missing, runs=runs)
+    totals = np.array([run['total_s'] for run in startups]) * 1000
+
+    p50, p95, p99 = np.percentile(totals, [50, 95, 99])
+    return {
+        'stage': 'serving_startup',
+        'calls': runs,
+        'p50_ms': p50,
+        'p95_ms': p95,
+        'p99_ms': p99,
+        'mean_ms': totals.mean(),
+        'throughput_per_s': runs / totals.sum() * 1000,
+        'peak_alloc_mb': float('nan'),
+        # Measured in the fresh interpreters, so unlike in-process RSS it is this stage's own peak
+        'peak_rss_mb': max(run['rss_mb'] for run in startups),
+    }
+
+
+def run_config(n_users, n_anime, density, queries=50, repeats=3, seed=0):
+    # Benchmark every pipeline stage on one synthetic dataset
+    ratings, animes = synthetic_ratings(n_users, n_anime, density, seed)
+    matrix = SparseRatingMatrix.from_ratings(ratings)
+    rng = np.random.default_rng(seed)
+    query_users = rng.choice(matrix.user_ids, size=queries)
+    neighbors = [similar_users(u, matrix)[0] for u in query_users]
+
+    results = [
+        measure('sparse_build', lambda i: SparseRatingMatrix.from_ratings(ratings), repeats),
+        measure('similar_users_sparse', lambda i: similar_users(query_users[i], matrix), queries),
+        measure('similar_users_approximate', lambda i: similar_users(query_users[i], matrix, approximate=True), queries),
+        measure('recommend_item_sparse', lambda i: recommend_item(query_users[i], neighbors[i], matrix, anime_data=animes), queries),
+        measure('recommend_movie_sparse', lambda i: recommend_movie(query_users[i], neighbors[i], matrix, anime_data=animes), queries),
+    ]
+
+    results.append(measure_startup_stage(matrix, AnimeIndex.from_frame(animes), repeats))
+
+    block = query_users[:min(queries, 1024)]
+    batch = measure('all_similar_users_block', lambda i: all_similar_users(matrix, user_ids=block), repeats)
+    batch['users_per_s'] = len(block) * batch['throughput_per_s']
+    results.append(batch)
+
+    batch = measure('recommend_batch_block', lambda i: recommend_batch(block, matrix, anime_data=animes, names=True), repeats)
+    batch['users_per_s'] = len(block) * batch['throughput_per_s']
+    results.append(batch)
+
+    if matrix.shape[0] * matrix.shape[1] <= DENSE_CELL_LIMIT:
+        dense = None
+
+        def build_dense(i):
+            nonlocal dense
+            dense = ratings.pivot_table(index='user_id', columns='anime_id', values='rating').fillna(0)
+
+        results.append(measure('pivot_table', build_dense, repeats))
+        results.append(measure('similar_users_dense', lambda i: similar_users(query_users[i], dense), queries))
+        results.append(measure('recommend_item_dense', lambda i: recommend_item(query_users[i], neighbors[i], dense, anime_data=animes), queries))
+        results.append(measure('recommend_movie_dense', lambda i: recommend_movie(query_users[i], neighbors[i], dense, anime_data=animes), queries))
+
+    config = {'n_users': n_users, 'n_anime': n_anime, 'density': density, 'n_ratings': int(matrix.nnz)}
+    return [dict(config, **result) for result in results]
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline_path, current_path, threshold=1.2):
+    # Print p50 latency ratios between two result files and flag slowdowns above threshold
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    with open(current_path) as f:
+        current = json.load(f)
+
+    key = lambda r: (r['n_users'], r['n_anime'], r['density'], r['stage'])
+    before = {key(r): r for r in baseline['results']}
+    regressions = 0
+    for result in current['results']:
+        old = before.get(key(result))
+        if old is None or old['p50_ms'] == 0:
+            continue
+        ratio = result['p50_ms'] / old['p50_ms']
+        flag = '  REGRESSION' if ratio > threshold else ''
+        regressions += bool(flag)
+        print(f"{key(result)}: p50 {old['p50_ms']:.3f} -> {result['p50_ms']:.3f} ms ({ratio:.2f}x){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the recommendation pipeline on synthetic ratings.")
+    parser.add_argument('--users', type=int, nargs='+', default=[2000, 10000])
+    parser.add_argument('--anime', type=int, nargs='+', default=[500, 2000])
+    parser.add_argument('--density', type=float, nargs='+', default=[0.01, 0.05])
+    parser.add_argument('--queries', type=int, default=50)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='benchmark_results.json')
+    parser.add_argument('--compare', metavar='BASELINE', help="Compare --out against a previous results file")
+    args = parser.parse_args()
+
+    results = []
+    for n_users in args.users:
+        for n_anime in args.anime:
+            for density in args.density:
+                print(f"users={n_users} anime={n_anime} density={density}", flush=True)
+                for result in run_config(n_users, n_anime, density, args.queries, args.repeats, args.seed):
+                    print(f"  {result['stage']:<28} p50 {result['p50_ms']:9.3f} ms  p95 {result['p95_ms']:9.3f} ms"
+                          f"  {result['throughput_per_s']:10.1f}/s  peak {result['peak_alloc_mb']:8.1f} MB")
+                    results.append(result)
+
+    report = {
+        'commit': _git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'seed': args.seed,
+        'results': results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.out}")
+
+    if args.compare:
+        compare(args.compare, args.out)
+
+
+if __name__ == '__main__':
+    main()
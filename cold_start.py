@@ -0,0 +1,183 @@
+# Import numerical computation libraries
+import numpy as np
+import pandas as pd
+
+from anime_index import AnimeIndex
+
+COLD_START_PATH = 'cold_start.npz'
+
+# Users with fewer ratings than this are answered from the fallback ranking instead of their neighbors
+COLD_START_RATINGS = 3
+
+
+def weighted_ratings(ratings, members, prior_members=None):
+    # Bayesian-weighted rating (the IMDb formula) of every anime.
+
+    # The anime's average rating R, backed by v members, is shrunk towards the mean
+    # rating C of all anime as if prior_members (m) more members had rated it C:
+    # (v * R + m * C) / (v + m). Small anime with a few enthusiastic members no
+    # longer outrank widely watched ones.
+
+    # Parameters:
+    # - ratings (np.ndarray): Average rating per anime (NaN if unknown).
+    # - members (np.ndarray): Community members per anime.
+    # - prior_members (float, optional): m; defaults to the median member count of the rated anime.
+
+    # Returns:
+    # - np.ndarray: float64 weighted ratings, NaN where the rating is unknown.
+
+    ratings = np.asarray(ratings, dtype=np.float64)
+    members = np.maximum(np.asarray(members, dtype=np.float64), 0)
+    rated = np.isfinite(ratings)
+    if not rated.any():
+        return np.full(len(ratings), np.nan)
+    mean = ratings[rated].mean()
+    if prior_members is None:
+        prior_members = np.median(members[rated])
+    with np.errstate(invalid='ignore'):
+        return (members * ratings + prior_members * mean) / (members + prior_members)
+
+
+def _buckets(ranked, codes, n_codes):
+    # Group ranked positions by code, keeping the rank order inside each group (CSR-style ranked / offsets)
+    order = np.argsort(codes, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(codes, minlength=n_codes))]).astype(np.int32)
+    return ranked[order].astype(np.int32), offsets
+
+
+class ColdStartRanking:
+    # Precomputed fallback ranking for users without (enough) ratings.
+    #
+    # Anime are ranked once by Bayesian-weighted rating from anime.csv and kept as
+    # compact int32 arrays of index positions: the overall ranking plus one
+    # ranked bucket per type and per genre. A filtered top-N walks the smallest
+    # bucket that covers the filters and stops after N matches, so it does not
+    # score or sort anything per request.
+    #
+    # Attributes:
+    # - anime_index (AnimeIndex): Anime the positions refer to (names, types, genres).
+    # - scores (np.ndarray): float32 weighted rating per anime_index position (NaN if unrated).
+    # - ranked (np.ndarray): int32 positions of the rated anime, best first (ties by anime_id).
+    # - type_ranked, type_offsets (np.ndarray): Type t's ranking is type_ranked[type_offsets[t]:type_offsets[t + 1]].
+    # - genre_ranked, genre_offsets (np.ndarray): Same for genre g (an anime is in each of its genres).
+
+    def __init__(self, anime_index, scores, ranked, type_ranked, type_offsets, genre_ranked, genre_offsets):
+        self.anime_index = anime_index
+        self.scores = np.asarray(scores, dtype=np.float32)
+        self.ranked = np.asarray(ranked, dtype=np.int32)
+        self.type_ranked = np.asarray(type_ranked, dtype=np.int32)
+        self.type_offsets = np.asarray(type_offsets, dtype=np.int32)
+        self.genre_ranked = np.asarray(genre_ranked, dtype=np.int32)
+        self.genre_offsets = np.asarray(genre_offsets, dtype=np.int32)
+
+    @classmethod
+    def build(cls, anime_data, anime_index=None, prior_members=None):
+        # Rank the anime of an anime.csv DataFrame.
+
+        # Parameters:
+        # - anime_data (pd.DataFrame): Anime with anime_id, rating and members (plus name, type, genre).
+        # - anime_index (AnimeIndex, optional): Index built from the same data; built here if omitted.
+        # - prior_members (float, optional): Weight of the prior, see weighted_ratings.
+
+        # Returns:
+        # - ColdStartRanking: The ranking.
+
+        index = anime_index if anime_index is not None else AnimeIndex.from_frame(anime_data)
+        anime_data = anime_data.drop_duplicates('anime_id').set_index('anime_id')
+        ratings = anime_data['rating'].reindex(index.anime_ids).to_numpy(dtype=np.float64)
+        members = anime_data['members'].reindex(index.anime_ids).fillna(0).to_numpy(dtype=np.float64)
+        scores = weighted_ratings(ratings, members, prior_members)
+
+        rated = np.nonzero(np.isfinite(scores))[0]
+        ranked = rated[np.lexsort((index.anime_ids[rated], -scores[rated]))]
+
+        # Per-type buckets (anime without a type are only in the overall ranking)
+        codes = index.type_codes[ranked].astype(np.int64)
+        typed = codes >= 0
+        type_ranked, type_offsets = _buckets(ranked[typed], codes[typed], len(index.type_names))
+
+        # Per-genre buckets from the packed genre bits; np.nonzero walks rows in rank order
+        bits = np.unpackbits(index.genre_masks[ranked].view(np.uint8), axis=1, bitorder='little')
+        rows, genres = np.nonzero(bits[:, :len(index.genre_names)])
+        genre_ranked, genre_offsets = _buckets(ranked[rows], genres, len(index.genre_names))
+
+        return cls(index, scores, ranked, type_ranked, type_offsets, genre_ranked, genre_offsets)
+
+    def save(self, path):
+        # Persist the ranking arrays to an .npz file (the anime index is saved separately)
+        np.savez(
+            path,
+            anime_ids=self.anime_index.anime_ids,
+            scores=self.scores,
+            ranked=self.ranked,
+            type_ranked=self.type_ranked,
+            type_offsets=self.type_offsets,
+            genre_ranked=self.genre_ranked,
+            genre_offsets=self.genre_offsets,
+        )
+
+    @classmethod
+    def load(cls, path, anime_index):
+        # Load a ranking saved with save() and attach the AnimeIndex it was built from
+        with np.load(path) as data:
+            if not np.array_equal(data['anime_ids'], anime_index.anime_ids):
+                raise ValueError("Cold-start ranking was built for different anime data.")
+            return cls(
+                anime_index, data['scores'], data['ranked'], data['type_ranked'], data['type_offsets'],
+                data['genre_ranked'], data['genre_offsets'],
+            )
+
+    def _candidates(self, filters):
+        # Smallest ranked bucket that contains every anime passing the filters
+        candidates = self.ranked
+        index = self.anime_index
+        if filters.get('type'):
+            codes = [index.type_names.index(t) for t in filters['type'] if t in index.type_names]
+            if len(codes) == 0:
+                return candidates[:0]
+            if len(codes) == 1:
+                candidates = self.type_ranked[self.type_offsets[codes[0]]:self.type_offsets[codes[0] + 1]]
+        for genre in filters.get('genres_all') or ():
+            if genre in index.genre_names:
+                g = index.genre_names.index(genre)
+                bucket = self.genre_ranked[self.genre_offsets[g]:self.genre_offsets[g + 1]]
+                if len(bucket) < len(candidates):
+                    candidates = bucket
+        return candidates
+
+    def top(self, items=10, filters=None, exclude=None):
+        # Best-ranked anime passing the filters.
+
+        # Parameters:
+        # - items (int): Number of anime to return.
+        # - filters (dict, optional): Type / genre filters, see AnimeIndex.mask.
+        # - exclude (array-like, optional): Anime IDs to skip, e.g. the few a sparse user has rated.
+
+        # Returns:
+        # - np.ndarray: Up to `items` anime IDs, best first.
+        # - np.ndarray: Matching float32 weighted ratings.
+
+        candidates = self._candidates(filters) if filters else self.ranked
+        exclude = np.asarray(exclude if exclude is not None else [])
+        found = []
+        step = max(4 * items, 64)
+        for start in range(0, len(candidates), step):
+            chunk = candidates[start:start + step]
+            keep = self.anime_index.mask(filters, positions=chunk) if filters else np.ones(len(chunk), dtype=bool)
+            if len(exclude):
+                keep &= ~np.isin(self.anime_index.anime_ids[chunk], exclude)
+            found.extend(chunk[keep][:items - len(found)])
+            if len(found) >= items:
+                break
+
+        positions = np.asarray(found, dtype=np.int64)
+        return self.anime_index.anime_ids[positions], self.scores[positions]
+
+    def recommendations(self, items=10, filters=None, exclude=None):
+        # top() as a DataFrame with names, for users without enough ratings
+        anime_ids, scores = self.top(items, filters, exclude)
+        return pd.DataFrame({
+            'anime_id': anime_ids,
+            'name': self.anime_index.names_for(anime_ids),
+            'weighted_rating': scores,
+        })
@@ -0,0 +1,87 @@
+# Import numerical computation libraries
+import numpy as np
+import pandas as pd
+
+from anime_index import anime_index_for
+
+METRICS = ('jaccard', 'cosine')
+
+
+def popcount(words):
+    # Number of set bits per row of a (n, n_words) uint64 array
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int32)
+    # NumPy < 2.0: count bits byte by byte with a lookup table
+    table = np.array([bin(i).count('1') for i in range(256)], dtype=np.int32)
+    return table[np.ascontiguousarray(words).view(np.uint8)].reshape(*words.shape[:-1], -1).sum(axis=-1)
+
+
+def genre_similarities(anime_index, position, metric='jaccard'):
+    # Genre similarity of one anime to every anime in the index.
+
+    # Parameters:
+    # - anime_index (AnimeIndex): Index holding the packed genre bit vectors.
+    # - position (int): Position of the query anime in the index.
+    # - metric (str): 'jaccard' (|A & B| / |A | B|) or 'cosine' (|A & B| / sqrt(|A| |B|)).
+
+    # Returns:
+    # - np.ndarray: (n_anime,) float32 similarities; 0 for anime without genres.
+
+    if metric not in METRICS:
+        raise ValueError(f"metric must be one of {METRICS}")
+
+    masks = anime_index.genre_masks
+    query = masks[position]
+    shared = popcount(masks & query).astype(np.float32)
+
+    if metric == 'jaccard':
+        union = popcount(masks | query).astype(np.float32)
+    else:
+        union = np.sqrt(popcount(masks).astype(np.float32) * popcount(query[None, :])[0])
+    return np.divide(shared, union, out=np.zeros_like(shared), where=union > 0)
+
+
+def more_like_this(anime_id, anime_data, items=5, metric='jaccard', filters=None):
+    # Recommend anime with the most similar genres to a given anime.
+
+    # Works for every title in anime.csv, including those with too few ratings
+    # to appear in the rating matrix. Ties are broken by community size.
+
+    # Parameters:
+    # - anime_id (int): The query anime ID.
+    # - anime_data (pd.DataFrame or AnimeIndex): Anime information.
+    # - items (int): Number of anime to recommend.
+    # - metric (str): 'jaccard' or 'cosine'.
+    # - filters (dict, optional): Type / genre filters, see AnimeIndex.mask.
+
+    # Returns:
+    # - pd.DataFrame: Genre similarity, anime IDs and names of the recommendations.
+    # - list: List of top N recommended anime IDs.
+
+    anime_index = anime_index_for(anime_data)
+    positions, found = anime_index.positions(np.array([anime_id]))
+    if not found[0]:
+        print(f"Anime {anime_id} is not in the anime data.")
+        return pd.DataFrame(columns=['genre_similarity', 'anime_id', 'name']), []
+
+    position = positions[0]
+    similarities = genre_similarities(anime_index, position, metric)
+    candidates = similarities > 0
+    candidates[position] = False
+    if filters:
+        candidates &= anime_index.mask(filters)
+
+    candidates = np.nonzero(candidates)[0]
+    if len(candidates) > items:
+        # Keep everything tied with the N-th best score, then order by (similarity, members)
+        threshold = np.partition(similarities[candidates], -items)[-items]
+        candidates = candidates[similarities[candidates] >= threshold]
+    order = np.lexsort((-anime_index.members[candidates], -similarities[candidates]))[:items]
+    top = candidates[order]
+
+    recommendations = pd.DataFrame({
+        'genre_similarity': similarities[top],
+        'anime_id': anime_index.anime_ids[top],
+        'name': anime_index.names[top],
+    })
+    return recommendations, recommendations['anime_id'].tolist()
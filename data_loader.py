@@ -0,0 +1,186 @@
+# Import libraries for file handling and caching
+import hashlib
+import os
+
+# Import numerical computation libraries
+import numpy as np
+import pandas as pd
+
+from instrumentation import instrumented, span
+from rating_matrix import CompactRatings
+
+ANIME_PATH = os.path.join('Datasets', 'anime.csv')
+RATINGS_PATH = os.path.join('Datasets', 'rating.csv')
+CACHE_DIR = os.path.join('Datasets', 'cache')
+
+# Compact column types; strings are stored in the cache as int32 codes into a UTF-8 buffer of the distinct values
+ANIME_DTYPES = {
+    'anime_id': np.int32,
+    'name': str,
+    'genre': str,
+    'type': str,
+    'episodes': str,
+    'rating': np.float32,
+    'members': np.int32,
+}
+RATING_DTYPES = {'user_id': np.int32, 'anime_id': np.int32, 'rating': np.int8}
+
+
+def _source_stamp(path):
+    # Size and modification time of a source file, used to invalidate its cache
+    stat = os.stat(path)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def _pack_strings(values):
+    # Dictionary-encode strings: int32 codes, the distinct values as one UTF-8 buffer and their character offsets
+    codes, uniques = pd.factorize(values)
+    offsets = np.zeros(len(uniques) + 1, dtype=np.int64)
+    np.cumsum([len(value) for value in uniques], out=offsets[1:])
+    return codes.astype(np.int32), np.frombuffer(''.join(uniques).encode('utf-8'), dtype=np.uint8), offsets
+
+
+def _unpack_strings(codes, buffer, offsets):
+    # Inverse of _pack_strings, as an object array; only the distinct values are decoded and sliced
+    text = buffer.tobytes().decode('utf-8')
+    uniques = np.empty(len(offsets) - 1, dtype=object)
+    uniques[:] = [text[start:end] for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist())]
+    return uniques[codes]
+
+
+def _cache_key(dtypes, keep_id):
+    # Everything besides the source file that decides the cached contents: column types and row filter
+    columns = ','.join(f"{name}:{'str' if dtype is str else np.dtype(dtype).str}" for name, dtype in dtypes.items())
+    return f"{columns}|keep={keep_id}"
+
+
+def _cache_keys(name, dtype):
+    # Arrays holding one column in the .npz cache
+    return (name + '_codes', name + '_utf8', name + '_offsets') if dtype is str else (name,)
+
+
+def _read_columns(path, dtypes, chunksize, keep=None):
+    # Stream a CSV in chunks into one compact NumPy array per column (object arrays for strings)
+    columns = {name: [] for name in dtypes}
+    for chunk in pd.read_csv(path, dtype=dtypes, chunksize=chunksize):
+        if keep is not None:
+            chunk = chunk[keep(chunk)]
+        for name, dtype in dtypes.items():
+            if dtype is str:
+                columns[name].append(chunk[name].fillna('').to_numpy(dtype=object))
+            else:
+                columns[name].append(chunk[name].to_numpy(dtype=dtype))
+    return {
+        name: np.concatenate(parts) if parts else np.empty(0, dtype=object if dtypes[name] is str else dtypes[name])
+        for name, parts in columns.items()
+    }
+
+
+def _to_frame(columns, dtypes):
+    # Build the DataFrame from cached or freshly parsed columns (empty strings become NaN)
+    frame = pd.DataFrame({name: columns[name] for name in dtypes})
+    for name, dtype in dtypes.items():
+        if dtype is str:
+            frame[name] = frame[name].astype(object).replace('', np.nan)
+    return frame
+
+
+def load_csv_cached(path, dtypes, cache_dir=CACHE_DIR, chunksize=1_000_000, keep=None, keep_id=None,
+                    use_cache=True):
+    # Load a CSV through a binary columnar (.npz) cache.
+    # Numeric columns are stored as typed arrays and string columns as a UTF-8 buffer plus offsets,
+    # so the cache stays about as small as the CSV and loads without parsing it.
+    # The cache is keyed by the source file's size and mtime, the dtypes and keep_id; each
+    # dtypes / keep_id combination gets its own cache file.
+
+    # Parameters:
+    # - path (str): Source CSV file.
+    # - dtypes (dict): Column name -> NumPy dtype (or str) to parse with.
+    # - cache_dir (str): Directory holding the .npz caches.
+    # - chunksize (int): Rows parsed per chunk on a cache miss.
+    # - keep (callable, optional): chunk -> boolean mask of rows to keep while streaming.
+    # - keep_id (str, optional): Name identifying the keep filter in the cache key; without it
+    #   a keep filter cannot be told apart from another, so the result is not cached.
+    # - use_cache (bool): Set to False to always re-parse the CSV.
+
+    # Returns:
+    # - pd.DataFrame: The parsed data with the requested column types.
+
+    use_cache = use_cache and (keep is None or keep_id is not None)
+    cache_key = _cache_key(dtypes, keep_id)
+    digest = hashlib.blake2b(cache_key.encode('utf-8'), digest_size=6).hexdigest()
+    cache_path = os.path.join(cache_dir, f"{os.path.splitext(os.path.basename(path))[0]}-{digest}.npz")
+    stamp = _source_stamp(path)
+
+    if use_cache and os.path.exists(cache_path):
+        with span('load_cache', path=path), np.load(cache_path) as cached:
+            keys = [key for name, dtype in dtypes.items() for key in _cache_keys(name, dtype)]
+            if (np.array_equal(cached['_source'], stamp) and '_key' in cached and cached['_key'].item() == cache_key
+                    and all(key in cached for key in keys)):
+                return _to_frame({
+                    name: _unpack_strings(*(cached[key] for key in _cache_keys(name, dtype)))
+                    if dtype is str else cached[name]
+                    for name, dtype in dtypes.items()
+                }, dtypes)
+
+    with span('load_csv', path=path):
+        columns = _read_columns(path, dtypes, chunksize, keep)
+
+    if use_cache:
+        os.makedirs(cache_dir, exist_ok=True)
+        arrays = {}
+        for name, dtype in dtypes.items():
+            values = _pack_strings(columns[name]) if dtype is str else (columns[name],)
+            arrays.update(zip(_cache_keys(name, dtype), values))
+        np.savez(cache_path, _source=stamp, _key=np.array(cache_key), **arrays)
+
+    return _to_frame(columns, dtypes)
+
+
+def load_animes(path=ANIME_PATH, cache_dir=CACHE_DIR, use_cache=True):
+    # Load anime.csv from the local Datasets/ folder with compact column types
+    return load_csv_cached(path, ANIME_DTYPES, cache_dir=cache_dir, use_cache=use_cache)
+
+
+def load_ratings(path=RATINGS_PATH, cache_dir=CACHE_DIR, chunksize=1_000_000, use_cache=True):
+    # Load rating.csv in chunks (int32 ids, int8 ratings), dropping rating == -1 while streaming
+    return load_csv_cached(
+        path,
+        RATING_DTYPES,
+        cache_dir=cache_dir,
+        chunksize=chunksize,
+        keep=lambda chunk: chunk['rating'] != -1,
+        keep_id='rating!=-1',
+        use_cache=use_cache,
+    )
+
+
+def iter_ratings(path=RATINGS_PATH, chunksize=1_000_000):
+    # Stream rating.csv as typed DataFrame chunks (rating == -1 dropped) without holding the whole file
+    for chunk in pd.read_csv(path, dtype=RATING_DTYPES, chunksize=chunksize):
+        yield chunk[chunk['rating'] != -1]
+
+
+def load_compact_ratings(path=RATINGS_PATH, cache_dir=CACHE_DIR, chunksize=1_000_000, use_cache=True):
+    # load_ratings() encoded as CompactRatings (int32 codes over sorted ID maps, int8 values)
+    return CompactRatings.from_frame(load_ratings(path, cache_dir=cache_dir, chunksize=chunksize, use_cache=use_cache))
+
+
+@instrumented()
+def filter_ratings(ratings, min_anime_ratings=1000, max_user_ratings=1000):
+    # Keep ratings of popular anime (>= min_anime_ratings ratings) by users with <= max_user_ratings ratings.
+
+    # Parameters:
+    # - ratings (CompactRatings or pd.DataFrame): All ratings, e.g. load_compact_ratings() or load_ratings().
+    # - min_anime_ratings (int): Popularity threshold for anime.
+    # - max_user_ratings (int): Activity cap for users.
+
+    # Returns:
+    # - CompactRatings or pd.DataFrame (same type as ratings): The filtered ratings.
+
+    # Counts come from one np.bincount per side over the integer codes. For CompactRatings the
+    # counts and the mask for each threshold pair are cached, so trying other cutoffs does not
+    # re-scan the ratings; a DataFrame can change in place, so it is encoded again on every call.
+    if isinstance(ratings, CompactRatings):
+        return ratings.filtered(min_anime_ratings, max_user_ratings)
+    return ratings[CompactRatings.from_frame(ratings).filter_mask(min_anime_ratings, max_user_ratings)]
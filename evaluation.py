@@ -0,0 +1,248 @@
+# Import libraries for timing and command-line use
+import argparse
+import time
+
+# Import numerical computation libraries
+import numpy as np
+import pandas as pd
+
+# Import sparse matrix containers
+from scipy import sparse
+
+from als import ALSModel
+from ann_index import LSHIndex
+from item_based import ItemSimilarityModel
+from neighbors import neighbor_positions, top_k_rows
+from rating_matrix import SparseRatingMatrix
+from recommender import neighbor_mean_scores, similar_users
+
+
+def holdout_split(ratings, test_fraction=0.2, min_ratings=5, seed=0):
+    # Per-user random holdout of a long-format ratings DataFrame.
+
+    # Parameters:
+    # - ratings (pd.DataFrame): One row per (user_id, anime_id, rating), e.g. filtered_ratings.
+    # - test_fraction (float): Share of each user's ratings moved to the test set (rounded down).
+    # - min_ratings (int): Users with fewer ratings keep all of them in the training set.
+    # - seed (int): Random seed.
+
+    # Returns:
+    # - pd.DataFrame: Training ratings.
+    # - pd.DataFrame: Held-out test ratings.
+
+    rng = np.random.default_rng(seed)
+    _, user_codes, counts = np.unique(ratings['user_id'].to_numpy(), return_inverse=True, return_counts=True)
+
+    # Rank every rating within its user in a random order, then hold out the first n_test of each user
+    order = np.lexsort((rng.random(len(user_codes)), user_codes))
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = np.arange(len(order)) - starts[user_codes[order]]
+
+    n_test = np.where(counts >= min_ratings, np.floor(counts * test_fraction), 0).astype(np.int64)
+    test = ranks < n_test[user_codes]
+    return ratings[~test], ratings[test]
+
+
+def neighborhood_engine(k=5):
+    # Exact user-based CF (recommend_item's mean of the k most similar users), batched
+    def fit(train):
+        def recommend(rows, items):
+            neighbors, _ = neighbor_positions(train, rows, k=k, block_size=len(rows))
+            scores = neighbor_mean_scores(train, rows, neighbors)
+            return _top_positions(scores, items)
+        return recommend
+    return fit
+
+
+def approximate_engine(k=5, **index_params):
+    # User-based CF with neighbors from an LSHIndex (similar_users(..., approximate=True))
+    def fit(train):
+        index = LSHIndex.build(train, **index_params)
+
+        def recommend(rows, items):
+            neighbors = np.full((len(rows), k), -1, dtype=np.int64)
+            for i, row in enumerate(rows):
+                found, _ = index.query(row, k=k)
+                neighbors[i, :len(found)] = found
+            return _top_positions(neighbor_mean_scores(train, rows, neighbors), items)
+        return recommend
+    return fit
+
+
+def als_engine(**fit_params):
+    # Factorized recommendations from an ALSModel trained on the training ratings
+    def fit(train):
+        model = ALSModel.fit(train, **fit_params)
+        return lambda rows, items: model.recommend(train, rows, items=items)[0]
+    return fit
+
+
+def item_based_engine(k=50):
+    # Item-based CF from an ItemSimilarityModel, scored for a block of users at once
+    def fit(train):
+        model = ItemSimilarityModel.build(train, k=k)
+
+        def recommend(rows, items):
+            user_rows = train.csr[rows]
+            rated = user_rows.copy()
+            rated.data = np.ones_like(rated.data)
+            numerator = np.asarray((user_rows @ model.similarities).todense(), dtype=np.float32)
+            normalizer = np.asarray((rated @ model.similarities).todense(), dtype=np.float32)
+            scores = np.divide(numerator, normalizer, out=np.zeros_like(numerator), where=normalizer > 0)
+            scores[np.repeat(np.arange(len(rows)), np.diff(user_rows.indptr)), user_rows.indices] = -np.inf
+            return _top_positions(scores, items)
+        return recommend
+    return fit
+
+
+def recommend_item_engine(function, k=5, **similar_params):
+    # Adapter for any function with the recommend_item interface, called once per user
+
+    # function(user_index, similar_user_indices, matrix, items=...) must return (recommendations, top_n_anime_ids);
+    # neighbors come from similar_users(user_id, matrix, k, **similar_params).
+    def fit(train):
+        def recommend(rows, items):
+            positions = np.full((len(rows), items), -1, dtype=np.int64)
+            for i, row in enumerate(rows):
+                user_id = train.user_ids[row]
+                similar_user_indices, _ = similar_users(user_id, train, k=k, **similar_params)
+                _, anime_ids = function(user_id, similar_user_indices, train, items=items)
+                found = train.anime_positions(anime_ids[:items])
+                positions[i, :len(found)] = found
+            return positions
+        return recommend
+    return fit
+
+
+def _top_positions(scores, items):
+    # (b, items) top column positions of a score block, -1 where scores are not finite
+    width = min(items, scores.shape[1])
+    top = top_k_rows(scores, width)
+    valid = np.isfinite(np.take_along_axis(scores, top, axis=1))
+    positions = np.full((len(scores), items), -1, dtype=np.int64)
+    positions[:, :width] = np.where(valid, top, -1)
+    return positions
+
+
+def ranking_metrics(positions, relevant, n_relevant):
+    # Per-user precision@N, recall@N and NDCG@N from recommended and relevant positions.
+
+    # Parameters:
+    # - positions (np.ndarray): (b, N) recommended anime column positions, -1 for padding.
+    # - relevant (scipy.sparse.csr_matrix): (b, n_anime) boolean matrix of held-out relevant anime.
+    # - n_relevant (np.ndarray): (b,) relevant held-out items per user (including anime missing from training).
+
+    # Returns:
+    # - np.ndarray: (b,) precision, recall and NDCG for each user.
+
+    n_items = positions.shape[1]
+    rows = np.repeat(np.arange(len(positions)), n_items)
+    cols = np.maximum(positions.ravel(), 0)
+    hits = (np.asarray(relevant[rows, cols]).reshape(positions.shape) != 0) & (positions >= 0)
+
+    discounts = 1.0 / np.log2(np.arange(n_items) + 2)
+    ideal = np.concatenate([[0.0], np.cumsum(discounts)])[np.minimum(n_relevant, n_items)]
+    dcg = hits @ discounts
+
+    precision = hits.sum(axis=1) / n_items
+    recall = hits.sum(axis=1) / np.maximum(n_relevant, 1)
+    ndcg = np.divide(dcg, ideal, out=np.zeros_like(dcg), where=ideal > 0)
+    return precision, recall, ndcg
+
+
+def evaluate(ratings, engines, items=10, test_fraction=0.2, min_ratings=5, relevant_rating=None,
+             block_size=1024, max_users=None, seed=0):
+    # Compare recommenders on the same per-user holdout split.
+
+    # Parameters:
+    # - ratings (pd.DataFrame): Ratings to split, e.g. filtered_ratings.
+    # - engines (dict): Name -> engine, where engine(train_matrix) returns recommend(rows, items) giving
+    #   (len(rows), items) anime column positions (see neighborhood_engine, recommend_item_engine, ...).
+    # - items (int): Recommendations per user (N in the @N metrics).
+    # - test_fraction, min_ratings (float, int): Holdout split parameters, see holdout_split.
+    # - relevant_rating (float, optional): Held-out ratings below this are not relevant; by default all are.
+    # - block_size (int): Users recommended per call.
+    # - max_users (int, optional): Evaluate a random sample of this many test users.
+    # - seed (int): Random seed for the split and the user sample.
+
+    # Returns:
+    # - pd.DataFrame: One row per engine with precision@N, recall@N, ndcg@N, coverage and timings.
+
+    train_ratings, test_ratings = holdout_split(ratings, test_fraction, min_ratings, seed)
+    if relevant_rating is not None:
+        test_ratings = test_ratings[test_ratings['rating'] >= relevant_rating]
+    train = SparseRatingMatrix.from_ratings(train_ratings)
+
+    # Relevant held-out anime per test user, as a sparse (test users x train anime) mask
+    test_rows, found = train.lookup_users(test_ratings['user_id'].to_numpy())
+    test_rows = test_rows[found]
+    users = np.unique(test_rows)
+    if max_users is not None and len(users) > max_users:
+        users = np.sort(np.random.default_rng(seed).choice(users, max_users, replace=False))
+    n_relevant = np.bincount(test_rows, minlength=train.shape[0])[users]
+
+    anime_cols, in_train = train.lookup_anime(test_ratings['anime_id'].to_numpy()[found])
+    relevant = sparse.csr_matrix(
+        (np.ones(in_train.sum(), dtype=bool), (test_rows[in_train], anime_cols[in_train])), shape=train.shape
+    )[users]
+
+    results = []
+    for name, engine in engines.items():
+        start = time.perf_counter()
+        recommend = engine(train)
+        fit_seconds = time.perf_counter() - start
+
+        metrics = []
+        recommended = np.zeros(train.shape[1], dtype=bool)
+        start = time.perf_counter()
+        for begin in range(0, len(users), block_size):
+            positions = recommend(users[begin:begin + block_size], items)
+            recommended[positions[positions >= 0]] = True
+            metrics.append(ranking_metrics(
+                positions, relevant[begin:begin + block_size], n_relevant[begin:begin + block_size]
+            ))
+        seconds = time.perf_counter() - start
+
+        precision, recall, ndcg = (np.concatenate(values) for values in zip(*metrics))
+        results.append({
+            'engine': name,
+            f'precision@{items}': precision.mean(),
+            f'recall@{items}': recall.mean(),
+            f'ndcg@{items}': ndcg.mean(),
+            'coverage': recommended.mean(),
+            'users': len(users),
+            'fit_seconds': fit_seconds,
+            'seconds': seconds,
+            'users_per_s': len(users) / seconds if seconds > 0 else float('inf'),
+        })
+    return pd.DataFrame(results).set_index('engine')
+
+
+def main():
+    from data_loader import filter_ratings, load_ratings
+
+    parser = argparse.ArgumentParser(description="Offline ranking evaluation of the recommendation engines.")
+    parser.add_argument('--items', type=int, default=10)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--test-fraction', type=float, default=0.2)
+    parser.add_argument('--relevant-rating', type=float, default=None)
+    parser.add_argument('--max-users', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    engines = {
+        'exact': neighborhood_engine(k=args.k),
+        'approximate': approximate_engine(k=args.k),
+        'als': als_engine(),
+        'item_based': item_based_engine(),
+    }
+    results = evaluate(
+        filter_ratings(load_ratings()), engines, items=args.items, test_fraction=args.test_fraction,
+        relevant_rating=args.relevant_rating, max_users=args.max_users, seed=args.seed,
+    )
+    print(results.to_string(float_format=lambda value: f'{value:.4f}'))
+
+
+if __name__ == '__main__':
+    main()
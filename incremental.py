@@ -0,0 +1,166 @@
+# Import numerical computation libraries
+import numpy as np
+import pandas as pd
+
+from neighbors import neighbor_positions, top_k_rows
+from rating_matrix import SparseRatingMatrix
+
+PAIR = ['user_id', 'anime_id']
+
+
+def _pair_keys(ratings):
+    # One int64 key per (user_id, anime_id) pair; both IDs are non-negative and below 2**32
+    return (ratings['user_id'].to_numpy(np.int64) << 32) | ratings['anime_id'].to_numpy(np.int64)
+
+
+class IncrementalRecommender:
+    # Rating matrix and neighbor lists kept up to date as new ratings arrive.
+    #
+    # Applies the notebook's filters (anime with >= min_anime_ratings ratings,
+    # users with <= max_user_ratings ratings) incrementally: ratings of anime
+    # below the popularity threshold are held back and backfilled into the
+    # matrix once the anime crosses it, and users who exceed the activity cap
+    # are dropped. A new rating for an already rated (user, anime) pair
+    # replaces the old one and is not counted again, so the state after
+    # add_ratings matches a fresh build from all ratings.
+    #
+    # Attributes:
+    # - matrix (SparseRatingMatrix): The filtered rating matrix, updated in place.
+    # - neighbor_ids (np.ndarray): (n_users, k) cached similar user IDs, aligned with matrix.user_ids.
+    # - neighbor_similarities (np.ndarray): (n_users, k) matching cosine similarities.
+    # - rated_pairs (np.ndarray): Sorted int64 keys of every (user, anime) pair counted so far.
+
+    def __init__(self, ratings, k=5, min_anime_ratings=1000, max_user_ratings=1000, block_size=512):
+        # Parameters:
+        # - ratings (pd.DataFrame): All ratings (user_id, anime_id, rating) before filtering.
+        # - k (int): Number of similar users cached per user.
+        # - min_anime_ratings (int): Popularity threshold for anime.
+        # - max_user_ratings (int): Activity cap for users.
+        # - block_size (int): Users scored per block when recomputing neighbors.
+
+        self.k = k
+        self.min_anime_ratings = min_anime_ratings
+        self.max_user_ratings = max_user_ratings
+        self.block_size = block_size
+
+        ratings = ratings.loc[ratings['rating'] != -1, ['user_id', 'anime_id', 'rating']]
+        ratings = ratings.drop_duplicates(PAIR, keep='last')
+        self.rated_pairs = np.sort(_pair_keys(ratings))
+        self.anime_counts = ratings['anime_id'].value_counts()
+        self.user_counts = ratings['user_id'].value_counts()
+
+        popular = ratings['anime_id'].isin(self._popular_anime())
+        eligible = ratings['user_id'].isin(self._eligible_users())
+        self.held = ratings[~popular]
+        self.matrix = SparseRatingMatrix.from_ratings(ratings[popular & eligible])
+
+        positions, similarities = neighbor_positions(self.matrix, np.arange(self.matrix.shape[0]), k, block_size)
+        self.neighbor_ids = self._to_ids(positions)
+        self.neighbor_similarities = similarities
+
+    def _popular_anime(self):
+        return self.anime_counts.index[self.anime_counts >= self.min_anime_ratings]
+
+    def _eligible_users(self):
+        return self.user_counts.index[self.user_counts <= self.max_user_ratings]
+
+    def _to_ids(self, positions):
+        return np.where(positions >= 0, self.matrix.user_ids[positions], -1)
+
+    def neighbors(self, user_id):
+        # Cached similar users of a user, as (user IDs, similarities); empty if unknown
+        position = self.matrix.user_position(user_id)
+        if position is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        valid = self.neighbor_ids[position] >= 0
+        return self.neighbor_ids[position][valid], self.neighbor_similarities[position][valid]
+
+    def add_ratings(self, batch):
+        # Apply a batch of new ratings to the matrix, norms and cached neighbor lists.
+
+        # Only pairs not rated before add to the popularity / activity counts. The
+        # matrix update itself (SparseRatingMatrix.upsert) rebuilds the CSR arrays,
+        # so each call costs O(nnz) on top of the neighbor updates; apply ratings in
+        # batches rather than one at a time.
+
+        # Parameters:
+        # - batch (pd.DataFrame): New ratings with user_id, anime_id and rating columns.
+
+        # Returns:
+        # - np.ndarray: IDs of the users whose neighbor lists were recomputed or merged.
+
+        batch = batch.loc[batch['rating'] != -1, ['user_id', 'anime_id', 'rating']]
+        batch = batch.drop_duplicates(PAIR, keep='last')
+        was_popular = set(self._popular_anime())
+        was_present = self.matrix.user_ids.copy()
+
+        # Re-ratings replace the old value but do not count as another rating
+        keys = _pair_keys(batch)
+        new = ~np.isin(keys, self.rated_pairs)
+        self.rated_pairs = np.union1d(self.rated_pairs, keys[new])
+        fresh = batch[new]
+        self.anime_counts = self.anime_counts.add(fresh['anime_id'].value_counts(), fill_value=0).astype(np.int64)
+        self.user_counts = self.user_counts.add(fresh['user_id'].value_counts(), fill_value=0).astype(np.int64)
+        popular = self._popular_anime()
+        eligible = self._eligible_users()
+
+        # Anime that just crossed the popularity threshold bring their held-back ratings along
+        newly_popular = np.setdiff1d(popular, list(was_popular))
+        backfill = self.held['anime_id'].isin(newly_popular)
+        incoming = pd.concat([self.held[backfill], batch])
+        self.held = pd.concat([self.held[~backfill], batch[~batch['anime_id'].isin(popular)]])
+        self.held = self.held.drop_duplicates(PAIR, keep='last')
+
+        incoming = incoming[incoming['anime_id'].isin(popular) & incoming['user_id'].isin(eligible)]
+        removed = was_present[~np.isin(was_present, eligible)]
+
+        self.matrix.drop_users(removed)
+        changed_rows = self.matrix.upsert(incoming['user_id'], incoming['anime_id'], incoming['rating'])
+        changed_ids = self.matrix.user_ids[changed_rows]
+
+        return self._update_neighbors(was_present, changed_ids, removed)
+
+    def _update_neighbors(self, old_user_ids, changed_ids, removed_ids):
+        # Bring the cached neighbor lists in line with the updated matrix
+        matrix = self.matrix
+        n_users = matrix.shape[0]
+
+        # Re-align the cache with the (possibly grown or shrunk) user order
+        ids = np.full((n_users, self.k), -1, dtype=np.int64)
+        similarities = np.full((n_users, self.k), np.nan, dtype=np.float32)
+        positions, found = matrix.lookup_users(old_user_ids)
+        ids[positions[found]] = self.neighbor_ids[found]
+        similarities[positions[found]] = self.neighbor_similarities[found]
+        present = np.zeros(n_users, dtype=bool)
+        present[positions[found]] = True
+
+        # Exact recompute for changed / new users and for lists that referenced a changed or removed user
+        stale = ~present | np.isin(matrix.user_ids, changed_ids)
+        stale |= np.isin(ids, changed_ids).any(axis=1) | np.isin(ids, removed_ids).any(axis=1)
+        stale_rows = np.nonzero(stale)[0]
+        stale_positions, stale_similarities = neighbor_positions(matrix, stale_rows, self.k, self.block_size)
+        ids[stale_rows] = self._to_ids(stale_positions)
+        similarities[stale_rows] = stale_similarities
+
+        # Every other list only needs the changed users merged in as new candidates
+        merge_rows = np.nonzero(~stale)[0]
+        changed_rows = matrix.user_positions(changed_ids)
+        normalized = matrix.normalized()
+        for start in range(0, len(changed_rows), self.block_size):
+            block = changed_rows[start:start + self.block_size]
+            if len(merge_rows) == 0:
+                break
+            scores = np.asarray(normalized[merge_rows] @ normalized[block].T.toarray(), dtype=np.float32)
+
+            candidate_ids = np.concatenate([ids[merge_rows], np.broadcast_to(matrix.user_ids[block], scores.shape)], axis=1)
+            candidate_scores = np.concatenate([similarities[merge_rows], scores], axis=1)
+            candidate_scores[np.isnan(candidate_scores) | (candidate_ids < 0)] = -np.inf
+            top = top_k_rows(candidate_scores, self.k)
+
+            top_scores = np.take_along_axis(candidate_scores, top, axis=1)
+            ids[merge_rows] = np.where(np.isfinite(top_scores), np.take_along_axis(candidate_ids, top, axis=1), -1)
+            similarities[merge_rows] = np.where(np.isfinite(top_scores), top_scores, np.nan)
+
+        self.neighbor_ids = ids
+        self.neighbor_similarities = similarities
+        return np.union1d(matrix.user_ids[stale_rows], matrix.user_ids[merge_rows] if len(changed_rows) else [])
@@ -0,0 +1,255 @@
+# Import libraries for timing, logging, profiling and thread safety
+import argparse
+import bisect
+import cProfile
+import contextlib
+import functools
+import io
+import json
+import logging
+import pstats
+import threading
+import time
+import tracemalloc
+
+# Import numerical computation libraries
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class LogSink:
+    # Writes one log line per finished span
+    def __init__(self, log=logger, level=logging.INFO):
+        self.log = log
+        self.level = level
+
+    def __call__(self, record):
+        memory = f" peak={record['peak_mb']:.1f}MB" if 'peak_mb' in record else ''
+        tags = ''.join(f" {key}={value}" for key, value in record['tags'].items())
+        self.log.log(self.level, "span %s %.3fms%s%s", record['name'], record['ms'], memory, tags)
+
+
+class JSONLinesSink:
+    # Appends one JSON object per finished span to a file
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        line = json.dumps(record, default=str)
+        with self._lock, open(self.path, 'a') as f:
+            f.write(line + '\n')
+
+
+class HistogramSink:
+    # In-process latency histogram per span name with fixed log-spaced buckets.
+    #
+    # Recording is a bisect and an increment, so it can stay on in production;
+    # summary() reports approximate percentiles from the bucket upper bounds.
+
+    def __init__(self, bounds_ms=None):
+        self.bounds_ms = list(bounds_ms if bounds_ms is not None else np.geomspace(0.01, 100_000, 57))
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        bucket = bisect.bisect_left(self.bounds_ms, record['ms'])
+        with self._lock:
+            stats = self._stats.get(record['name'])
+            if stats is None:
+                stats = self._stats[record['name']] = {
+                    'counts': [0] * (len(self.bounds_ms) + 1), 'total_ms': 0.0, 'max_ms': 0.0, 'peak_mb': 0.0,
+                }
+            stats['counts'][bucket] += 1
+            stats['total_ms'] += record['ms']
+            stats['max_ms'] = max(stats['max_ms'], record['ms'])
+            stats['peak_mb'] = max(stats['peak_mb'], record.get('peak_mb', 0.0))
+
+    def summary(self, quantiles=(0.5, 0.95, 0.99)):
+        # Per-span count, mean, max and approximate percentiles (bucket upper bounds), in ms
+        upper = np.append(self.bounds_ms, np.inf)
+        with self._lock:
+            result = {}
+            for name, stats in self._stats.items():
+                cumulative = np.cumsum(stats['counts'])
+                count = int(cumulative[-1])
+                entry = {'count': count, 'mean_ms': stats['total_ms'] / count, 'max_ms': stats['max_ms']}
+                for q in quantiles:
+                    bound = upper[np.searchsorted(cumulative, q * count)]
+                    entry[f'p{round(q * 100)}_ms'] = min(float(bound), stats['max_ms'])
+                if stats['peak_mb']:
+                    entry['peak_mb'] = stats['peak_mb']
+                result[name] = entry
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+_sinks = []
+_track_memory = False
+_local = threading.local()
+
+
+def configure(sinks=(), track_memory=False):
+    # Replace the active sinks; spans cost almost nothing while no sink is configured.
+
+    # Parameters:
+    # - sinks (iterable): Callables receiving one record dict per finished span
+    #   (LogSink, JSONLinesSink, HistogramSink or any function).
+    # - track_memory (bool): Also record the tracemalloc peak of each span (starts tracemalloc).
+
+    global _track_memory
+    _sinks[:] = list(sinks)
+    _track_memory = track_memory
+    if track_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def add_sink(sink):
+    _sinks.append(sink)
+    return sink
+
+
+def remove_sink(sink):
+    if sink in _sinks:
+        _sinks.remove(sink)
+
+
+class _Span:
+    __slots__ = ('name', 'tags', 'parent', 'start', 'memory_start', 'child_peak')
+
+    def __init__(self, name, tags):
+        self.name = name
+        self.tags = tags
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        self.parent = stack[-1] if stack else None
+        stack.append(self)
+
+        if _track_memory and tracemalloc.is_tracing():
+            # Hand the peak reached so far to the enclosing span before resetting it for this one
+            current, peak = tracemalloc.get_traced_memory()
+            if self.parent is not None and self.parent.memory_start is not None:
+                self.parent.child_peak = max(self.parent.child_peak, peak)
+            tracemalloc.reset_peak()
+            self.memory_start = current
+            self.child_peak = current
+        else:
+            self.memory_start = None
+
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        _local.stack.pop()
+
+        record = {
+            'name': self.name,
+            'ms': elapsed * 1000,
+            'parent': self.parent.name if self.parent is not None else None,
+            'time': time.time(),
+            'tags': self.tags,
+        }
+        if self.memory_start is not None:
+            peak = max(tracemalloc.get_traced_memory()[1], self.child_peak)
+            record['peak_mb'] = (peak - self.memory_start) / 2 ** 20
+            if self.parent is not None and self.parent.memory_start is not None:
+                self.parent.child_peak = max(self.parent.child_peak, peak)
+
+        for sink in list(_sinks):
+            try:
+                sink(record)
+            except Exception:
+                logger.exception("Instrumentation sink %r failed", sink)
+        return False
+
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+def span(name, **tags):
+    # Context manager timing one named pipeline stage (a shared no-op while no sink is configured)
+    if not _sinks:
+        return _NULL_SPAN
+    return _Span(name, tags)
+
+
+def instrumented(name=None):
+    # Decorator wrapping every call of a function in a span
+    def decorate(function):
+        span_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _sinks:
+                return function(*args, **kwargs)
+            with _Span(span_name, {}):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def profile(function, *args, path=None, sort='cumulative', limit=30, **kwargs):
+    # Run function(*args, **kwargs) under cProfile.
+
+    # Parameters:
+    # - function (callable): The call to profile, e.g. a single recommendation.
+    # - path (str, optional): Where to dump the raw stats (readable with pstats / snakeviz).
+    # - sort (str): pstats sort key for the text report.
+    # - limit (int): Number of report lines.
+
+    # Returns:
+    # - The function's return value.
+    # - str: The formatted pstats report.
+
+    profiler = cProfile.Profile()
+    result = profiler.runcall(function, *args, **kwargs)
+    if path is not None:
+        profiler.dump_stats(path)
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats(sort).print_stats(limit)
+    return result, report.getvalue()
+
+
+def main():
+    # Profile mode: load the data, then trace and cProfile one recommendation
+    from data_loader import filter_ratings, load_animes, load_compact_ratings
+    from rating_matrix import SparseRatingMatrix
+    from recommender import recommend_item, similar_users
+
+    parser = argparse.ArgumentParser(description="Trace and profile a single recommendation.")
+    parser.add_argument('--user', type=int, default=226)
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--items', type=int, default=5)
+    parser.add_argument('--profile-out', default=None, help="Dump raw cProfile stats to this file")
+    parser.add_argument('--trace-out', default=None, help="Also append span records to this JSON lines file")
+    parser.add_argument('--memory', action='store_true', help="Record tracemalloc peaks per span")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    sinks = [LogSink()] + ([JSONLinesSink(args.trace_out)] if args.trace_out else [])
+    configure(sinks, track_memory=args.memory)
+
+    with span('load'):
+        animes = load_animes()
+        rating_matrix = SparseRatingMatrix.from_ratings(filter_ratings(load_compact_ratings()))
+
+    def recommend():
+        similar_user_indices, _ = similar_users(args.user, rating_matrix, k=args.k)
+        return recommend_item(args.user, similar_user_indices, rating_matrix, items=args.items, anime_data=animes)
+
+    recommend()  # Warm the lazily built views so the profile shows the steady state
+    (recommendations, _), report = profile(recommend, path=args.profile_out)
+    print(recommendations)
+    print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+# Import numerical computation libraries
+import numpy as np
+import pandas as pd
+
+# Import sparse matrix containers
+from scipy import sparse
+
+from anime_index import anime_index_for
+from neighbors import top_k_rows
+
+
+class ItemSimilarityModel:
+    # Top-k anime x anime cosine similarity matrix for item-based recommendations.
+    #
+    # The popular-anime dimension is small and stable, so the similarities are
+    # computed once and stored sparsely (k entries per anime). Scoring a user is
+    # then one sparse vector x matrix product whose cost depends on the number
+    # of anime the user rated, not on the number of users.
+    #
+    # Attributes:
+    # - similarities (scipy.sparse.csr_matrix): (n_anime, n_anime); row i holds anime i's top-k neighbors.
+    # - anime_ids (np.ndarray): Anime IDs matching the rows / columns.
+
+    def __init__(self, similarities, anime_ids):
+        self.similarities = sparse.csr_matrix(similarities)
+        self.anime_ids = np.asarray(anime_ids)
+
+    @classmethod
+    def build(cls, matrix, k=50, block_size=1024):
+        # Compute the top-k item-item cosine similarities of a SparseRatingMatrix.
+
+        # Parameters:
+        # - matrix (SparseRatingMatrix): The rating matrix.
+        # - k (int): Neighbors kept per anime.
+        # - block_size (int): Anime scored per block; peak memory is about block_size x n_anime floats.
+
+        # Returns:
+        # - ItemSimilarityModel: The built model.
+
+        csc = matrix.csc
+        norms = np.sqrt(np.asarray(csc.multiply(csc).sum(axis=0)).ravel())
+        norms[norms == 0] = 1.0
+        normalized = sparse.csr_matrix(csc.multiply(1.0 / norms[None, :]).T, dtype=np.float32)
+
+        n_anime = matrix.shape[1]
+        k = min(k, n_anime - 1)
+        rows, cols, values = [], [], []
+        for start in range(0, n_anime, block_size):
+            block = np.arange(start, min(start + block_size, n_anime))
+            scores = np.asarray((normalized[block] @ normalized.T).todense(), dtype=np.float32)
+            scores[np.arange(len(block)), block] = -np.inf
+
+            top = top_k_rows(scores, k)
+            top_scores = np.take_along_axis(scores, top, axis=1)
+            keep = top_scores > 0
+            rows.append(np.repeat(block, keep.sum(axis=1)))
+            cols.append(top[keep])
+            values.append(top_scores[keep])
+
+        similarities = sparse.csr_matrix(
+            (np.concatenate(values), (np.concatenate(rows), np.concatenate(cols))), shape=(n_anime, n_anime)
+        )
+        return cls(similarities, matrix.anime_ids)
+
+    def save(self, path):
+        # Persist the similarity matrix and its anime IDs to an .npz file
+        np.savez(
+            path,
+            data=self.similarities.data,
+            indices=self.similarities.indices,
+            indptr=self.similarities.indptr,
+            shape=np.array(self.similarities.shape),
+            anime_ids=self.anime_ids,
+        )
+
+    @classmethod
+    def load(cls, path):
+        # Load a model saved with save()
+        with np.load(path) as data:
+            similarities = sparse.csr_matrix((data['data'], data['indices'], data['indptr']), shape=tuple(data['shape']))
+            return cls(similarities, data['anime_ids'])
+
+    def scores(self, user_row):
+        # Predicted rating of every anime for one user.
+
+        # Parameters:
+        # - user_row (scipy.sparse matrix): 1 x n_anime rating row of the user.
+
+        # Returns:
+        # - np.ndarray: Similarity-weighted mean of the user's ratings; 0 where no rated anime is similar.
+
+        rated = user_row.copy()
+        rated.data = np.ones_like(rated.data)
+
+        # Numerator and normalizer come out of a single (2 x n_anime) x (n_anime x n_anime) product
+        stacked = sparse.vstack([user_row, rated]) @ self.similarities
+        numerator, normalizer = np.asarray(stacked.todense())
+        return np.divide(numerator, normalizer, out=np.zeros_like(numerator), where=normalizer > 0)
+
+
+def recommend_item_based(user_index, matrix, model, items=5, anime_data=None, filters=None):
+    # Generate item recommendations for a given user from item-item similarities.
+
+    # Parameters:
+    # - user_index (int): Index of the target user.
+    # - matrix (SparseRatingMatrix): The rating matrix the model was built from.
+    # - model (ItemSimilarityModel): Precomputed item-item similarities.
+    # - items (int): Number of items to recommend.
+    # - anime_data (pd.DataFrame or AnimeIndex): Anime information used to attach names.
+    # - filters (dict, optional): Type / genre filters, see AnimeIndex.mask (requires anime_data).
+
+    # Returns:
+    # - pd.Series (or pd.DataFrame with names): Predicted ratings for the top N unseen items.
+    # - list: List of top N recommended item indices.
+
+    if not np.array_equal(model.anime_ids, matrix.anime_ids):
+        raise ValueError("Item similarity model was built for a different rating matrix.")
+
+    position = matrix.user_position(int(user_index))
+    if position is None:
+        print(f"User {user_index} has no ratings.")
+        empty = pd.Series(dtype=np.float32, name='predicted_rating')
+        return (pd.DataFrame(columns=['predicted_rating', 'anime_id', 'name']) if anime_data is not None else empty), []
+
+    scores = model.scores(matrix.user_row(position))
+    scores[matrix.seen_items(position)] = -np.inf
+    if filters:
+        if anime_data is None:
+            raise ValueError("anime_data is required to apply filters.")
+        scores[~anime_index_for(anime_data).mask_for(matrix.anime_ids, filters)] = -np.inf
+
+    top = top_k_rows(scores[None, :], min(items, len(scores)))[0]
+    top = top[np.isfinite(scores[top])]
+    recommendations = pd.Series(
+        scores[top], index=pd.Index(matrix.anime_ids[top], name='anime_id'), name='predicted_rating'
+    )
+    top_n_anime_indices = recommendations.index.tolist()
+
+    if anime_data is not None:
+        recommendations_with_names = pd.DataFrame({
+            'predicted_rating': recommendations.to_numpy(),
+            'anime_id': recommendations.index.to_numpy(),
+            'name': anime_index_for(anime_data).names_for(recommendations.index.to_numpy()),
+        })
+        return recommendations_with_names, top_n_anime_indices
+    return recommendations, top_n_anime_indices
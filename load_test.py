@@ -0,0 +1,113 @@
+# Import libraries for the asyncio HTTP client, timing and command-line use
+import argparse
+import asyncio
+import json
+import time
+from urllib.parse import urlencode
+
+# Import numerical computation libraries
+import numpy as np
+
+
+async def _worker(host, port, paths, deadline, latencies, errors):
+    # One keep-alive connection sending requests back to back until the deadline
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        i = 0
+        while time.perf_counter() < deadline:
+            path = paths[i % len(paths)]
+            i += 1
+            start = time.perf_counter()
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode())
+            await writer.drain()
+
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':')[1])
+            await reader.readexactly(length)
+
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors[status] = errors.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+async def run_load(host, port, paths, concurrency=32, duration=10.0):
+    # Drive the service with `concurrency` connections for `duration` seconds.
+
+    # Parameters:
+    # - host, port: Service address.
+    # - paths (list): Request paths with query strings, cycled by every connection.
+    # - concurrency (int): Concurrent keep-alive connections.
+    # - duration (float): Seconds to run.
+
+    # Returns:
+    # - dict: Requests, QPS, p50 / p95 / p99 / max latency in ms and error counts per status.
+
+    latencies, errors = [], {}
+    deadline = time.perf_counter() + duration
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _worker(host, port, paths[offset:] + paths[:offset], deadline, latencies, errors)
+        for offset in range(0, concurrency * 7, 7)
+    ))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (np.nan,) * 3
+    return {
+        'requests': len(latencies),
+        'qps': len(latencies) / elapsed,
+        'p50_ms': p50,
+        'p95_ms': p95,
+        'p99_ms': p99,
+        'max_ms': latencies.max() if len(latencies) else np.nan,
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for service.py.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--endpoint', choices=['recommend', 'similar_users'], default='recommend')
+    parser.add_argument('--user-ids', type=int, nargs='+', default=None,
+                        help="Users to request (default: random IDs from Datasets/rating.csv)")
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--items', type=int, default=5)
+    parser.add_argument('--type', default=None, help="Type filter, e.g. Movie")
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--out', default=None, help="Write the results as JSON")
+    args = parser.parse_args()
+
+    user_ids = args.user_ids
+    if user_ids is None:
+        from data_loader import load_ratings
+        ratings_user_ids = np.unique(load_ratings()['user_id'].to_numpy())
+        user_ids = np.random.default_rng(0).choice(ratings_user_ids, size=min(1000, len(ratings_user_ids)))
+
+    params = {'k': args.k}
+    if args.endpoint == 'recommend':
+        params['items'] = args.items
+        if args.type:
+            params['type'] = args.type
+    paths = [f"/{args.endpoint}?{urlencode(dict(params, user_id=int(user_id)))}" for user_id in user_ids]
+
+    results = asyncio.run(run_load(args.host, args.port, paths, args.concurrency, args.duration))
+    print(f"{results['requests']} requests, {results['qps']:.1f} QPS, p50 {results['p50_ms']:.2f} ms, "
+          f"p95 {results['p95_ms']:.2f} ms, p99 {results['p99_ms']:.2f} ms, max {results['max_ms']:.2f} ms, "
+          f"errors {results['errors']}")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(dict(results, **vars(args)), f, indent=2, default=str)
+
+
+if __name__ == '__main__':
+    main()
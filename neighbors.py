@@ -0,0 +1,103 @@
+# Import numerical computation libraries
+import numpy as np
+
+from rating_matrix import SparseRatingMatrix
+from similarity import similarity_scores
+
+
+def top_k_rows(scores, k):
+    # Top-k column indices of every row of a dense score block, best first.
+
+    # Parameters:
+    # - scores (np.ndarray): (b, n) score block; excluded entries should be -inf.
+    # - k (int): Number of columns to keep per row (k <= n).
+
+    # Returns:
+    # - np.ndarray: (b, k) column indices sorted by descending score, ties by ascending index.
+
+    if k < scores.shape[1]:
+        # Everything above the k-th score, then the lowest-index ties at the k-th score to fill k slots
+        kth = -np.partition(-scores, k - 1, axis=1)[:, k - 1:k]
+        better = scores > kth
+        tied = scores == kth
+        need = k - better.sum(axis=1)
+        if (tied.sum(axis=1) > need).any():
+            tied &= np.cumsum(tied, axis=1) <= need[:, None]
+        candidates = np.nonzero(better | tied)[1].reshape(len(scores), k)
+    else:
+        candidates = np.broadcast_to(np.arange(scores.shape[1]), scores.shape).copy()
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.lexsort((candidates, -candidate_scores), axis=1)
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def neighbor_positions(matrix, rows, k=5, block_size=512, metric='cosine'):
+    # Exact top-k neighbors for the given row positions, computed in blocks.
+
+    # Parameters:
+    # - matrix (SparseRatingMatrix): The rating matrix.
+    # - rows (np.ndarray): Row positions of the query users.
+    # - k (int): Number of neighbors per user.
+    # - block_size (int): Query users per block; peak memory is about block_size x n_users floats.
+    # - metric (str): Similarity metric, see similarity.METRICS.
+
+    # Returns:
+    # - np.ndarray: (len(rows), k) neighbor row positions, -1 where fewer than k others exist.
+    # - np.ndarray: (len(rows), k) float32 similarities, NaN where padded.
+
+    rows = np.asarray(rows, dtype=np.intp)
+    n_users = matrix.shape[0]
+    k_eff = min(k, n_users - 1)
+
+    positions = np.full((len(rows), k), -1, dtype=np.int64)
+    similarities = np.full((len(rows), k), np.nan, dtype=np.float32)
+    if k_eff <= 0 or len(rows) == 0:
+        return positions, similarities
+
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+
+        # (n_users x n_anime) sparse times (n_anime x b) dense -> (b x n_users) similarities
+        scores = similarity_scores(matrix, matrix.csr[block].toarray(), metric)
+        scores[np.arange(len(block)), block] = -np.inf
+
+        top = top_k_rows(scores, k_eff)
+        positions[start:start + len(block), :k_eff] = top
+        similarities[start:start + len(block), :k_eff] = np.take_along_axis(scores, top, axis=1)
+
+    return positions, similarities
+
+
+def all_similar_users(matrix, k=5, user_ids=None, block_size=512, metric='cosine'):
+    # Find the top-k most similar users for every user (or a given list of users).
+
+    # Parameters:
+    # - matrix (pd.DataFrame or SparseRatingMatrix): The rating matrix.
+    # - k (int): Number of similar users to retrieve per user.
+    # - user_ids (list, optional): Target user IDs; defaults to every user in the matrix.
+    # - block_size (int): Users scored per matrix product, bounding peak memory.
+    # - metric (str): Similarity metric, see similarity.METRICS.
+
+    # Returns:
+    # - np.ndarray: Target user IDs, one per output row.
+    # - np.ndarray: (U, k) similar user IDs, -1 where unavailable.
+    # - np.ndarray: (U, k) similarity scores, NaN where unavailable.
+
+    if not isinstance(matrix, SparseRatingMatrix):
+        matrix = SparseRatingMatrix.from_dense(matrix)
+
+    if user_ids is None:
+        targets = matrix.user_ids
+        rows = np.arange(len(targets))
+    else:
+        targets = np.asarray(user_ids).ravel()
+        rows, found = matrix.lookup_users(targets)
+        if not found.all():
+            missing = targets[~found].tolist()
+            print(f"Users {missing} have no ratings.")
+        targets, rows = targets[found], rows[found]
+
+    positions, similarities = neighbor_positions(matrix, rows, k=k, block_size=block_size, metric=metric)
+    neighbor_ids = np.where(positions >= 0, matrix.user_ids[positions], -1)
+
+    return targets, neighbor_ids, similarities
@@ -0,0 +1,489 @@
+# Import libraries for file handling
+import os
+
+# Import numerical computation libraries
+import numpy as np
+import pandas as pd
+
+# Import sparse matrix containers
+from scipy import sparse
+
+from instrumentation import instrumented
+
+# Arrays written by SparseRatingMatrix.save, one .npy file each
+MATRIX_ARRAYS = ('data', 'indices', 'indptr', 'shape', 'user_ids', 'anime_ids', 'norms')
+
+
+def storage_dtype(values):
+    # int8 when every rating is a whole number in int8 range (the 1..10 scale), otherwise float32
+    values = np.asarray(values)
+    if len(values) == 0:
+        return np.dtype(np.int8)
+    whole = values.dtype.kind in 'iu' or np.array_equal(values, np.round(values))
+    if whole and values.min() >= -128 and values.max() <= 127:
+        return np.dtype(np.int8)
+    return np.dtype(np.float32)
+
+
+def encode_ids(ids):
+    # Sorted distinct IDs and the code of every entry; a bincount pass when the IDs are small non-negative ints
+    ids = np.asarray(ids)
+    if len(ids) and ids.dtype.kind in 'iu' and ids.min() >= 0 and ids.max() < 4 * len(ids) + 2 ** 20:
+        present = np.bincount(ids) > 0
+        codes = (np.cumsum(present) - 1).astype(np.int32)
+        return np.nonzero(present)[0], codes[ids]
+    return np.unique(ids, return_inverse=True)
+
+
+class CompactRatings:
+    # Long-format ratings as dense int32 codes and int8 values.
+    #
+    # Raw user / anime IDs are replaced by their position in sorted ID arrays
+    # once, at load time; everything downstream (filtering, matrix building)
+    # works on the codes, and IDs are only looked up again for output.
+    #
+    # Attributes:
+    # - user_codes, anime_codes (np.ndarray): int32 codes, one per rating.
+    # - values (np.ndarray): int8 (or float32 for non-integer) ratings.
+    # - user_ids, anime_ids (np.ndarray): Sorted int32 IDs; code i stands for user_ids[i] / anime_ids[i].
+
+    def __init__(self, user_codes, anime_codes, values, user_ids, anime_ids):
+        self.user_codes = np.asarray(user_codes, dtype=np.int32)
+        self.anime_codes = np.asarray(anime_codes, dtype=np.int32)
+        self.values = np.asarray(values).astype(storage_dtype(values), copy=False)
+        self.user_ids = np.asarray(user_ids).astype(np.int32, copy=False)
+        self.anime_ids = np.asarray(anime_ids).astype(np.int32, copy=False)
+        self._counts = None
+        self._masks = {}
+
+    @classmethod
+    def from_frame(cls, ratings, user_col='user_id', item_col='anime_id', rating_col='rating'):
+        # Encode a ratings DataFrame (e.g. load_ratings()) into codes
+        user_ids, user_codes = encode_ids(ratings[user_col].to_numpy())
+        anime_ids, anime_codes = encode_ids(ratings[item_col].to_numpy())
+        return cls(user_codes, anime_codes, ratings[rating_col].to_numpy(), user_ids, anime_ids)
+
+    def __len__(self):
+        return len(self.values)
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.user_codes, self.anime_codes, self.values, self.user_ids, self.anime_ids))
+
+    def counts(self):
+        # Ratings per user code and per anime code (cached)
+        if self._counts is None:
+            self._counts = (
+                np.bincount(self.user_codes, minlength=len(self.user_ids)),
+                np.bincount(self.anime_codes, minlength=len(self.anime_ids)),
+            )
+        return self._counts
+
+    def filter_mask(self, min_anime_ratings=1000, max_user_ratings=1000):
+        # Ratings of anime with >= min_anime_ratings ratings by users with <= max_user_ratings ratings.
+
+        # Both thresholds are applied as one boolean mask gathered from the per-code counts;
+        # masks are cached per (min_anime_ratings, max_user_ratings).
+
+        key = (min_anime_ratings, max_user_ratings)
+        if key not in self._masks:
+            user_counts, anime_counts = self.counts()
+            self._masks[key] = (
+                (anime_counts >= min_anime_ratings)[self.anime_codes] & (user_counts <= max_user_ratings)[self.user_codes]
+            )
+        return self._masks[key]
+
+    def filtered(self, min_anime_ratings=1000, max_user_ratings=1000):
+        # Subset passing filter_mask, see filter_mask
+        return self.select(self.filter_mask(min_anime_ratings, max_user_ratings))
+
+    def select(self, mask):
+        # Subset of the ratings under a boolean mask, keeping the same ID maps
+        return CompactRatings(
+            self.user_codes[mask], self.anime_codes[mask], self.values[mask], self.user_ids, self.anime_ids
+        )
+
+    def compacted(self, keep_anime=False):
+        # Drop IDs without ratings and renumber the codes densely (order preserved); keep_anime keeps every anime ID
+        user_present = np.bincount(self.user_codes, minlength=len(self.user_ids)) > 0
+        anime_present = np.bincount(self.anime_codes, minlength=len(self.anime_ids)) > 0
+        if keep_anime:
+            anime_present[:] = True
+        if user_present.all() and anime_present.all():
+            return self
+        user_map = (np.cumsum(user_present) - 1).astype(np.int32)
+        anime_map = (np.cumsum(anime_present) - 1).astype(np.int32)
+        return CompactRatings(
+            user_map[self.user_codes], anime_map[self.anime_codes], self.values,
+            self.user_ids[user_present], self.anime_ids[anime_present],
+        )
+
+    def to_frame(self):
+        # Back to a (user_id, anime_id, rating) DataFrame at the output boundary
+        return pd.DataFrame({
+            'user_id': self.user_ids[self.user_codes],
+            'anime_id': self.anime_ids[self.anime_codes],
+            'rating': self.values,
+        })
+
+
+class SparseRatingMatrix:
+    # Sparse users x anime rating matrix.
+    #
+    # Stores the ratings as a CSR matrix (one row per user) together with a CSC
+    # view (one column per anime) and contiguous id <-> index maps, so memory
+    # scales with the number of ratings instead of users x anime. Missing
+    # ratings are implicit zeros, exactly like the zero-filled pivot table.
+    # Whole-number ratings are stored as int8 with int32 column indices; the
+    # normalized copy used for clustering and LSH and the mean-centered copy
+    # used by the Pearson similarity are float32.
+    #
+    # Attributes:
+    # - csr (scipy.sparse.csr_matrix): Ratings, row-major by user (int8, or float32 for averaged duplicates).
+    # - csc (scipy.sparse.csc_matrix): Same ratings, column-major by anime.
+    # - user_ids (np.ndarray): Sorted int32 user IDs; position i is row i.
+    # - anime_ids (np.ndarray): Sorted int32 anime IDs; position j is column j.
+
+    def __init__(self, csr, user_ids, anime_ids):
+        self.csr = sparse.csr_matrix(csr)
+        self.user_ids = np.asarray(user_ids).astype(np.int32, copy=False)
+        self.anime_ids = np.asarray(anime_ids).astype(np.int32, copy=False)
+        self.version = 0
+        self._norms = None
+        self._refresh()
+
+    def _refresh(self):
+        # Drop the derived views after the CSR matrix changed
+        self.csr.sort_indices()
+        self.clear_caches()
+
+    def clear_caches(self):
+        # Drop the cached derived views (CSC, normalized, mean-centered, rated pattern) and models; row norms are kept
+        self._csc = None
+        self._normalized = None
+        self._means = None
+        self._centered = None
+        self._centered_norms = None
+        self._pattern = None
+        self._models = {}
+
+    def cached_model(self, name, build):
+        # Model built from this matrix (e.g. the default LSH index), built on first use and kept on the
+        # instance, so it is freed with the matrix and rebuilt after upsert / drop_users
+        if name not in self._models:
+            self._models[name] = build(self)
+        return self._models[name]
+
+    @property
+    def csc(self):
+        # Column-major view, built on first use
+        if self._csc is None:
+            self._csc = self.csr.tocsc()
+        return self._csc
+
+    @classmethod
+    @instrumented('build_matrix')
+    def from_ratings(cls, ratings, user_col='user_id', item_col='anime_id', rating_col='rating'):
+        # Build the matrix straight from a long-format ratings DataFrame.
+        #
+        # Parameters:
+        # - ratings (pd.DataFrame or CompactRatings): One row per (user, anime, rating), e.g. filtered_ratings.
+        # - user_col, item_col, rating_col (str): Column names to read.
+        #
+        # Returns:
+        # - SparseRatingMatrix: Duplicate (user, anime) pairs are averaged, as pivot_table does.
+
+        if not isinstance(ratings, CompactRatings):
+            ratings = CompactRatings.from_frame(ratings, user_col, item_col, rating_col)
+        return cls.from_compact(ratings)
+
+    @classmethod
+    def from_compact(cls, ratings, keep_anime=False):
+        # Build the matrix from CompactRatings codes; users / anime without ratings are dropped
+        # (keep_anime keeps every anime ID as a column, e.g. so shards of one matrix share their columns)
+        ratings = ratings.compacted(keep_anime)
+        shape = (len(ratings.user_ids), len(ratings.anime_ids))
+        coords = (ratings.user_codes, ratings.anime_codes)
+
+        counts = sparse.csr_matrix((np.ones(len(ratings), dtype=np.int32), coords), shape=shape)
+        counts.sum_duplicates()
+        if counts.nnz == len(ratings):
+            # No duplicate pairs: the values go in as they are
+            csr = sparse.csr_matrix((ratings.values, coords), shape=shape)
+        else:
+            totals = sparse.csr_matrix((ratings.values.astype(np.float32), coords), shape=shape)
+            totals.sum_duplicates()
+            totals.data /= counts.data
+            csr = totals.astype(storage_dtype(totals.data))
+
+        return cls(csr, ratings.user_ids, ratings.anime_ids)
+
+    @classmethod
+    def from_dense(cls, matrix):
+        # Convert a zero-filled pivot table (pd.DataFrame) into a SparseRatingMatrix
+        csr = sparse.csr_matrix(matrix.to_numpy(dtype=np.float32))
+        return cls(csr.astype(storage_dtype(csr.data), copy=False), matrix.index, matrix.columns)
+
+    def save(self, path):
+        # Persist the matrix as a directory of .npy arrays (CSR parts, ID maps and row norms)
+        os.makedirs(path, exist_ok=True)
+        arrays = {
+            'data': self.csr.data,
+            'indices': self.csr.indices,
+            'indptr': self.csr.indptr,
+            'shape': np.array(self.shape, dtype=np.int64),
+            'user_ids': self.user_ids,
+            'anime_ids': self.anime_ids,
+            'norms': self.row_norms(),
+        }
+        for name in MATRIX_ARRAYS:
+            np.save(os.path.join(path, name + '.npy'), arrays[name])
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        # Open a matrix saved with save(); mmap=True maps the arrays copy-on-write instead of reading them
+        arrays = {
+            name: np.load(os.path.join(path, name + '.npy'), mmap_mode='c' if mmap else None)
+            for name in MATRIX_ARRAYS
+        }
+        csr = sparse.csr_matrix(
+            (arrays['data'], arrays['indices'], arrays['indptr']), shape=tuple(int(n) for n in arrays['shape'])
+        )
+        csr.has_sorted_indices = True
+        matrix = cls(csr, arrays['user_ids'], arrays['anime_ids'])
+        matrix._norms = np.asarray(arrays['norms'])
+        return matrix
+
+    @property
+    def shape(self):
+        return self.csr.shape
+
+    @property
+    def nnz(self):
+        return self.csr.nnz
+
+    @property
+    def nbytes(self):
+        # Memory held by the ratings, ID maps, cached norms and cached derived values
+        arrays = [self.csr.data, self.csr.indices, self.csr.indptr, self.user_ids, self.anime_ids]
+        if self._norms is not None:
+            arrays.append(self._norms)
+        for cached in (self._normalized, self._centered, self._pattern):
+            if cached is not None:
+                arrays.append(cached.data)
+        for cached in (self._means, self._centered_norms):
+            if cached is not None:
+                arrays.append(cached)
+        return sum(a.nbytes for a in arrays)
+
+    @property
+    def index(self):
+        # User IDs, mirroring rating_matrix.index of the dense pivot table
+        return pd.Index(self.user_ids, name='user_id')
+
+    @property
+    def columns(self):
+        # Anime IDs, mirroring rating_matrix.columns of the dense pivot table
+        return pd.Index(self.anime_ids, name='anime_id')
+
+    def __contains__(self, user_id):
+        return self.user_position(user_id) is not None
+
+    @staticmethod
+    def _lookup(ids, values):
+        # Map IDs to positions in a sorted ID array with a binary search
+        values = np.asarray(values)
+        if len(ids) == 0:
+            return np.zeros(values.shape, dtype=np.intp), np.zeros(values.shape, dtype=bool)
+        positions = np.minimum(np.searchsorted(ids, values), len(ids) - 1)
+        return positions, ids[positions] == values
+
+    def user_position(self, user_id):
+        # Row index of a user ID, or None if the user has no ratings
+        positions, found = self._lookup(self.user_ids, user_id)
+        return int(positions) if found else None
+
+    def anime_position(self, anime_id):
+        # Column index of an anime ID, or None if the anime is not in the matrix
+        positions, found = self._lookup(self.anime_ids, anime_id)
+        return int(positions) if found else None
+
+    def lookup_users(self, user_ids):
+        # Row indices for several user IDs plus a mask of which IDs were found
+        return self._lookup(self.user_ids, np.asarray(user_ids).ravel())
+
+    def lookup_anime(self, anime_ids):
+        # Column indices for several anime IDs plus a mask of which IDs were found
+        return self._lookup(self.anime_ids, np.asarray(anime_ids).ravel())
+
+    def user_positions(self, user_ids):
+        # Row indices for several user IDs; unknown users are dropped
+        positions, found = self._lookup(self.user_ids, np.asarray(user_ids).ravel())
+        return positions[found]
+
+    def anime_positions(self, anime_ids):
+        # Column indices for several anime IDs; unknown anime are dropped
+        positions, found = self._lookup(self.anime_ids, np.asarray(anime_ids).ravel())
+        return positions[found]
+
+    def user_row(self, position):
+        # Sparse 1 x n_anime row for the user at a row index
+        return self.csr[position]
+
+    def seen_items(self, position):
+        # Column indices the user at a row index has rated
+        start, end = self.csr.indptr[position], self.csr.indptr[position + 1]
+        return self.csr.indices[start:end]
+
+    def row_norms(self):
+        # L2 norm of every user's rating vector (cached, updated per row by upsert)
+        if self._norms is None:
+            self._norms = self._compute_norms(self.csr)
+        return self._norms.copy()
+
+    def inverse_norms(self):
+        # 1 / row norm (0 for all-zero rows); scales exact int8 rating dot products into cosines
+        norms = self.row_norms()
+        return np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+
+    @staticmethod
+    def _compute_norms(rows):
+        # float64, so cosines that differ only past float32 precision still rank in the right order
+        values = rows.astype(np.float64)
+        return np.sqrt(np.asarray(values.multiply(values).sum(axis=1)).ravel())
+
+    def row_counts(self):
+        # Number of rated anime per user
+        return np.diff(self.csr.indptr)
+
+    def row_means(self):
+        # Mean rating of every user over the anime they rated (cached; 0 for users without ratings)
+        if self._means is None:
+            counts = self.row_counts()
+            sums = np.asarray(self.csr.sum(axis=1, dtype=np.float64)).ravel()
+            self._means = np.divide(sums, counts, out=np.zeros(len(counts)), where=counts > 0)
+        return self._means
+
+    def centered(self):
+        # Ratings minus the user's mean on the rated entries, as a float32 CSR copy sharing the index arrays (cached)
+        if self._centered is None:
+            means = np.repeat(self.row_means(), self.row_counts())
+            self._centered = sparse.csr_matrix(
+                ((self.csr.data - means).astype(np.float32), self.csr.indices, self.csr.indptr), shape=self.shape
+            )
+            self._centered.has_sorted_indices = True
+        return self._centered
+
+    def centered_norms(self):
+        # L2 norm of every mean-centered row (cached)
+        if self._centered_norms is None:
+            self._centered_norms = self._compute_norms(self.centered())
+        return self._centered_norms
+
+    def pattern(self):
+        # int8 CSR with a 1 for every rated entry, sharing the index arrays (cached)
+        if self._pattern is None:
+            self._pattern = sparse.csr_matrix(
+                (np.ones(self.nnz, dtype=np.int8), self.csr.indices, self.csr.indptr), shape=self.shape
+            )
+            self._pattern.has_sorted_indices = True
+        return self._pattern
+
+    def normalized(self):
+        # Row-normalized copy of the CSR matrix (cached); all-zero rows stay zero
+        if self._normalized is None:
+            norms = self.row_norms()
+            norms[norms == 0] = 1.0
+            scale = np.repeat(1.0 / norms, np.diff(self.csr.indptr)).astype(np.float32)
+            self._normalized = sparse.csr_matrix(
+                (self.csr.data * scale, self.csr.indices, self.csr.indptr), shape=self.shape
+            )
+        return self._normalized
+
+    def _grow(self, user_ids, anime_ids):
+        # Add rows / columns for unseen IDs, keeping both ID arrays sorted
+        new_users = np.setdiff1d(user_ids, self.user_ids)
+        new_anime = np.setdiff1d(anime_ids, self.anime_ids)
+        if len(new_users) == 0 and len(new_anime) == 0:
+            return
+
+        all_users = np.union1d(self.user_ids, new_users)
+        all_anime = np.union1d(self.anime_ids, new_anime)
+        row_map = np.searchsorted(all_users, self.user_ids)
+        col_map = np.searchsorted(all_anime, self.anime_ids)
+
+        coo = self.csr.tocoo()
+        self.csr = sparse.csr_matrix(
+            (coo.data, (row_map[coo.row], col_map[coo.col])), shape=(len(all_users), len(all_anime))
+        )
+        if self._norms is not None:
+            norms = np.zeros(len(all_users), dtype=np.float64)
+            norms[row_map] = self._norms
+            self._norms = norms
+        self.user_ids = all_users
+        self.anime_ids = all_anime
+
+    def upsert(self, user_ids, anime_ids, values):
+        # Insert or overwrite ratings in place, adding rows / columns for new IDs.
+
+        # The CSR arrays are rebuilt by a sparse add, so one call costs O(nnz)
+        # however small the batch is; only the norms of the changed rows are
+        # recomputed.
+
+        # Parameters:
+        # - user_ids, anime_ids (array-like): Coordinates of the new ratings.
+        # - values (array-like): Rating values; the last one wins for repeated pairs.
+
+        # Returns:
+        # - np.ndarray: Row positions (after the update) of the users whose vectors changed.
+
+        user_ids = np.asarray(user_ids)
+        anime_ids = np.asarray(anime_ids)
+        values = np.asarray(values, dtype=np.float32)
+        if len(values) == 0:
+            return np.empty(0, dtype=np.intp)
+
+        self._grow(user_ids, anime_ids)
+        rows = np.searchsorted(self.user_ids, user_ids)
+        cols = np.searchsorted(self.anime_ids, anime_ids)
+
+        # Keep only the last rating for each (user, anime) pair in the batch
+        keys = rows.astype(np.int64) * self.shape[1] + cols
+        _, last = np.unique(keys[::-1], return_index=True)
+        last = len(keys) - 1 - last
+        rows, cols, values = rows[last], cols[last], values[last]
+
+        # Adding (new - old) overwrites existing entries and inserts the rest in one pass
+        old = np.asarray(self.csr[rows, cols]).ravel()
+        self.csr = self.csr + sparse.csr_matrix((values - old, (rows, cols)), shape=self.shape)
+        self.csr.eliminate_zeros()
+        self.csr = self.csr.astype(storage_dtype(self.csr.data), copy=False)
+
+        changed = np.unique(rows)
+        if self._norms is not None:
+            self._norms[changed] = self._compute_norms(self.csr[changed])
+        self.version += 1
+        self._refresh()
+        return changed
+
+    def drop_users(self, user_ids):
+        # Remove users (and their ratings) from the matrix in place
+        positions = self.user_positions(user_ids)
+        if len(positions) == 0:
+            return
+        keep = np.ones(self.shape[0], dtype=bool)
+        keep[positions] = False
+        self.csr = self.csr[keep]
+        self.user_ids = self.user_ids[keep]
+        if self._norms is not None:
+            self._norms = self._norms[keep]
+        self.version += 1
+        self._refresh()
+
+    def to_dense(self):
+        # Zero-filled DataFrame equivalent to the original pivot table
+        return pd.DataFrame(self.csr.toarray().astype(np.float32), index=self.index, columns=self.columns)
+
+    def __repr__(self):
+        users, animes = self.shape
+        return f"SparseRatingMatrix(users={users}, anime={animes}, ratings={self.nnz})"
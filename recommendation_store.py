@@ -0,0 +1,206 @@
+# Import libraries for file handling and command-line use
+import argparse
+import json
+import os
+
+# Import numerical computation libraries
+import numpy as np
+import pandas as pd
+
+from data_loader import filter_ratings, load_animes, load_compact_ratings
+from rating_matrix import SparseRatingMatrix
+from recommender import recommend_rows
+
+STORE_VERSION = 1
+
+
+def create_store(matrix, path, k=5, items=10, anime_data=None, extra_meta=None):
+    # Lay out an empty recommendation store for every user of a matrix.
+
+    # The store is a directory of fixed-width .npy arrays that RecommendationStore
+    # opens as np.memmap:
+    # - offsets.npy (int32, max_user_id + 1): row of each user ID, -1 if absent.
+    # - anime_ids.npy (int32, n_users x items): recommended anime IDs, -1 for padding.
+    # - scores.npy (float32, n_users x items): mean rating of the similar users.
+    # - names.json: anime_id -> name for the anime in the matrix (if anime_data is given).
+    # - meta.json: shapes, parameters and whether every row has been written.
+
+    # Parameters:
+    # - matrix (SparseRatingMatrix): The rating matrix.
+    # - path (str): Output directory.
+    # - k (int): Number of similar users per user.
+    # - items (int): Number of recommendations stored per user.
+    # - anime_data (pd.DataFrame, optional): Dataframe containing anime information.
+    # - extra_meta (dict, optional): Additional entries recorded in meta.json.
+
+    os.makedirs(path, exist_ok=True)
+    n_users = matrix.shape[0]
+    max_user_id = int(matrix.user_ids.max()) if n_users else 0
+
+    offsets = np.full(max_user_id + 1, -1, dtype=np.int32)
+    offsets[matrix.user_ids] = np.arange(n_users, dtype=np.int32)
+    np.save(os.path.join(path, 'offsets.npy'), offsets)
+
+    anime_ids = np.lib.format.open_memmap(os.path.join(path, 'anime_ids.npy'), mode='w+', dtype=np.int32, shape=(n_users, items))
+    scores = np.lib.format.open_memmap(os.path.join(path, 'scores.npy'), mode='w+', dtype=np.float32, shape=(n_users, items))
+    anime_ids[:] = -1
+    scores[:] = np.nan
+    anime_ids.flush()
+    scores.flush()
+
+    if anime_data is not None:
+        names = anime_data[anime_data['anime_id'].isin(matrix.anime_ids)]
+        with open(os.path.join(path, 'names.json'), 'w') as f:
+            json.dump({str(a): n for a, n in zip(names['anime_id'], names['name'])}, f)
+
+    meta = {'version': STORE_VERSION, 'n_users': n_users, 'items': items, 'k': k,
+            'max_user_id': max_user_id, 'complete': False}
+    meta.update(extra_meta or {})
+    _write_meta(path, meta)
+
+
+def _write_meta(path, meta):
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+
+def read_meta(path):
+    # Parameters and completion flag of a store, or None if there is no store at path
+    meta_path = os.path.join(path, 'meta.json')
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def mark_complete(path):
+    # Flag a store as fully written
+    meta = read_meta(path)
+    meta['complete'] = True
+    _write_meta(path, meta)
+
+
+def compute_recommendations(matrix, rows, k=5, items=10, block_size=512):
+    # Top-N recommendations for a block of users: (len(rows), items) int32 anime IDs (-1 for padding)
+    # and float32 scores (NaN for padding), scored block_size users at a time, see recommender.recommend_rows
+    return recommend_rows(matrix, rows, k=k, items=items, block_size=block_size)
+
+
+def write_recommendations(path, matrix, rows, k=5, items=10, block_size=512):
+    # Compute and write the recommendations of a block of users into an existing store
+    anime_ids, scores = compute_recommendations(matrix, rows, k=k, items=items, block_size=block_size)
+    stored_ids = np.load(os.path.join(path, 'anime_ids.npy'), mmap_mode='r+')
+    stored_scores = np.load(os.path.join(path, 'scores.npy'), mmap_mode='r+')
+    stored_ids[rows] = anime_ids
+    stored_scores[rows] = scores
+    stored_ids.flush()
+    stored_scores.flush()
+
+
+def export_recommendations(matrix, path, k=5, items=10, anime_data=None, block_size=512):
+    # Precompute top-N recommendations for every user and write them as a binary store.
+
+    # Parameters:
+    # - matrix (SparseRatingMatrix): The rating matrix.
+    # - path (str): Output directory (see create_store for the layout).
+    # - k (int): Number of similar users per user.
+    # - items (int): Number of recommendations stored per user.
+    # - anime_data (pd.DataFrame, optional): Dataframe containing anime information.
+    # - block_size (int): Users scored and written per block; peak memory is about
+    #   block_size x (n_users + n_anime) floats, see recommender.recommend_rows.
+
+    create_store(matrix, path, k=k, items=items, anime_data=anime_data)
+    n_users = matrix.shape[0]
+    for start in range(0, n_users, block_size):
+        rows = np.arange(start, min(start + block_size, n_users))
+        write_recommendations(path, matrix, rows, k=k, items=items, block_size=block_size)
+    mark_complete(path)
+
+
+class RecommendationStore:
+    # Read-only view of a store written by export_recommendations.
+    #
+    # Arrays are memory-mapped, so opening the store reads only meta.json and
+    # each lookup touches one offset and one fixed-width row: O(1) per user.
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != STORE_VERSION:
+            raise ValueError(f"Unsupported recommendation store version {self.meta['version']}.")
+
+        self.items = self.meta['items']
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'), mmap_mode='r')
+        self.anime_ids = np.load(os.path.join(path, 'anime_ids.npy'), mmap_mode='r')
+        self.scores = np.load(os.path.join(path, 'scores.npy'), mmap_mode='r')
+
+        names_path = os.path.join(path, 'names.json')
+        self.names = {}
+        if os.path.exists(names_path):
+            with open(names_path) as f:
+                self.names = {int(a): n for a, n in json.load(f).items()}
+
+    def __contains__(self, user_id):
+        return self._row(user_id) >= 0
+
+    def _row(self, user_id):
+        user_id = int(user_id)
+        if user_id < 0 or user_id >= len(self.offsets):
+            return -1
+        return int(self.offsets[user_id])
+
+    def lookup(self, user_id, items=None):
+        # Stored recommendations for a user.
+
+        # Parameters:
+        # - user_id (int): The target user ID.
+        # - items (int, optional): Number of recommendations to return (at most the stored width).
+
+        # Returns:
+        # - np.ndarray: Recommended anime IDs (empty for unknown users).
+        # - np.ndarray: Matching mean ratings.
+
+        row = self._row(user_id)
+        if row < 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+
+        anime_ids = np.array(self.anime_ids[row, :items])
+        scores = np.array(self.scores[row, :items])
+        valid = anime_ids >= 0
+        return anime_ids[valid], scores[valid]
+
+    def recommendations(self, user_id, items=None):
+        # Stored recommendations as a DataFrame with the recommend_item columns
+        anime_ids, scores = self.lookup(user_id, items)
+        return pd.DataFrame({
+            'anime_id': anime_ids,
+            'name': [self.names.get(int(a), '') for a in anime_ids],
+            'mean_rating': scores,
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export precomputed recommendations for every user.")
+    parser.add_argument('--ratings', default='Datasets/rating.csv')
+    parser.add_argument('--anime', default='Datasets/anime.csv')
+    parser.add_argument('--out', default='recommendation_store')
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--items', type=int, default=10)
+    parser.add_argument('--min-anime-ratings', type=int, default=1000, help="Keep anime with at least this many ratings")
+    parser.add_argument('--max-user-ratings', type=int, default=1000, help="Keep users with at most this many ratings")
+    parser.add_argument('--block-size', type=int, default=512, help="Users scored and written together")
+    args = parser.parse_args()
+
+    animes = load_animes(args.anime)
+    ratings = load_compact_ratings(args.ratings)
+    filtered_ratings = filter_ratings(ratings, args.min_anime_ratings, args.max_user_ratings)
+
+    rating_matrix = SparseRatingMatrix.from_ratings(filtered_ratings)
+    export_recommendations(
+        rating_matrix, args.out, k=args.k, items=args.items, anime_data=animes, block_size=args.block_size,
+    )
+    print(f"Wrote recommendations for {rating_matrix.shape[0]} users to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
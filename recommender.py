@@ -0,0 +1,446 @@
+# Import numerical computation libraries
+import numpy as np
+import pandas as pd
+
+# Import libraries for working with matrices (sklearn is only imported by the dense pivot-table path)
+import operator  # Operator module provides a set of convenient built-in functions
+from scipy import sparse
+
+from ann_index import default_index
+from anime_index import anime_index_for
+from instrumentation import instrumented, span
+from neighbors import neighbor_positions, top_k_rows
+from rating_matrix import SparseRatingMatrix
+from sharded_matrix import ShardedRatingMatrix
+from similarity import similarity_scores
+
+
+@instrumented()
+def similar_users(user_id, matrix, k=5, approximate=False, index=None, metric='cosine'):
+
+    # Find similar users to the given user based on cosine (or another) similarity.
+
+    # Parameters:
+    # - user_id (int): The target user ID.
+    # - matrix (pd.DataFrame, SparseRatingMatrix or ShardedRatingMatrix): The rating matrix.
+    # - k (int): Number of similar users to retrieve.
+    # - approximate (bool): Use an LSH index instead of brute force (SparseRatingMatrix only).
+    # - index (LSHIndex or UserClusterIndex, optional): Index to query; a default LSH index is built and cached if omitted.
+    # - metric (str): 'cosine', 'pearson' (mean-centered) or 'jaccard' (co-rated sets), see similarity.METRICS.
+
+    # Returns:
+    # - List of similar user indices.
+    # - List of (user_index, similarity_score) tuples.
+
+    if approximate:
+        if not isinstance(matrix, SparseRatingMatrix):
+            raise TypeError("approximate=True requires a SparseRatingMatrix.")
+        if metric != 'cosine':
+            raise ValueError("approximate=True only supports metric='cosine'.")
+        return _similar_users_approximate(user_id, matrix, k, index)
+
+    if isinstance(matrix, pd.DataFrame) and metric != 'cosine':
+        # The other metrics are only implemented on the sparse ratings
+        matrix = SparseRatingMatrix.from_dense(matrix)
+
+    if isinstance(matrix, SparseRatingMatrix):
+        return _similar_users_sparse(user_id, matrix, k, metric)
+
+    if isinstance(matrix, ShardedRatingMatrix):
+        return _similar_users_sharded(user_id, matrix, k, metric)
+
+    # Check if the user has any ratings
+    if user_id not in matrix.index:
+        print(f"User {user_id} has no ratings.")
+        return [], []
+
+    user = matrix.loc[matrix.index == user_id]
+    other_users = matrix.loc[matrix.index != user_id]
+
+    # Check if the other_users DataFrame is not empty
+    if other_users.empty:
+        print("No other users with ratings.")
+        return [], []
+
+    from sklearn.metrics.pairwise import cosine_similarity
+
+    with span('cosine_similarity'):
+        similarities = cosine_similarity(user, other_users)[0].tolist()
+    with span('sort'):
+        indices = other_users.index.tolist()
+        index_similarity = dict(zip(indices, similarities))
+        index_similarity_sorted = sorted(index_similarity.items(), key=operator.itemgetter(1), reverse=True)
+    top_users_similarities = index_similarity_sorted[:k]
+    users = [u[0] for u in top_users_similarities]
+
+    return users, top_users_similarities
+
+
+def _similar_users_sparse(user_id, matrix, k, metric='cosine'):
+    # Same contract as similar_users, computed on the CSR rows
+    position = matrix.user_position(user_id)
+    if position is None:
+        print(f"User {user_id} has no ratings.")
+        return [], []
+
+    if matrix.shape[0] < 2:
+        print("No other users with ratings.")
+        return [], []
+
+    # One sparse product against the raw ratings (or their cached centered / rated-pattern copies)
+    with span('cosine_similarity', metric=metric):
+        similarities = similarity_scores(matrix, matrix.user_row(position).toarray(), metric)[0]
+        similarities[position] = -np.inf
+
+    # Stable sort keeps ties in ascending user ID order, like the dict/sorted path
+    k = min(k, matrix.shape[0] - 1)
+    with span('sort'):
+        top = np.argsort(-similarities, kind='stable')[:k]
+    top_users_similarities = [(matrix.user_ids[i].item(), float(similarities[i])) for i in top]
+    users = [u[0] for u in top_users_similarities]
+
+    return users, top_users_similarities
+
+
+def _similar_users_sharded(user_id, matrix, k, metric='cosine'):
+    # Same contract as similar_users, streamed over the on-disk shards
+    position = matrix.user_position(user_id)
+    if position is None:
+        print(f"User {user_id} has no ratings.")
+        return [], []
+
+    if matrix.shape[0] < 2:
+        print("No other users with ratings.")
+        return [], []
+
+    with span('cosine_similarity', metric=metric):
+        positions, similarities = matrix.neighbor_positions([position], k=k, metric=metric)
+    valid = positions[0] >= 0
+    top_users_similarities = [
+        (matrix.user_ids[i].item(), float(s)) for i, s in zip(positions[0][valid], similarities[0][valid])
+    ]
+    users = [u[0] for u in top_users_similarities]
+
+    return users, top_users_similarities
+
+
+def _similar_users_approximate(user_id, matrix, k, index):
+    # Same contract as similar_users, answered from an LSH index
+    position = matrix.user_position(user_id)
+    if position is None:
+        print(f"User {user_id} has no ratings.")
+        return [], []
+
+    if index is None:
+        index = default_index(matrix)
+
+    positions, similarities = index.query(position, k=k)
+    top_users_similarities = [(matrix.user_ids[i].item(), float(s)) for i, s in zip(positions, similarities)]
+    users = [u[0] for u in top_users_similarities]
+
+    return users, top_users_similarities
+
+
+def neighbor_scores(matrix, user_position, neighbor_rows, weights=None):
+
+    # Score every anime for one user from the ratings of its neighbors.
+
+    # Parameters:
+    # - matrix (SparseRatingMatrix): The rating matrix.
+    # - user_position (int or None): Row position of the target user (None if unknown).
+    # - neighbor_rows (np.ndarray): Row positions of the similar users.
+    # - weights (np.ndarray, optional): Per-neighbor weights such as similarity scores;
+    #   the default is the plain mean used by recommend_item.
+
+    # Returns:
+    # - np.ndarray: (n_anime,) float32 scores, -inf for anime the target user has rated.
+
+    neighbor_rows = np.asarray(neighbor_rows, dtype=np.intp)
+    if len(neighbor_rows) == 0:
+        scores = np.zeros(matrix.shape[1], dtype=np.float32)
+    else:
+        if weights is None:
+            weights = np.ones(len(neighbor_rows), dtype=np.float64)
+        weights = np.asarray(weights, dtype=np.float64)
+        total = weights.sum()
+
+        # Gather the k neighbor rows and combine them with a single (n_anime x k) x (k,) product;
+        # the weighted sum is divided by the total in float64, as neighbor_mean_scores does
+        scores = np.asarray(matrix.csr[neighbor_rows].T @ weights, dtype=np.float64).ravel()
+        if total > 0:
+            scores /= total
+        scores = scores.astype(np.float32)
+
+    if user_position is not None:
+        scores[matrix.seen_items(user_position)] = -np.inf
+    return scores
+
+
+def _filter_mask(anime_ids, anime_data, filters):
+    # Boolean mask of the anime IDs passing the type / genre filters
+    if anime_data is None:
+        raise ValueError("anime_data is required to apply filters.")
+    return anime_index_for(anime_data).mask_for(anime_ids, filters)
+
+
+def _recommend_sparse(user_index, similar_user_indices, matrix, items, anime_data, weights, filters=None, with_type=False):
+    # Top-N recommendations from the NumPy scoring core, without sorting every candidate
+    position = matrix.user_position(int(user_index))
+    rows, found = matrix.lookup_users(similar_user_indices)
+    if weights is not None:
+        weights = np.asarray(weights, dtype=np.float32).ravel()[found]
+    with span('score'):
+        scores = neighbor_scores(matrix, position, rows[found], weights)
+
+    # Filters are applied as a mask before top-k selection, so N filtered items come back in one pass
+    if filters:
+        with span('filter'):
+            scores[~_filter_mask(matrix.anime_ids, anime_data, filters)] = -np.inf
+
+    with span('top_n'):
+        top = top_k_rows(scores[None, :], min(items, len(scores)))[0]
+        top = top[np.isfinite(scores[top])]
+    anime_ids = matrix.anime_ids[top]
+    recommendations = pd.Series(scores[top], index=pd.Index(anime_ids, name='anime_id'))
+    top_n_anime_indices = anime_ids.tolist()
+
+    # Names come from a prebuilt id -> name array instead of a merge
+    if anime_data is not None:
+        recommendations_with_names = pd.DataFrame({
+            'mean_rating': scores[top],
+            'anime_id': anime_ids,
+            'name': anime_index_for(anime_data).names_for(anime_ids),
+        })
+        if with_type:
+            recommendations_with_names['type'] = anime_index_for(anime_data).types_for(anime_ids)
+        return recommendations_with_names, top_n_anime_indices
+    return recommendations, top_n_anime_indices
+
+
+def neighbor_mean_scores(matrix, rows, neighbors):
+
+    # Score every anime for a block of users as the mean rating of their neighbors.
+
+    # Parameters:
+    # - matrix (SparseRatingMatrix): The rating matrix.
+    # - rows (np.ndarray): (b,) row positions of the target users.
+    # - neighbors (np.ndarray): (b, k) neighbor row positions, -1 for padding.
+
+    # Returns:
+    # - np.ndarray: (b, n_anime) mean ratings, -inf for anime the target user has rated.
+
+    rows = np.asarray(rows, dtype=np.intp)
+    neighbors = np.asarray(neighbors)
+    valid = neighbors >= 0
+    counts = np.maximum(valid.sum(axis=1), 1)
+
+    # Sparse (b x n_users) selection operator sums the neighbor rows in one product;
+    # the sums are exact in float64 and divided by the neighbor counts before the cast
+    weights = sparse.csr_matrix(
+        (np.ones(valid.sum(), dtype=np.float64), (np.nonzero(valid)[0], neighbors[valid])),
+        shape=(len(rows), matrix.shape[0]),
+    )
+    totals = np.asarray((weights @ matrix.csr).todense(), dtype=np.float64)
+    scores = (totals / counts[:, None]).astype(np.float32)
+
+    seen = matrix.csr[rows]
+    scores[np.repeat(np.arange(len(rows)), np.diff(seen.indptr)), seen.indices] = -np.inf
+    return scores
+
+
+@instrumented()
+def recommend_item(user_index, similar_user_indices, matrix, items=5, anime_data=None, weights=None, filters=None):
+
+    # Generate item recommendations for a given user based on similar users' ratings.
+
+    # Parameters:
+    # - user_index (int): Index of the target user.
+    # - similar_user_indices (list): List of indices of similar users.
+    # - matrix (pd.DataFrame or SparseRatingMatrix): The rating matrix.
+    # - items (int): Number of items to recommend.
+    # - anime_data (pd.DataFrame or AnimeIndex): Anime information used to attach names.
+    # - weights (list, optional): Per-similar-user weights (e.g. similarity scores), SparseRatingMatrix only.
+    # - filters (dict, optional): Type / genre filters, see AnimeIndex.mask (requires anime_data).
+
+    # Returns:
+    # - pd.Series: Series containing mean ratings of similar users for unseen items
+    #   (only the top N for a SparseRatingMatrix).
+    # - list: List of top N recommended item indices.
+
+    if isinstance(matrix, SparseRatingMatrix):
+        return _recommend_sparse(user_index, similar_user_indices, matrix, items, anime_data, weights, filters)
+
+    # Get ratings of similar users
+    similar_users = matrix[matrix.index.isin(similar_user_indices)]
+    similar_users_mean = similar_users.mean(axis=0)
+
+    # Ensure the user_index is converted to integer (if needed)
+    user_index = int(user_index)
+
+    # Filter ratings of unseen animes from similar users directly in the mean calculation
+    similar_users_ratings = similar_users_mean[similar_users_mean.index.isin(matrix.loc[user_index][matrix.loc[user_index] == 0].index)]
+
+    if filters:
+        similar_users_ratings = similar_users_ratings[_filter_mask(similar_users_ratings.index, anime_data, filters)]
+
+    # Sort by mean rating in descending order
+    with span('sort'):
+        similar_users_ratings_sorted = similar_users_ratings.sort_values(ascending=False)
+
+    # Get top N recommendations
+    top_n_anime_indices = similar_users_ratings_sorted.head(items).index.tolist()
+
+    # If anime_data is provided, add anime names to the recommendations
+    if anime_data is not None:
+        with span('merge'):
+            recommendations_with_names = pd.merge(
+                pd.DataFrame({'mean_rating': similar_users_ratings_sorted}),
+                anime_data[['anime_id', 'name']],
+                left_index=True,
+                right_on='anime_id'
+            )
+        return recommendations_with_names, top_n_anime_indices
+    else:
+        return similar_users_ratings_sorted, top_n_anime_indices
+
+
+@instrumented()
+def recommend_movie(user_index, similar_user_indices, matrix, items=5, anime_data=None):
+    # Generate item recommendations for a given user based on similar users' ratings.
+
+    # Parameters:
+    # - user_index (int): Index of the target user.
+    # - similar_user_indices (list): List of indices of similar users.
+    # - matrix (pd.DataFrame or SparseRatingMatrix): The rating matrix.
+    # - items (int): Number of items to recommend.
+    # - anime_data (pd.DataFrame): Dataframe containing anime information.
+
+    # Returns:
+    # - pd.DataFrame: DataFrame containing mean ratings of similar users for unseen 'Movie' items with names.
+    # - list: List of top N recommended 'Movie' item indices.
+
+    if isinstance(matrix, SparseRatingMatrix):
+        # Without anime_data the type is unknown, so nothing can be filtered
+        filters = {'type': {'Movie'}} if anime_data is not None else None
+        return _recommend_sparse(user_index, similar_user_indices, matrix, items, anime_data, None, filters, with_type=True)
+
+    # Get ratings of similar users
+    similar_users = matrix[matrix.index.isin(similar_user_indices)]
+    similar_users_mean = similar_users.mean(axis=0)
+
+    # Ensure the user_index is converted to integer (if needed)
+    user_index = int(user_index)
+
+    # Filter ratings of unseen 'Movie' animes from similar users directly in the mean calculation
+    unseen_movies = matrix.loc[user_index][matrix.loc[user_index] == 0].index
+    similar_users_ratings = similar_users_mean[unseen_movies]
+
+    # Sort by mean rating in descending order
+    similar_users_ratings_sorted = similar_users_ratings.sort_values(ascending=False)
+
+    # Get top N recommendations
+    top_n_movie_indices = similar_users_ratings_sorted.head(items).index.tolist()
+
+    # If anime_data is provided, add 'Movie' names to the recommendations
+    if anime_data is not None:
+        recommendations_with_names = pd.merge(
+            pd.DataFrame({'mean_rating': similar_users_ratings_sorted}),
+            anime_data[['anime_id', 'name', 'type']],
+            left_index=True,
+            right_on='anime_id'
+        )
+        recommendations_movies = recommendations_with_names[recommendations_with_names['type'] == 'Movie']
+        top_n_movie_indices = recommendations_movies['anime_id'].head(items).tolist()
+        return recommendations_movies, top_n_movie_indices
+    else:
+        return similar_users_ratings_sorted, top_n_movie_indices
+
+
+def recommend_rows(matrix, rows, k=5, items=10, mask=None, metric='cosine', block_size=512):
+    # Top-N recommendations for row positions as stacked arrays, scored block_size rows at a time.
+
+    # Parameters:
+    # - matrix (SparseRatingMatrix): The rating matrix.
+    # - rows (np.ndarray): Row positions of the users.
+    # - k (int): Number of similar users per user.
+    # - items (int): Number of recommendations per user.
+    # - mask (np.ndarray, optional): Boolean mask over the matrix columns of the anime allowed by the filters.
+    # - metric (str): Similarity metric for the neighbor search, see similarity.METRICS.
+    # - block_size (int): Rows scored together; peak memory is about block_size x (n_users + n_anime) floats.
+
+    # Returns:
+    # - np.ndarray: (len(rows), items) int32 anime IDs, -1 for padding.
+    # - np.ndarray: (len(rows), items) float32 mean ratings, NaN for padding.
+
+    rows = np.asarray(rows, dtype=np.intp)
+    width = min(items, matrix.shape[1])
+    anime_ids = np.full((len(rows), items), -1, dtype=np.int32)
+    scores = np.full((len(rows), items), np.nan, dtype=np.float32)
+
+    for start in range(0, len(rows), block_size):
+        block = rows[start:start + block_size]
+        neighbors, _ = neighbor_positions(matrix, block, k=k, block_size=len(block), metric=metric)
+        block_scores = neighbor_mean_scores(matrix, block, neighbors)
+        if mask is not None:
+            block_scores[:, ~mask] = -np.inf
+
+        top = top_k_rows(block_scores, width)
+        top_scores = np.take_along_axis(block_scores, top, axis=1)
+        valid = np.isfinite(top_scores)
+        anime_ids[start:start + len(block), :width] = np.where(valid, matrix.anime_ids[top], -1)
+        scores[start:start + len(block), :width] = np.where(valid, top_scores, np.nan)
+    return anime_ids, scores
+
+
+@instrumented()
+def recommend_batch(user_ids, matrix, k=5, items=5, anime_data=None, filters=None, names=False, block_size=512,
+                    metric='cosine'):
+
+    # Generate item recommendations for many users at once, without a DataFrame per user.
+
+    # Neighbor search, neighbor averaging, seen-masking, filtering and top-N selection
+    # run as stacked array operations over blocks of users, like recommend_item's
+    # scoring on a SparseRatingMatrix but one product per block instead of per user.
+
+    # Parameters:
+    # - user_ids (array-like): Target user IDs.
+    # - matrix (SparseRatingMatrix): The rating matrix.
+    # - k (int): Number of similar users per user.
+    # - items (int): Number of items to recommend per user.
+    # - anime_data (pd.DataFrame or AnimeIndex, optional): Anime information, needed for filters and names.
+    # - filters (dict, optional): Type / genre filters, see AnimeIndex.mask.
+    # - names (bool): Also return the anime names.
+    # - block_size (int): Users scored together; peak memory is about block_size x (n_users + n_anime) floats.
+    # - metric (str): Similarity metric for the neighbor search, see similarity.METRICS.
+
+    # Returns:
+    # - np.ndarray: (B, items) int32 anime IDs, -1 for padding and for unknown users.
+    # - np.ndarray: (B, items) float32 mean ratings of the similar users, NaN for padding.
+    # - np.ndarray: (B, items) anime names (None for padding), only if names=True.
+
+    if not isinstance(matrix, SparseRatingMatrix):
+        raise TypeError("recommend_batch requires a SparseRatingMatrix.")
+    if names and anime_data is None:
+        raise ValueError("anime_data is required to attach names.")
+
+    user_ids = np.asarray(user_ids).ravel()
+    anime_ids = np.full((len(user_ids), items), -1, dtype=np.int32)
+    scores = np.full((len(user_ids), items), np.nan, dtype=np.float32)
+
+    # The filter mask is built once and shared by every block
+    mask = _filter_mask(matrix.anime_ids, anime_data, filters) if filters else None
+
+    positions, found = matrix.lookup_users(user_ids)
+    known = np.nonzero(found)[0]
+    for start in range(0, len(known), block_size):
+        block = known[start:start + block_size]
+        with span('score', users=len(block)):
+            anime_ids[block], scores[block] = recommend_rows(
+                matrix, positions[block], k, items, mask, metric, block_size
+            )
+
+    if not names:
+        return anime_ids, scores
+    with span('names'):
+        anime_names = anime_index_for(anime_data).names_for(anime_ids.ravel()).reshape(anime_ids.shape)
+    return anime_ids, scores, anime_names
@@ -0,0 +1,351 @@
+# Import libraries for the asyncio HTTP server and command-line use
+import argparse
+import asyncio
+import json
+import sys
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+# Import numerical computation libraries
+import numpy as np
+
+from anime_index import FILTER_KEYS
+from cold_start import COLD_START_RATINGS
+from neighbors import neighbor_positions, top_k_rows
+from recommender import neighbor_mean_scores
+
+
+class MicroBatcher:
+    # Collects concurrent requests for a short window and handles them in one call.
+    #
+    # Requests that queued while the previous batch was scored are taken at once,
+    # then the batch stays open for `window` seconds (up to max_batch requests)
+    # before it is passed to handle_batch, which runs in a worker thread so the
+    # event loop keeps accepting connections.
+
+    def __init__(self, handle_batch, window=0.002, max_batch=256):
+        self.handle_batch = handle_batch
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.requests = 0
+        self._queue = None
+        self._task = None
+
+    async def submit(self, payload):
+        # Queue one request and wait for its result (or exception)
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((payload, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.window
+
+            # Requests that queued up while the previous batch was scored join without waiting
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            self.batches += 1
+            self.requests += len(batch)
+            try:
+                results = await loop.run_in_executor(None, self.handle_batch, [payload for payload, _ in batch])
+            except Exception as error:
+                results = [error] * len(batch)
+
+            for (_, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+class RecommendationService:
+    # Batched similar-user and recommendation scoring behind the HTTP endpoints.
+    #
+    # Every batch of requests is answered with one blocked similarity product
+    # (neighbor_positions) and, for /recommend, one neighbor-averaging product
+    # (neighbor_mean_scores), instead of one similar_users / recommend_item call per request.
+    # With a cold_start ranking, /recommend answers unknown users and users with fewer than
+    # COLD_START_RATINGS ratings from it (marked 'fallback': True) instead of failing.
+
+    def __init__(self, matrix, anime_index, window=0.002, max_batch=256, cold_start=None):
+        self.matrix = matrix
+        self.anime_index = anime_index
+        self.cold_start = cold_start
+        self.similar_users_batcher = MicroBatcher(self.similar_users_batch, window, max_batch)
+        self.recommend_batcher = MicroBatcher(self.recommend_batch, window, max_batch)
+        self._masks = {}
+
+    def _positions(self, requests):
+        # Row positions of the requested users; unknown users get a KeyError result
+        positions, found = self.matrix.lookup_users([request['user_id'] for request in requests])
+        errors = [None if ok else KeyError(f"User {request['user_id']} has no ratings.")
+                  for request, ok in zip(requests, found)]
+        return positions, found, errors
+
+    def similar_users_batch(self, requests):
+        # requests: dicts with user_id and k. Returns one result dict (or exception) per request
+        positions, found, results = self._positions(requests)
+        rows = positions[found]
+        if len(rows):
+            k = max(request['k'] for request in requests)
+            neighbors, similarities = neighbor_positions(self.matrix, rows, k=k, block_size=len(rows))
+            for i, j in enumerate(np.nonzero(found)[0]):
+                valid = neighbors[i, :requests[j]['k']] >= 0
+                results[j] = {
+                    'user_id': int(requests[j]['user_id']),
+                    'similar_users': [
+                        {'user_id': int(user_id), 'similarity': float(similarity)}
+                        for user_id, similarity in zip(
+                            self.matrix.user_ids[neighbors[i, :requests[j]['k']][valid]],
+                            similarities[i, :requests[j]['k']][valid],
+                        )
+                    ],
+                }
+        return results
+
+    def _mask(self, filters):
+        # Allowed-anime mask for a filter set, cached per distinct filter combination
+        key = tuple(sorted((name, tuple(sorted(values))) for name, values in filters.items()))
+        if key not in self._masks:
+            self._masks[key] = self.anime_index.mask_for(self.matrix.anime_ids, filters)
+        return self._masks[key]
+
+    def _fallback(self, request, exclude):
+        # Cold-start result for one request
+        anime_ids, scores = self.cold_start.top(request['items'], request['filters'], exclude=exclude)
+        return {
+            'user_id': int(request['user_id']),
+            'fallback': True,
+            'recommendations': [
+                {'anime_id': int(anime_id), 'name': name, 'weighted_rating': float(score)}
+                for anime_id, name, score in zip(anime_ids, self.cold_start.anime_index.names_for(anime_ids), scores)
+            ],
+        }
+
+    def recommend_batch(self, requests):
+        # requests: dicts with user_id, k, items and filters. Returns one result dict (or exception) per request
+        positions, found, results = self._positions(requests)
+
+        # Filter masks are built per request first, so a bad filter only fails its own request
+        masks = [None] * len(requests)
+        for j in np.nonzero(found)[0]:
+            if requests[j]['filters']:
+                try:
+                    masks[j] = self._mask(requests[j]['filters'])
+                except ValueError as error:
+                    results[j] = error
+                    found[j] = False
+
+        if self.cold_start is not None:
+            counts = np.diff(self.matrix.csr.indptr)[positions]
+            for j in np.nonzero(~found | (counts < COLD_START_RATINGS))[0]:
+                if isinstance(results[j], ValueError):
+                    continue
+                seen = self.matrix.seen_items(positions[j]) if found[j] else []
+                try:
+                    results[j] = self._fallback(requests[j], self.matrix.anime_ids[seen])
+                except ValueError as error:
+                    results[j] = error
+            found &= counts >= COLD_START_RATINGS
+        known = np.nonzero(found)[0]
+        if len(known) == 0:
+            return results
+
+        rows = positions[known]
+        ks = np.array([requests[j]['k'] for j in known])
+        neighbors, _ = neighbor_positions(self.matrix, rows, k=ks.max(), block_size=len(rows))
+        neighbors[np.arange(neighbors.shape[1])[None, :] >= ks[:, None]] = -1
+        scores = neighbor_mean_scores(self.matrix, rows, neighbors)
+
+        # Filter masks (cached per combination) are applied per row before one top-k over the whole block
+        for i, j in enumerate(known):
+            if masks[j] is not None:
+                scores[i, ~masks[j]] = -np.inf
+        width = min(max(requests[j]['items'] for j in known), scores.shape[1])
+        top = top_k_rows(scores, width)
+        top_scores = np.take_along_axis(scores, top, axis=1)
+
+        for i, j in enumerate(known):
+            items = requests[j]['items']
+            valid = np.isfinite(top_scores[i, :items])
+            anime_ids = self.matrix.anime_ids[top[i, :items][valid]]
+            names = self.anime_index.names_for(anime_ids) if self.anime_index is not None else [None] * len(anime_ids)
+            results[j] = {
+                'user_id': int(requests[j]['user_id']),
+                'recommendations': [
+                    {'anime_id': int(anime_id), 'name': name, 'mean_rating': float(score)}
+                    for anime_id, name, score in zip(anime_ids, names, top_scores[i, :items][valid])
+                ],
+            }
+        return results
+
+
+def _parse_request(params, endpoint, anime_index=None):
+    # Validate query / JSON parameters into a request dict; raises ValueError on bad input
+    # (including type / genre names that anime_index does not know)
+    def single(name, default=None):
+        value = params.get(name, default)
+        if isinstance(value, list):
+            # Query strings give lists; JSON bodies may too
+            value = value[0] if value else None
+        if value is None:
+            raise ValueError(f"Missing parameter: {name}")
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Parameter {name} must be an integer") from None
+
+    request = {'user_id': single('user_id'), 'k': single('k', 5)}
+    if not 0 < request['k'] <= 1000:
+        raise ValueError("k must be between 1 and 1000")
+    if endpoint == '/recommend':
+        request['items'] = single('items', 5)
+        if not 0 < request['items'] <= 1000:
+            raise ValueError("items must be between 1 and 1000")
+        filters = {}
+        for name in FILTER_KEYS:
+            values = params.get(name)
+            if values is not None and not isinstance(values, list):
+                values = [values]
+            values = [part for value in values or [] for part in str(value).split(',') if part]
+            if values:
+                filters[name] = set(values)
+        if filters and anime_index is None:
+            raise ValueError("Filters need anime data, which is not loaded.")
+        if filters:
+            unknown = set(filters.get('type', ())) - set(anime_index.type_names)
+            if unknown:
+                raise ValueError(f"Unknown types: {sorted(unknown)}")
+            unknown = (filters.get('genres_all', set()) | filters.get('genres_any', set())) - set(anime_index.genre_names)
+            if unknown:
+                raise ValueError(f"Unknown genres: {sorted(unknown)}")
+        request['filters'] = filters
+    return request
+
+
+class RecommendationServer:
+    # Minimal HTTP/1.1 JSON server (keep-alive, GET query strings or POST JSON bodies) on asyncio streams.
+    #
+    # Endpoints:
+    # - GET /similar_users?user_id=...&k=5
+    # - GET /recommend?user_id=...&k=5&items=5&type=Movie&genres_all=Action,Comedy&genres_any=...
+    # - GET /stats (batching counters)
+
+    def __init__(self, service):
+        self.service = service
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        if url.path == '/stats':
+            return HTTPStatus.OK, {
+                name: {'batches': batcher.batches, 'requests': batcher.requests}
+                for name, batcher in (('similar_users', self.service.similar_users_batcher),
+                                      ('recommend', self.service.recommend_batcher))
+            }
+        if url.path not in ('/similar_users', '/recommend'):
+            return HTTPStatus.NOT_FOUND, {'error': f"Unknown endpoint {url.path}"}
+        if method not in ('GET', 'POST'):
+            return HTTPStatus.METHOD_NOT_ALLOWED, {'error': f"Method {method} not allowed"}
+
+        try:
+            params = parse_qs(url.query)
+            if body:
+                data = json.loads(body)
+                if not isinstance(data, dict):
+                    raise ValueError("JSON body must be an object.")
+                params.update(data)
+            request = _parse_request(params, url.path, self.service.anime_index)
+        except ValueError as error:
+            return HTTPStatus.BAD_REQUEST, {'error': str(error)}
+
+        batcher = self.service.similar_users_batcher if url.path == '/similar_users' else self.service.recommend_batcher
+        try:
+            return HTTPStatus.OK, await batcher.submit(request)
+        except KeyError as error:
+            return HTTPStatus.NOT_FOUND, {'error': error.args[0]}
+        except ValueError as error:
+            return HTTPStatus.BAD_REQUEST, {'error': str(error)}
+        except Exception as error:
+            # Anything else failed inside the batch: answer it, so the keep-alive connection stays usable
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f"{type(error).__name__}: {error}"}
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                status, payload = await self.dispatch(method, target, body)
+                data = json.dumps(payload).encode()
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                writer.write(
+                    f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                    f"Content-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8000):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Serving on http://{host}:{port}", flush=True)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    from serving import ARTIFACTS_DIR, load_models
+
+    parser = argparse.ArgumentParser(description="Local HTTP recommendation service with request micro-batching.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--window-ms', type=float, default=2.0, help="Batching window after the first request")
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--artifacts', default=ARTIFACTS_DIR, help="Exported serving artifacts (see serving.py)")
+    args = parser.parse_args()
+
+    _, anime_index, rating_matrix, _, cold_start = load_models(args.artifacts)
+    if rating_matrix is None:
+        sys.exit("No serving artifacts or Datasets/rating.csv found.")
+
+    service = RecommendationService(
+        rating_matrix, anime_index, window=args.window_ms / 1000, max_batch=args.max_batch, cold_start=cold_start
+    )
+    asyncio.run(RecommendationServer(service).serve(args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,242 @@
+# Import libraries for file handling, timing and command-line use
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Import numerical computation libraries
+import numpy as np
+
+from anime_index import AnimeIndex
+from cold_start import COLD_START_RATINGS, ColdStartRanking
+from rating_matrix import SparseRatingMatrix
+from recommendation_store import RecommendationStore
+from recommender import recommend_item, similar_users
+from user_clusters import CLUSTERS_PATH, UserClusterIndex
+
+ARTIFACTS_DIR = 'serving_artifacts'
+STORE_DIR = 'recommendation_store'
+ARTIFACTS_VERSION = 1
+
+# Run in a fresh interpreter by measure_startup: time the imports and load_models separately
+_STARTUP_CODE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import serving
+imported = time.perf_counter()
+serving.load_models(*sys.argv[1:])
+loaded = time.perf_counter()
+print(json.dumps({'import_s': imported - start, 'load_s': loaded - imported,
+                  'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+"""
+
+
+def export_artifacts(matrix, path=ARTIFACTS_DIR, anime_index=None, cold_start=None):
+    # Write the serving artifacts: the rating matrix as mmap-able .npy arrays, the anime index and the
+    # cold-start ranking as .npz.
+
+    # Parameters:
+    # - matrix (SparseRatingMatrix): The (filtered) rating matrix to serve from.
+    # - path (str): Output directory.
+    # - anime_index (AnimeIndex, optional): Anime names and filter attributes.
+    # - cold_start (ColdStartRanking, optional): Fallback ranking for unknown users (needs anime_index).
+
+    os.makedirs(path, exist_ok=True)
+    matrix.save(os.path.join(path, 'matrix'))
+    if anime_index is not None:
+        anime_index.save(os.path.join(path, 'anime_index.npz'))
+        if cold_start is not None:
+            cold_start.save(os.path.join(path, 'cold_start.npz'))
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump({'version': ARTIFACTS_VERSION, 'n_users': matrix.shape[0], 'n_anime': matrix.shape[1],
+                   'ratings': int(matrix.nnz)}, f)
+
+
+def load_artifacts(path=ARTIFACTS_DIR, mmap=True):
+    # Open artifacts written by export_artifacts.
+
+    # Parameters:
+    # - path (str): Artifact directory.
+    # - mmap (bool): Memory-map the matrix arrays instead of reading them.
+
+    # Returns:
+    # - SparseRatingMatrix: The rating matrix.
+    # - AnimeIndex or None: The anime index, if one was exported.
+    # - ColdStartRanking or None: The cold-start ranking, if one was exported.
+
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    if meta['version'] != ARTIFACTS_VERSION:
+        raise ValueError(f"Unsupported serving artifacts version {meta['version']}.")
+
+    matrix = SparseRatingMatrix.load(os.path.join(path, 'matrix'), mmap=mmap)
+    index_path = os.path.join(path, 'anime_index.npz')
+    anime_index = AnimeIndex.load(index_path) if os.path.exists(index_path) else None
+    cold_start_path = os.path.join(path, 'cold_start.npz')
+    cold_start = None
+    if anime_index is not None and os.path.exists(cold_start_path):
+        cold_start = ColdStartRanking.load(cold_start_path, anime_index)
+    return matrix, anime_index, cold_start
+
+
+def _load_from_csv():
+    # Fallback when no artifacts were exported: parse the CSVs and build the matrix (slow)
+    from data_loader import filter_ratings, load_animes, load_compact_ratings
+
+    try:
+        animes = load_animes()
+        anime_index = AnimeIndex.from_frame(animes)
+        cold_start = ColdStartRanking.build(animes, anime_index)
+    except FileNotFoundError:
+        anime_index, cold_start = None, None
+    try:
+        matrix = SparseRatingMatrix.from_ratings(filter_ratings(load_compact_ratings()))
+    except FileNotFoundError:
+        matrix = None
+    return matrix, anime_index, cold_start
+
+
+def load_models(artifacts=ARTIFACTS_DIR, store_path=STORE_DIR, clusters_path=CLUSTERS_PATH):
+    # Everything app.py needs to answer requests, loaded from precomputed files where they exist.
+
+    # Parameters:
+    # - artifacts (str): Directory written by export_artifacts; the CSVs are parsed if it is missing.
+    # - store_path (str): Recommendation store directory (see recommendation_store.py).
+    # - clusters_path (str): Saved UserClusterIndex (see user_clusters.py).
+
+    # Returns:
+    # - RecommendationStore or None: Precomputed recommendations.
+    # - AnimeIndex or None: Anime names and filter attributes.
+    # - SparseRatingMatrix or None: Rating matrix for live recommendations.
+    # - UserClusterIndex or None: Cluster index for pruned neighbor search.
+    # - ColdStartRanking or None: Fallback ranking for unknown or sparse users.
+
+    try:
+        store = RecommendationStore(store_path)
+    except FileNotFoundError:
+        store = None
+
+    try:
+        rating_matrix, anime_index, cold_start = load_artifacts(artifacts)
+    except FileNotFoundError:
+        rating_matrix, anime_index, cold_start = _load_from_csv()
+
+    clusters = None
+    if rating_matrix is not None:
+        try:
+            clusters = UserClusterIndex.load(clusters_path, rating_matrix)
+        except (FileNotFoundError, ValueError):
+            # Missing or built for other data: fall back to the exact neighbor search
+            clusters = None
+
+    return store, anime_index, rating_matrix, clusters, cold_start
+
+
+def _cold_start_exclude(store, rating_matrix, user_id):
+    # Anime IDs a user has rated if the user has too few ratings for neighbor search, else None
+    if rating_matrix is None:
+        # Only the store is loaded: it holds every user with ratings
+        return None if store is None or user_id in store else np.empty(0, dtype=np.int32)
+    position = rating_matrix.user_position(user_id)
+    if position is None:
+        return np.empty(0, dtype=rating_matrix.anime_ids.dtype)
+    seen = rating_matrix.seen_items(position)
+    return rating_matrix.anime_ids[seen] if len(seen) < COLD_START_RATINGS else None
+
+
+def recommend(models, user_id, k, items, filters):
+    # Recommendations for one request, served from the store when it can answer it.
+    # Unknown users and users with fewer than COLD_START_RATINGS ratings get the cold-start
+    # ranking (columns anime_id, name, weighted_rating) when one is loaded.
+
+    # Parameters:
+    # - models (tuple): The (store, anime_index, rating_matrix, clusters, cold_start) returned by load_models.
+    # - user_id (int): The target user ID.
+    # - k (int): Number of similar users.
+    # - items (int): Number of recommendations.
+    # - filters (dict): Type / genre filters, see AnimeIndex.mask.
+
+    # Returns:
+    # - pd.DataFrame or None: Recommendations (empty for unknown users without a cold-start ranking);
+    #   None if only the store is available and it cannot answer the request.
+
+    store, anime_index, rating_matrix, clusters, cold_start = models
+    if cold_start is not None:
+        exclude = _cold_start_exclude(store, rating_matrix, user_id)
+        if exclude is not None:
+            return cold_start.recommendations(items, filters, exclude=exclude)
+    if store is not None and not filters and k == store.meta['k'] and items <= store.items:
+        return store.recommendations(user_id, items)
+    if rating_matrix is None:
+        return None
+    similar_user_indices, _ = similar_users(
+        user_id, rating_matrix, k=k, approximate=clusters is not None, index=clusters
+    )
+    recommendations, _ = recommend_item(
+        user_id, similar_user_indices, rating_matrix, items=items, anime_data=anime_index, filters=filters
+    )
+    return recommendations
+
+
+def measure_startup(artifacts=ARTIFACTS_DIR, store_path=STORE_DIR, clusters_path=CLUSTERS_PATH, runs=5):
+    # Cold-start time of the serving path, each run in a fresh interpreter.
+
+    # Parameters:
+    # - artifacts, store_path, clusters_path (str): Passed to load_models.
+    # - runs (int): Interpreter launches.
+
+    # Returns:
+    # - list of dict: Per run, total_s (process launch to exit), import_s, load_s and peak rss_mb.
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [here, os.environ.get('PYTHONPATH')])))
+    paths = [os.path.abspath(p) for p in (artifacts, store_path, clusters_path)]
+
+    results = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', _STARTUP_CODE, *paths],
+                                capture_output=True, text=True, check=True, env=env).stdout
+        total = time.perf_counter() - start
+        results.append(dict(json.loads(output.strip().splitlines()[-1]), total_s=total))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export serving artifacts or measure serving cold-start time.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export = subparsers.add_parser('export', help="Build the rating matrix, anime index and cold-start ranking from Datasets/")
+    export.add_argument('--out', default=ARTIFACTS_DIR)
+
+    startup = subparsers.add_parser('startup', help="Time import + load_models in fresh interpreters")
+    startup.add_argument('--artifacts', default=ARTIFACTS_DIR)
+    startup.add_argument('--store', default=STORE_DIR)
+    startup.add_argument('--clusters', default=CLUSTERS_PATH)
+    startup.add_argument('--runs', type=int, default=5)
+    startup.add_argument('--out', default=None, help="Append the summary as one JSON line (to track it over time)")
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        matrix, anime_index, cold_start = _load_from_csv()
+        if matrix is None:
+            sys.exit("Datasets/rating.csv not found.")
+        export_artifacts(matrix, args.out, anime_index, cold_start)
+        print(f"Wrote serving artifacts for {matrix.shape[0]} users to {args.out}")
+        return
+
+    runs = measure_startup(args.artifacts, args.store, args.clusters, runs=args.runs)
+    summary = {name: float(np.median([run[name] for run in runs])) for name in ('total_s', 'import_s', 'load_s', 'rss_mb')}
+    print(f"startup {summary['total_s']:.3f} s (imports {summary['import_s']:.3f} s, load {summary['load_s']:.3f} s), "
+          f"peak RSS {summary['rss_mb']:.0f} MB, median of {len(runs)} runs")
+    if args.out:
+        summary.update(timestamp=time.strftime('%Y-%m-%dT%H:%M:%S%z'), runs=len(runs),
+                       artifacts=os.path.exists(os.path.join(args.artifacts, 'meta.json')))
+        with open(args.out, 'a') as f:
+            f.write(json.dumps(summary) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+# Import libraries for file handling and command-line use
+import argparse
+import json
+import os
+import shutil
+
+# Import numerical computation libraries
+import numpy as np
+
+from neighbors import top_k_rows
+from rating_matrix import CompactRatings, SparseRatingMatrix, encode_ids
+from similarity import METRICS, similarity_scores
+
+SHARDS_DIR = 'rating_shards'
+SHARDS_VERSION = 1
+
+
+def _add_counts(counts, ids):
+    # Add the per-ID counts of one chunk to a running bincount, growing it for larger IDs
+    chunk = np.bincount(ids)
+    if len(chunk) > len(counts):
+        counts = np.concatenate([counts, np.zeros(len(chunk) - len(counts), dtype=counts.dtype)])
+    counts[:len(chunk)] += chunk
+    return counts
+
+
+def _merge_top_k(positions, scores, new_positions, new_scores, k):
+    # Merge two (b, *) partial top-k lists into one (b, k); equal scores go to the lower global row
+    positions = np.concatenate([positions, new_positions], axis=1)
+    scores = np.concatenate([scores, new_scores], axis=1)
+    order = np.argsort(positions, axis=1, kind='stable')
+    positions = np.take_along_axis(positions, order, axis=1)
+    scores = np.take_along_axis(scores, order, axis=1)
+    top = top_k_rows(scores, k)
+    return np.take_along_axis(positions, top, axis=1), np.take_along_axis(scores, top, axis=1)
+
+
+class ShardedRatingMatrix:
+    # Out-of-core users x anime rating matrix stored as user-sharded CSR shards on disk.
+    #
+    # Each shard is a SparseRatingMatrix over a contiguous range of users (in user ID
+    # order) and all anime columns, written with SparseRatingMatrix.save and opened
+    # memory-mapped. Neighbor search streams over the shards one at a time and merges
+    # the partial top-k of each, so working memory is bounded by the shard size
+    # instead of the dataset size.
+    #
+    # Attributes:
+    # - path (str): Shard directory.
+    # - user_ids (np.ndarray): Sorted int32 user IDs of every shard; global row i is user_ids[i].
+    # - anime_ids (np.ndarray): Sorted int32 anime IDs, the columns of every shard.
+    # - offsets (np.ndarray): (n_shards + 1,) global rows; shard s holds rows offsets[s]:offsets[s + 1].
+
+    def __init__(self, path):
+        with open(os.path.join(path, 'meta.json')) as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != SHARDS_VERSION:
+            raise ValueError(f"Unsupported rating shards version {self.meta['version']}.")
+
+        self.path = path
+        self.user_ids = np.asarray(np.load(os.path.join(path, 'user_ids.npy'), mmap_mode='r'))
+        self.anime_ids = np.load(os.path.join(path, 'anime_ids.npy'))
+        self.offsets = np.array(self.meta['offsets'], dtype=np.int64)
+        self._shards = {}
+
+    @classmethod
+    def build(cls, chunks, path, shard_ratings=2_000_000, min_anime_ratings=1000, max_user_ratings=1000):
+        # Write filtered ratings as user-sharded CSR shards, streaming the input twice.
+
+        # Parameters:
+        # - chunks (callable): Returns a fresh iterable of (user_id, anime_id, rating) DataFrame chunks,
+        #   e.g. lambda: data_loader.iter_ratings(); it is called once per pass.
+        # - path (str): Output directory.
+        # - shard_ratings (int): Upper bound on the ratings per shard (a single heavier user gets its own shard).
+        # - min_anime_ratings, max_user_ratings (int): Popularity / activity filters, as in filter_ratings.
+
+        # Returns:
+        # - ShardedRatingMatrix: The opened shards, equal to SparseRatingMatrix.from_ratings(filter_ratings(...)).
+
+        # Pass 1: ratings per user and anime ID, for the filters and the shard boundaries
+        user_counts = np.zeros(0, dtype=np.int64)
+        anime_counts = np.zeros(0, dtype=np.int64)
+        for chunk in chunks():
+            user_counts = _add_counts(user_counts, chunk['user_id'].to_numpy())
+            anime_counts = _add_counts(anime_counts, chunk['anime_id'].to_numpy())
+        eligible = (user_counts > 0) & (user_counts <= max_user_ratings)
+        popular = anime_counts >= min_anime_ratings
+
+        # Cut the eligible users, in ID order, into ranges of at most shard_ratings ratings
+        loads = np.cumsum(np.where(eligible, user_counts, 0))
+        bounds = [0]
+        while bounds[-1] < len(loads):
+            base = loads[bounds[-1] - 1] if bounds[-1] else 0
+            stop = int(np.searchsorted(loads, base + shard_ratings, side='right'))
+            bounds.append(max(stop, bounds[-1] + 1))
+
+        # Pass 2: append each chunk's kept ratings to per-shard scratch files
+        scratch = os.path.join(path, '_scratch')
+        # Scratch files are appended to, so leftovers of an interrupted build must not survive
+        shutil.rmtree(scratch, ignore_errors=True)
+        os.makedirs(scratch)
+        try:
+            kept_anime = np.zeros(len(popular), dtype=np.int64)
+            for chunk in chunks():
+                users = chunk['user_id'].to_numpy().astype(np.int32)
+                anime = chunk['anime_id'].to_numpy().astype(np.int32)
+                keep = popular[anime] & eligible[users]
+                columns = {
+                    'user_id': users[keep],
+                    'anime_id': anime[keep],
+                    'rating': chunk['rating'].to_numpy()[keep].astype(np.float32),
+                }
+                kept_anime += np.bincount(columns['anime_id'], minlength=len(kept_anime))
+
+                shard_of = np.searchsorted(bounds, columns['user_id'], side='right') - 1
+                order = np.argsort(shard_of, kind='stable')
+                shards, starts = np.unique(shard_of[order], return_index=True)
+                for shard, lo, hi in zip(shards, starts, np.append(starts[1:], len(order))):
+                    for name, values in columns.items():
+                        with open(os.path.join(scratch, f'{shard}.{name}'), 'ab') as f:
+                            f.write(values[order[lo:hi]].tobytes())
+
+            # One SparseRatingMatrix per shard over the shared anime columns, built from its scratch files only
+            anime_ids = np.nonzero(kept_anime)[0].astype(np.int32)
+            anime_codes = np.full(len(kept_anime), -1, dtype=np.int32)
+            anime_codes[anime_ids] = np.arange(len(anime_ids), dtype=np.int32)
+
+            names, user_ids, offsets, nnz = [], [], [0], 0
+            for shard in range(len(bounds) - 1):
+                files = {name: os.path.join(scratch, f'{shard}.{name}') for name in ('user_id', 'anime_id', 'rating')}
+                if not os.path.exists(files['user_id']):
+                    continue
+                shard_users, user_codes = encode_ids(np.fromfile(files['user_id'], dtype=np.int32))
+                ratings = CompactRatings(
+                    user_codes, anime_codes[np.fromfile(files['anime_id'], dtype=np.int32)],
+                    np.fromfile(files['rating'], dtype=np.float32), shard_users, anime_ids,
+                )
+                matrix = SparseRatingMatrix.from_compact(ratings, keep_anime=True)
+                names.append(f'shard_{len(names):05d}')
+                matrix.save(os.path.join(path, names[-1]))
+                user_ids.append(matrix.user_ids)
+                offsets.append(offsets[-1] + matrix.shape[0])
+                nnz += matrix.nnz
+                for file in files.values():
+                    os.remove(file)
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+        np.save(os.path.join(path, 'user_ids.npy'), np.concatenate(user_ids) if user_ids else np.empty(0, np.int32))
+        np.save(os.path.join(path, 'anime_ids.npy'), anime_ids)
+        meta = {
+            'version': SHARDS_VERSION, 'n_users': offsets[-1], 'n_anime': len(anime_ids), 'nnz': int(nnz),
+            'shards': names, 'offsets': offsets,
+            'min_anime_ratings': min_anime_ratings, 'max_user_ratings': max_user_ratings,
+        }
+        with open(os.path.join(path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        return cls(path)
+
+    @property
+    def shape(self):
+        return self.meta['n_users'], self.meta['n_anime']
+
+    @property
+    def nnz(self):
+        return self.meta['nnz']
+
+    @property
+    def n_shards(self):
+        return len(self.offsets) - 1
+
+    def shard(self, s):
+        # Shard s as a memory-mapped SparseRatingMatrix plus its inverse row norms (opened once)
+        if s not in self._shards:
+            matrix = SparseRatingMatrix.load(os.path.join(self.path, self.meta['shards'][s]), mmap=True)
+            self._shards[s] = (matrix, matrix.inverse_norms())
+        return self._shards[s]
+
+    def user_position(self, user_id):
+        # Global row of a user ID, or None if the user has no ratings
+        positions, found = SparseRatingMatrix._lookup(self.user_ids, user_id)
+        return int(positions) if found else None
+
+    def lookup_users(self, user_ids):
+        # Global rows for several user IDs plus a mask of which IDs were found
+        return SparseRatingMatrix._lookup(self.user_ids, np.asarray(user_ids).ravel())
+
+    def rows(self, rows):
+        # Dense float32 rating rows and inverse norms for global rows, gathered shard by shard
+        rows = np.asarray(rows, dtype=np.int64)
+        values = np.zeros((len(rows), self.shape[1]), dtype=np.float32)
+        inverse = np.zeros(len(rows))
+        shards = np.searchsorted(self.offsets, rows, side='right') - 1
+        for s in np.unique(shards):
+            matrix, shard_inverse = self.shard(s)
+            mine = shards == s
+            local = rows[mine] - self.offsets[s]
+            values[mine] = matrix.csr[local].toarray()
+            inverse[mine] = shard_inverse[local]
+        return values, inverse
+
+    def neighbor_positions(self, rows, k=5, block_size=512, metric='cosine'):
+        # Exact top-k neighbors for global rows, streamed over the shards.
+
+        # Parameters:
+        # - rows (np.ndarray): Global row positions of the query users.
+        # - k (int): Number of neighbors per user.
+        # - block_size (int): Query users per block; peak memory is about block_size x (users per shard) floats.
+        # - metric (str): Similarity metric, see similarity.METRICS.
+
+        # Returns:
+        # - np.ndarray: (len(rows), k) neighbor global rows, -1 where fewer than k others exist.
+        # - np.ndarray: (len(rows), k) float32 similarities, NaN where padded.
+
+        rows = np.asarray(rows, dtype=np.int64)
+        k_eff = min(k, self.shape[0] - 1)
+
+        positions = np.full((len(rows), k), -1, dtype=np.int64)
+        similarities = np.full((len(rows), k), np.nan, dtype=np.float32)
+        if k_eff <= 0 or len(rows) == 0:
+            return positions, similarities
+
+        for start in range(0, len(rows), block_size):
+            block = rows[start:start + block_size]
+            queries, _ = self.rows(block)
+            best = np.full((len(block), k_eff), -1, dtype=np.int64)
+            best_scores = np.full((len(block), k_eff), -np.inf)
+
+            # Same arithmetic as neighbors.neighbor_positions, one shard of candidate users at a time
+            for s in range(self.n_shards):
+                matrix, _ = self.shard(s)
+                scores = similarity_scores(matrix, queries, metric)
+                # The centered / pattern copies are rebuilt per block so memory stays bounded by one shard
+                matrix.clear_caches()
+                local = block - self.offsets[s]
+                own = (local >= 0) & (local < matrix.shape[0])
+                scores[np.nonzero(own)[0], local[own]] = -np.inf
+
+                top = top_k_rows(scores, min(k_eff, matrix.shape[0]))
+                best, best_scores = _merge_top_k(
+                    best, best_scores, top + self.offsets[s], np.take_along_axis(scores, top, axis=1), k_eff
+                )
+
+            positions[start:start + len(block), :k_eff] = best
+            similarities[start:start + len(block), :k_eff] = best_scores
+
+        return positions, similarities
+
+    def all_similar_users(self, k=5, block_size=512, out=None, metric='cosine'):
+        # Top-k most similar users for every user, one block of query users at a time.
+
+        # Parameters:
+        # - k (int): Number of similar users per user.
+        # - block_size (int): Users scored per block.
+        # - out (str, optional): Directory to write user_ids.npy, neighbor_ids.npy and similarities.npy to;
+        #   the results are then filled in block by block as memory-mapped arrays.
+        # - metric (str): Similarity metric, see similarity.METRICS.
+
+        # Returns:
+        # - np.ndarray: User IDs, one per output row.
+        # - np.ndarray: (U, k) int32 similar user IDs, -1 where unavailable.
+        # - np.ndarray: (U, k) float32 similarity scores, NaN where unavailable.
+
+        n_users = self.shape[0]
+        if out is None:
+            neighbor_ids = np.empty((n_users, k), dtype=np.int32)
+            similarities = np.empty((n_users, k), dtype=np.float32)
+        else:
+            os.makedirs(out, exist_ok=True)
+            np.save(os.path.join(out, 'user_ids.npy'), self.user_ids)
+            neighbor_ids = np.lib.format.open_memmap(
+                os.path.join(out, 'neighbor_ids.npy'), mode='w+', dtype=np.int32, shape=(n_users, k)
+            )
+            similarities = np.lib.format.open_memmap(
+                os.path.join(out, 'similarities.npy'), mode='w+', dtype=np.float32, shape=(n_users, k)
+            )
+
+        for start in range(0, n_users, block_size):
+            rows = np.arange(start, min(start + block_size, n_users))
+            positions, block_similarities = self.neighbor_positions(rows, k=k, block_size=block_size, metric=metric)
+            neighbor_ids[rows] = np.where(positions >= 0, self.user_ids[positions], -1)
+            similarities[rows] = block_similarities
+
+        if out is not None:
+            neighbor_ids.flush()
+            similarities.flush()
+        return self.user_ids, neighbor_ids, similarities
+
+    def __repr__(self):
+        users, animes = self.shape
+        return f"ShardedRatingMatrix(users={users}, anime={animes}, ratings={self.nnz}, shards={self.n_shards})"
+
+
+def main():
+    from data_loader import RATINGS_PATH, iter_ratings
+
+    parser = argparse.ArgumentParser(description="Build user-sharded rating shards and run the out-of-core neighbor job.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help="Stream rating.csv into filtered CSR shards")
+    build.add_argument('--ratings', default=RATINGS_PATH)
+    build.add_argument('--out', default=SHARDS_DIR)
+    build.add_argument('--shard-ratings', type=int, default=2_000_000)
+    build.add_argument('--chunksize', type=int, default=1_000_000)
+    build.add_argument('--min-anime-ratings', type=int, default=1000)
+    build.add_argument('--max-user-ratings', type=int, default=1000)
+
+    neighbors = subparsers.add_parser('neighbors', help="Top-k similar users of every user")
+    neighbors.add_argument('--shards', default=SHARDS_DIR)
+    neighbors.add_argument('--out', default='similar_users')
+    neighbors.add_argument('--k', type=int, default=5)
+    neighbors.add_argument('--block-size', type=int, default=512)
+    neighbors.add_argument('--metric', choices=METRICS, default='cosine')
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        matrix = ShardedRatingMatrix.build(
+            lambda: iter_ratings(args.ratings, args.chunksize), args.out, shard_ratings=args.shard_ratings,
+            min_anime_ratings=args.min_anime_ratings, max_user_ratings=args.max_user_ratings,
+        )
+        print(f"Wrote {matrix} to {args.out}")
+    else:
+        matrix = ShardedRatingMatrix(args.shards)
+        matrix.all_similar_users(k=args.k, block_size=args.block_size, out=args.out, metric=args.metric)
+        print(f"Wrote {args.k} {args.metric} similar users for {matrix.shape[0]} users to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+# Import numerical computation libraries
+import numpy as np
+
+# Similarity metrics accepted by similar_users, neighbor_positions and all_similar_users
+METRICS = ('cosine', 'pearson', 'jaccard')
+
+
+def _inverse(values):
+    # 1 / values, 0 where values is 0
+    return np.divide(1.0, values, out=np.zeros_like(values), where=values > 0)
+
+
+def _cosine(matrix, queries):
+    # Dot products of whole-number ratings are exact in float32, so exact ties stay exact ties;
+    # the query norms are computed exactly like the cached row norms
+    norms = np.sqrt(np.square(queries, dtype=np.float64).sum(axis=1))
+    scores = np.asarray(matrix.csr @ queries.T)
+    return (scores * matrix.inverse_norms()[:, None] * _inverse(norms)[None, :]).T
+
+
+def _pearson(matrix, queries):
+    # Mean-centered cosine (Pearson / adjusted cosine): each user's ratings minus their own mean,
+    # unrated anime stay 0 instead of counting as a rating of 0
+    rated = queries != 0
+    counts = rated.sum(axis=1)
+    means = np.divide(queries.sum(axis=1, dtype=np.float64), counts, out=np.zeros(len(queries)), where=counts > 0)
+    centered = np.where(rated, queries - means[:, None], 0).astype(np.float32)
+    norms = np.sqrt(np.square(centered, dtype=np.float64).sum(axis=1))
+    scores = np.asarray(matrix.centered() @ centered.T)
+    return (scores * _inverse(matrix.centered_norms())[:, None] * _inverse(norms)[None, :]).T
+
+
+def _jaccard(matrix, queries):
+    # |co-rated| / |rated by either|; the rated-pattern product counts the co-rated anime exactly
+    rated = (queries != 0).astype(np.float32)
+    common = np.asarray(matrix.pattern() @ rated.T).T
+    union = matrix.row_counts()[None, :] + rated.sum(axis=1, dtype=np.float64)[:, None] - common
+    return np.divide(common, union, out=np.zeros(union.shape), where=union > 0)
+
+
+_METRICS = {'cosine': _cosine, 'pearson': _pearson, 'jaccard': _jaccard}
+
+
+def similarity_scores(matrix, queries, metric='cosine'):
+    # Similarity of query users to every user of a SparseRatingMatrix with one sparse product.
+
+    # The per-user statistics of the matrix side (row norms, means and mean-centered
+    # rows, rated counts and pattern) are cached on the matrix and shared by every
+    # call; the query side is computed from the dense query rows.
+
+    # Parameters:
+    # - matrix (SparseRatingMatrix): Candidate users.
+    # - queries (np.ndarray): (b, n_anime) float32 raw rating rows of the query users, 0 where unrated.
+    # - metric (str): One of METRICS:
+    #   - 'cosine': cosine of the zero-filled rating vectors.
+    #   - 'pearson': cosine of the mean-centered ratings (Pearson / adjusted cosine).
+    #   - 'jaccard': overlap of the sets of rated anime.
+
+    # Returns:
+    # - np.ndarray: (b, n_users) float64 similarities.
+
+    if metric not in _METRICS:
+        raise ValueError(f"Unknown similarity metric {metric!r}; expected one of {METRICS}.")
+    return _METRICS[metric](matrix, np.asarray(queries, dtype=np.float32))
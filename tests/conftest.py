@@ -0,0 +1,38 @@
+# Shared fixtures: small seeded synthetic data from benchmark.synthetic_ratings
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from anime_index import AnimeIndex  # noqa: E402
+from benchmark import synthetic_ratings  # noqa: E402
+from rating_matrix import SparseRatingMatrix  # noqa: E402
+
+
+@pytest.fixture(scope='session')
+def synthetic():
+    # (ratings, animes) DataFrames: 400 users x 120 anime at 5% density
+    return synthetic_ratings(400, 120, 0.05, seed=0)
+
+
+@pytest.fixture(scope='session')
+def ratings(synthetic):
+    return synthetic[0]
+
+
+@pytest.fixture(scope='session')
+def animes(synthetic):
+    return synthetic[1]
+
+
+@pytest.fixture
+def matrix(ratings):
+    # Fresh per test, since some tests update the matrix in place
+    return SparseRatingMatrix.from_ratings(ratings)
+
+
+@pytest.fixture(scope='session')
+def anime_index(animes):
+    return AnimeIndex.from_frame(animes)
@@ -0,0 +1,86 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from batch_job import PROGRESS_FILE, matrix_fingerprint, run_batch_job
+from recommendation_store import RecommendationStore, read_meta
+from recommender import recommend_batch
+
+SETTINGS = dict(k=5, items=5, workers=2, chunk_size=100, block_size=32)
+
+
+def interrupt(path, done_chunks):
+    # Make a finished store look like a run that stopped after done_chunks, with marked rows in them
+    meta = read_meta(path)
+    meta['complete'] = False
+    with open(os.path.join(path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    progress = np.load(os.path.join(path, PROGRESS_FILE))
+    progress[:] = 0
+    progress[done_chunks] = 1
+    np.save(os.path.join(path, PROGRESS_FILE), progress)
+
+    anime_ids = np.load(os.path.join(path, 'anime_ids.npy'), mmap_mode='r+')
+    for chunk in done_chunks:
+        anime_ids[chunk * SETTINGS['chunk_size'], 0] = 123_456
+    anime_ids.flush()
+
+
+def sentinel_rows(path, done_chunks):
+    anime_ids = np.load(os.path.join(path, 'anime_ids.npy'), mmap_mode='r')
+    return [int(anime_ids[chunk * SETTINGS['chunk_size'], 0]) == 123_456 for chunk in done_chunks]
+
+
+@pytest.fixture
+def store(matrix, tmp_path):
+    path = str(tmp_path / 'store')
+    assert run_batch_job(matrix, path, **SETTINGS) == matrix.shape[0]
+    return path
+
+
+def test_batch_job_matches_recommend_batch(matrix, store):
+    assert read_meta(store)['complete']
+    ids, scores = recommend_batch(matrix.user_ids, matrix, k=5, items=5)
+    stored = RecommendationStore(store)
+    for row, user_id in enumerate(matrix.user_ids):
+        stored_ids, stored_scores = stored.lookup(user_id)
+        found = ids[row] >= 0
+        np.testing.assert_array_equal(stored_ids, ids[row][found])
+        np.testing.assert_array_equal(stored_scores, scores[row][found])
+
+
+def test_interrupted_run_resumes(matrix, store):
+    interrupt(store, [0, 2])
+    processed = run_batch_job(matrix, store, **SETTINGS)
+    assert processed == matrix.shape[0] - 2 * SETTINGS['chunk_size']
+    assert sentinel_rows(store, [0, 2]) == [True, True]
+    assert read_meta(store)['complete']
+
+
+def test_finished_store_is_rewritten(matrix, store):
+    interrupt(store, [0])
+    meta = read_meta(store)
+    meta['complete'] = True
+    with open(os.path.join(store, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    assert run_batch_job(matrix, store, **SETTINGS) == matrix.shape[0]
+    assert sentinel_rows(store, [0]) == [False]
+
+
+def test_changed_ratings_are_not_resumed(matrix, store):
+    interrupt(store, [0, 1])
+    before = matrix_fingerprint(matrix)
+    column = matrix.seen_items(0)[0]
+    matrix.upsert([matrix.user_ids[0]], [matrix.anime_ids[column]], [11 - matrix.csr[0, column]])
+    assert matrix_fingerprint(matrix) != before
+
+    assert run_batch_job(matrix, store, **SETTINGS) == matrix.shape[0]
+    assert sentinel_rows(store, [0, 1]) == [False, False]
+
+
+def test_changed_parameters_are_not_resumed(matrix, store):
+    interrupt(store, [0, 1])
+    assert run_batch_job(matrix, store, **dict(SETTINGS, chunk_size=50)) == matrix.shape[0]
+    assert sentinel_rows(store, [0, 1]) == [False, False]
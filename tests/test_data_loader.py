@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_loader
+from data_loader import ANIME_DTYPES, RATING_DTYPES, filter_ratings, load_animes, load_csv_cached, load_ratings
+from rating_matrix import CompactRatings
+
+
+@pytest.fixture
+def rating_csv(ratings, tmp_path):
+    # The synthetic ratings plus some rating == -1 rows, as in rating.csv
+    unrated = ratings.head(20).assign(rating=-1, anime_id=lambda frame: frame['anime_id'] + 1000)
+    path = tmp_path / 'rating.csv'
+    pd.concat([ratings, unrated]).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.fixture
+def anime_csv(animes, tmp_path):
+    # The synthetic anime with ratings, episodes, a missing genre and non-ASCII names
+    frame = animes.assign(rating=np.linspace(5, 9, len(animes)), episodes='12')
+    frame.loc[0, 'genre'] = np.nan
+    frame.loc[1, 'name'] = 'Kimi no Na wa. 君の名は。'
+    path = tmp_path / 'anime.csv'
+    frame[list(ANIME_DTYPES)].to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.fixture
+def no_parsing(monkeypatch):
+    # Fail any attempt to parse a CSV, so a load must come from the cache
+    def parse(*args, **kwargs):
+        raise AssertionError("CSV parsed although a cache should have been used")
+    return lambda: monkeypatch.setattr(data_loader, '_read_columns', parse)
+
+
+def test_ratings_cache_round_trip(rating_csv, tmp_path, no_parsing):
+    cache_dir = str(tmp_path / 'cache')
+    parsed = load_ratings(rating_csv, cache_dir=cache_dir)
+    assert (parsed['rating'] != -1).all()
+    assert parsed.dtypes.to_dict() == {name: np.dtype(dtype) for name, dtype in RATING_DTYPES.items()}
+
+    no_parsing()
+    pd.testing.assert_frame_equal(load_ratings(rating_csv, cache_dir=cache_dir), parsed)
+
+
+def test_animes_cache_round_trip(anime_csv, tmp_path, no_parsing):
+    cache_dir = str(tmp_path / 'cache')
+    parsed = load_animes(anime_csv, cache_dir=cache_dir)
+    no_parsing()
+    cached = load_animes(anime_csv, cache_dir=cache_dir)
+    pd.testing.assert_frame_equal(cached, parsed)
+    assert pd.isna(cached.loc[0, 'genre'])
+    assert cached.loc[1, 'name'].endswith('君の名は。')
+
+
+def test_cache_is_keyed_by_dtypes_and_keep(rating_csv, tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    filtered = load_ratings(rating_csv, cache_dir=cache_dir)
+
+    # Same file, no row filter: must not be answered from the filtered cache
+    everything = load_csv_cached(rating_csv, RATING_DTYPES, cache_dir=cache_dir)
+    assert len(everything) == len(filtered) + 20
+
+    # Other dtypes get their own cache as well
+    wide = load_csv_cached(rating_csv, dict(RATING_DTYPES, rating=np.float32), cache_dir=cache_dir)
+    assert wide['rating'].dtype == np.float32
+    assert len(list((tmp_path / 'cache').iterdir())) == 3
+
+
+def test_unnamed_keep_filter_is_not_cached(rating_csv, tmp_path):
+    cache_dir = tmp_path / 'cache'
+    kept = load_csv_cached(rating_csv, RATING_DTYPES, cache_dir=str(cache_dir), keep=lambda chunk: chunk['rating'] > 5)
+    assert (kept['rating'] > 5).all()
+    assert not cache_dir.exists()
+
+
+def reference_filter(ratings, min_anime_ratings, max_user_ratings):
+    # The notebook's filters written with plain pandas counts
+    anime_counts = ratings['anime_id'].map(ratings['anime_id'].value_counts())
+    user_counts = ratings['user_id'].map(ratings['user_id'].value_counts())
+    return ratings[(anime_counts >= min_anime_ratings) & (user_counts <= max_user_ratings)]
+
+
+@pytest.mark.parametrize('cutoffs', [(1, 1000), (10, 15), (30, 5)])
+def test_filter_ratings_matches_pandas(ratings, cutoffs):
+    expected = reference_filter(ratings, *cutoffs)
+    pd.testing.assert_frame_equal(filter_ratings(ratings, *cutoffs), expected)
+    compact = filter_ratings(CompactRatings.from_frame(ratings), *cutoffs)
+    pd.testing.assert_frame_equal(compact.to_frame().reset_index(drop=True), expected.reset_index(drop=True),
+                                  check_dtype=False)
+
+
+def test_filter_ratings_sees_in_place_changes(ratings):
+    frame = ratings.copy()
+    before = filter_ratings(frame, 10, 15)
+    # Move the ratings of a user that passed to an anime nobody else rated: they no longer pass
+    frame.loc[frame['user_id'] == before['user_id'].iloc[0], 'anime_id'] = 10_000
+    after = filter_ratings(frame, 10, 15)
+    pd.testing.assert_frame_equal(after, reference_filter(frame, 10, 15))
+    assert not after.equals(before)
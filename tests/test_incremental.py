@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from incremental import IncrementalRecommender
+
+SETTINGS = dict(k=5, min_anime_ratings=10, max_user_ratings=15, block_size=64)
+
+
+def triplets(matrix):
+    # (user_id, anime_id, rating) rows of a matrix, sorted, independent of its column set
+    coo = matrix.csr.tocoo()
+    frame = pd.DataFrame({
+        'user_id': matrix.user_ids[coo.row], 'anime_id': matrix.anime_ids[coo.col], 'rating': coo.data,
+    })
+    return frame.sort_values(['user_id', 'anime_id']).reset_index(drop=True)
+
+
+@pytest.fixture
+def split(ratings):
+    # Base ratings, and a batch of new ratings plus re-ratings of pairs already in the base
+    shuffled = ratings.sample(frac=1.0, random_state=0)
+    base, new = shuffled.iloc[:-300], shuffled.iloc[-300:]
+    rerated = base.sample(100, random_state=1).assign(rating=lambda frame: 11 - frame['rating'])
+    return base, pd.concat([new, rerated])
+
+
+def test_add_ratings_matches_rebuild(split):
+    base, batch = split
+    incremental = IncrementalRecommender(base, **SETTINGS)
+    incremental.add_ratings(batch)
+    rebuilt = IncrementalRecommender(pd.concat([base, batch]), **SETTINGS)
+
+    pd.testing.assert_series_equal(incremental.anime_counts.sort_index(), rebuilt.anime_counts.sort_index(),
+                                   check_names=False)
+    pd.testing.assert_series_equal(incremental.user_counts.sort_index(), rebuilt.user_counts.sort_index(),
+                                   check_names=False)
+    pd.testing.assert_frame_equal(triplets(incremental.matrix), triplets(rebuilt.matrix), check_dtype=False)
+
+    np.testing.assert_array_equal(incremental.matrix.user_ids, rebuilt.matrix.user_ids)
+    np.testing.assert_allclose(incremental.neighbor_similarities, rebuilt.neighbor_similarities, rtol=1e-5)
+
+
+def test_rerating_is_not_counted_twice(split):
+    base, _ = split
+    incremental = IncrementalRecommender(base, **SETTINGS)
+    counts = incremental.anime_counts.copy()
+    incremental.add_ratings(base.head(50).assign(rating=1))
+    pd.testing.assert_series_equal(incremental.anime_counts.sort_index(), counts.sort_index())
@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+
+from recommendation_store import RecommendationStore, export_recommendations, read_meta
+from recommender import recommend_batch
+
+
+@pytest.mark.parametrize('block_size', [64, 1000])
+def test_store_matches_recommend_batch(matrix, animes, tmp_path, block_size):
+    export_recommendations(matrix, str(tmp_path), k=5, items=5, anime_data=animes, block_size=block_size)
+    assert read_meta(str(tmp_path))['complete']
+
+    store = RecommendationStore(str(tmp_path))
+    ids, scores = recommend_batch(matrix.user_ids, matrix, k=5, items=5)
+    for row, user_id in enumerate(matrix.user_ids):
+        stored_ids, stored_scores = store.lookup(user_id)
+        found = ids[row] >= 0
+        np.testing.assert_array_equal(stored_ids, ids[row][found])
+        np.testing.assert_array_equal(stored_scores, scores[row][found])
+    assert 999_999 not in store
@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from recommender import recommend_batch, recommend_item, similar_users
+
+
+def test_recommend_item_matches_recommend_batch(matrix):
+    # The per-user sparse path and the batch path score with the same float64 means
+    ids, scores = recommend_batch(matrix.user_ids, matrix, k=5, items=5)
+    for row, user_id in enumerate(matrix.user_ids):
+        users, _ = similar_users(user_id, matrix, k=5)
+        recommendations, top = recommend_item(user_id, users, matrix, items=5)
+        found = ids[row] >= 0
+        assert top == ids[row][found].tolist()
+        np.testing.assert_array_equal(recommendations.to_numpy(np.float32), scores[row][found])
+
+
+@pytest.fixture(scope='module')
+def dense(ratings):
+    # The notebook's pivot_table matrix
+    return ratings.pivot_table(index='user_id', columns='anime_id', values='rating').fillna(0)
+
+
+def test_sparse_matrix_matches_pivot_table(matrix, dense):
+    pd.testing.assert_frame_equal(matrix.to_dense(), dense, check_dtype=False, check_names=False)
+
+
+def test_similar_users_sparse_matches_dense(matrix, dense):
+    for user_id in matrix.user_ids[:60]:
+        users, pairs = similar_users(user_id, matrix, k=5)
+        dense_users, dense_pairs = similar_users(user_id, dense, k=5)
+        np.testing.assert_allclose([s for _, s in pairs], [s for _, s in dense_pairs], rtol=1e-5)
+        assert users == dense_users
+
+
+def test_recommend_item_sparse_matches_dense(matrix, dense):
+    for user_id in matrix.user_ids[:60]:
+        users, _ = similar_users(user_id, matrix, k=5)
+        recommendations, top = recommend_item(user_id, users, matrix, items=5)
+        dense_recommendations, _ = recommend_item(user_id, users, dense, items=5)
+        # Same scores in the same order; equal means may be listed in another order by the dense sort
+        np.testing.assert_allclose(recommendations.to_numpy(), dense_recommendations.to_numpy()[:len(top)], rtol=1e-6)
+        np.testing.assert_allclose(dense_recommendations.reindex(top).to_numpy(), recommendations.to_numpy(), rtol=1e-6)
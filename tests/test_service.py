@@ -0,0 +1,101 @@
+import asyncio
+import json
+
+import pytest
+
+from service import RecommendationServer, RecommendationService
+
+
+@pytest.fixture
+def server(matrix, anime_index):
+    return RecommendationServer(RecommendationService(matrix, anime_index, window=0.001))
+
+
+def dispatch(server, target, body=b'', method='GET'):
+    async def run():
+        return await server.dispatch(method, target, body)
+    return asyncio.run(run())
+
+
+def test_recommend_ok(server, matrix):
+    status, payload = dispatch(server, f'/recommend?user_id={matrix.user_ids[0]}&items=3')
+    assert status == 200
+    assert payload['user_id'] == matrix.user_ids[0]
+    assert len(payload['recommendations']) <= 3
+
+
+def test_unknown_user_is_404(server):
+    status, _ = dispatch(server, '/recommend?user_id=999999')
+    assert status == 404
+
+
+@pytest.mark.parametrize('query', [
+    'user_id=1&genres_all=Nope',
+    'user_id=1&type=Nope',
+    'user_id=abc',
+    'user_id=1&k=0',
+    'k=5',
+])
+def test_bad_query_is_400(server, query):
+    status, payload = dispatch(server, f'/recommend?{query}')
+    assert status == 400
+    assert 'error' in payload
+
+
+@pytest.mark.parametrize('body', [
+    b'[1]',
+    b'"text"',
+    b'{not json',
+    b'{"user_id": {"a": 1}}',
+    b'{"user_id": 1, "k": [[1]]}',
+    b'{"user_id": 1, "k": []}',
+    b'{"user_id": [[1]]}',
+    b'{"user_id": 1, "genres_all": {"a": 1}}',
+])
+def test_malformed_body_is_400(server, body):
+    status, payload = dispatch(server, '/recommend', body, method='POST')
+    assert status == 400
+    assert 'error' in payload
+
+
+def test_bad_request_does_not_fail_its_batch(server, matrix):
+    # A request with an unknown genre that reaches the batch only fails itself
+    results = server.service.recommend_batch([
+        {'user_id': int(matrix.user_ids[0]), 'k': 5, 'items': 3, 'filters': {'genres_all': {'Nope'}}},
+        {'user_id': int(matrix.user_ids[0]), 'k': 5, 'items': 3, 'filters': {}},
+    ])
+    assert isinstance(results[0], ValueError)
+    assert results[1]['recommendations']
+
+
+def test_batch_failure_is_500(server, matrix, monkeypatch):
+    def broken(requests):
+        raise RuntimeError("boom")
+    monkeypatch.setattr(server.service.recommend_batcher, 'handle_batch', broken)
+    status, payload = dispatch(server, f'/recommend?user_id={matrix.user_ids[0]}')
+    assert status == 500
+    assert 'boom' in payload['error']
+
+
+def test_keep_alive_survives_malformed_body(server, matrix):
+    # A malformed body gets its 400 and the same connection still answers the next request
+    async def run():
+        listener = await asyncio.start_server(server.handle_connection, '127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+        async with listener:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            responses = []
+            for body in (b'{"user_id": {"a": 1}}', json.dumps({'user_id': int(matrix.user_ids[0])}).encode()):
+                writer.write(b'POST /recommend HTTP/1.1\r\nContent-Length: %d\r\n\r\n' % len(body) + body)
+                await writer.drain()
+                status_line = await reader.readline()
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b''):
+                    name, _, value = line.decode().partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                await reader.readexactly(int(headers['content-length']))
+                responses.append(int(status_line.split()[1]))
+            writer.close()
+            return responses
+
+    assert asyncio.run(run()) == [400, 200]
@@ -0,0 +1,48 @@
+import os
+
+import numpy as np
+import pytest
+
+from data_loader import filter_ratings
+from neighbors import neighbor_positions
+from rating_matrix import SparseRatingMatrix
+from sharded_matrix import ShardedRatingMatrix
+
+FILTERS = dict(min_anime_ratings=5, max_user_ratings=30)
+
+
+def chunks_of(ratings, size=250):
+    return lambda: (ratings.iloc[start:start + size] for start in range(0, len(ratings), size))
+
+
+@pytest.fixture
+def expected(ratings):
+    return SparseRatingMatrix.from_ratings(filter_ratings(ratings, **FILTERS))
+
+
+def test_sharded_matches_in_memory(ratings, expected, tmp_path):
+    sharded = ShardedRatingMatrix.build(chunks_of(ratings), str(tmp_path), shard_ratings=300, **FILTERS)
+    assert sharded.n_shards > 1
+    np.testing.assert_array_equal(sharded.user_ids, expected.user_ids)
+    np.testing.assert_array_equal(sharded.anime_ids, expected.anime_ids)
+
+    values, _ = sharded.rows(np.arange(sharded.shape[0]))
+    np.testing.assert_array_equal(values, expected.csr.toarray())
+
+    rows = np.arange(expected.shape[0])
+    positions, similarities = sharded.neighbor_positions(rows, k=5)
+    expected_positions, expected_similarities = neighbor_positions(expected, rows, k=5)
+    np.testing.assert_array_equal(positions, expected_positions)
+    np.testing.assert_allclose(similarities, expected_similarities, rtol=1e-6)
+
+
+def test_build_ignores_leftover_scratch_files(ratings, expected, tmp_path):
+    # An interrupted earlier build left scratch files behind; they must not be appended to
+    scratch = tmp_path / '_scratch'
+    scratch.mkdir()
+    for name, dtype in (('user_id', np.int32), ('anime_id', np.int32), ('rating', np.float32)):
+        np.ones(10, dtype=dtype).tofile(scratch / f'0.{name}')
+
+    sharded = ShardedRatingMatrix.build(chunks_of(ratings), str(tmp_path), shard_ratings=300, **FILTERS)
+    assert sharded.nnz == expected.nnz
+    assert not os.path.exists(scratch)
@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from recommender import similar_users
+from user_clusters import UserClusterIndex
+
+
+@pytest.fixture
+def clusters(matrix):
+    return UserClusterIndex.build(matrix, n_clusters=4, n_components=8, probes=3)
+
+
+def test_all_probes_match_exact_search(matrix, clusters):
+    # With every cluster probed the candidates are all users, so the result equals the exact search
+    for user_id in matrix.user_ids[:20]:
+        exact, _ = similar_users(int(user_id), matrix, k=5)
+        approximate, _ = similar_users(int(user_id), matrix, k=5, approximate=True, index=clusters)
+        assert approximate == exact
+
+
+def test_stale_index_raises(matrix, clusters):
+    position = 0
+    clusters.query(position)
+    matrix.upsert([10 ** 6], [matrix.anime_ids[0]], [8])
+    with pytest.raises(ValueError):
+        clusters.query(position)
+    with pytest.raises(ValueError):
+        clusters.candidates(position)
+
+
+def test_save_load_round_trip(matrix, clusters, tmp_path):
+    path = tmp_path / 'clusters.npz'
+    clusters.save(path)
+    loaded = UserClusterIndex.load(path, matrix)
+    np.testing.assert_array_equal(loaded.labels, clusters.labels)
+    np.testing.assert_array_equal(loaded.query(3)[0], clusters.query(3)[0])
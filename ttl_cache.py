@@ -0,0 +1,79 @@
+# Import libraries for caching and thread safety
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_key(user_id, k, items, filters=None):
+    # Hashable cache key for a recommendation request; filter collections become sorted tuples
+    normalized = tuple(sorted((name, tuple(sorted(values))) for name, values in (filters or {}).items() if values))
+    return int(user_id), int(k), int(items), normalized
+
+
+class TTLCache:
+    # Bounded LRU cache whose entries also expire after ttl seconds.
+    #
+    # Safe to share between Streamlit sessions (threads). Counts hits, misses,
+    # evictions (entries dropped because the cache was full) and expirations.
+
+    def __init__(self, maxsize=1024, ttl=600.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        # Cached value for key, or default if it is missing or expired
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self.clock():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        # Store a value, evicting the least recently used entry when full
+        with self._lock:
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key, compute):
+        # Cached value for key, calling compute() and caching its result on a miss
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        # Counters for display / monitoring
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+        }
@@ -0,0 +1,207 @@
+# Import libraries for command-line use
+import argparse
+
+# Import numerical computation libraries
+import numpy as np
+
+from ann_index import index_recall
+from neighbors import top_k_rows
+
+CLUSTERS_PATH = 'user_clusters.npz'
+
+
+class UserClusterIndex:
+    # Candidate pruning for neighbor search with KMeans user clusters.
+    #
+    # Normalized rating vectors are reduced with truncated SVD, standardized and
+    # clustered with mini-batch KMeans. A query only scores the users in the
+    # clusters nearest to the query user (its own cluster plus `probes` more)
+    # with exact cosine similarity, instead of every user. Has the same
+    # candidates / query interface as LSHIndex, so it can be passed as
+    # similar_users(..., approximate=True, index=...).
+    #
+    # Attributes:
+    # - matrix (SparseRatingMatrix): The clustered rating matrix.
+    # - components (np.ndarray): (n_anime, n_components) float32 SVD projection.
+    # - scaler_mean, scaler_scale (np.ndarray): StandardScaler parameters of the reduced vectors.
+    # - centers (np.ndarray): (n_clusters, n_components) float32 cluster centers in scaled space.
+    # - labels (np.ndarray): (n_users,) cluster of every row.
+    # - order (np.ndarray): Row positions sorted by cluster; cluster c is order[offsets[c]:offsets[c + 1]].
+    # - version (int): matrix.version the labels belong to; queries raise ValueError once the matrix changed.
+
+    def __init__(self, matrix, components, scaler_mean, scaler_scale, centers, labels, probes=1):
+        self.matrix = matrix
+        self.components = np.asarray(components, dtype=np.float32)
+        self.scaler_mean = np.asarray(scaler_mean, dtype=np.float32)
+        self.scaler_scale = np.asarray(scaler_scale, dtype=np.float32)
+        self.centers = np.asarray(centers, dtype=np.float32)
+        self.labels = np.asarray(labels, dtype=np.int32)
+        self.probes = probes
+        self.silhouettes = {}
+        self.order = np.argsort(self.labels, kind='stable')
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(self.labels, minlength=len(self.centers)))])
+        self.version = matrix.version
+        self._blocks = None
+
+    @classmethod
+    def build(cls, matrix, n_clusters=None, candidate_clusters=(8, 16, 32, 64), n_components=32, probes=1,
+              sample=5000, seed=0):
+        # Cluster every user of a SparseRatingMatrix.
+
+        # Parameters:
+        # - matrix (SparseRatingMatrix): The rating matrix.
+        # - n_clusters (int, optional): Number of clusters; chosen by silhouette score if omitted.
+        # - candidate_clusters (tuple): Cluster counts tried when n_clusters is omitted.
+        # - n_components (int): SVD dimensions the users are clustered in.
+        # - probes (int): Extra nearest clusters searched besides the user's own.
+        # - sample (int): Users sampled for each silhouette score (the score is quadratic in this).
+        # - seed (int): Random seed.
+
+        # Returns:
+        # - UserClusterIndex: The built index; silhouette scores per tried k are in .silhouettes.
+
+        # sklearn is only needed to build the index, so loading a saved one does not import it
+        from sklearn.cluster import MiniBatchKMeans
+        from sklearn.decomposition import TruncatedSVD
+        from sklearn.metrics import silhouette_score
+        from sklearn.preprocessing import StandardScaler
+
+        n_users, n_anime = matrix.shape
+        normalized = matrix.normalized()
+        svd = TruncatedSVD(n_components=min(n_components, n_anime - 1), random_state=seed).fit(normalized)
+        reduced = svd.transform(normalized)
+        scaler = StandardScaler().fit(reduced)
+        scaled = scaler.transform(reduced).astype(np.float32)
+
+        silhouettes = {}
+        if n_clusters is None:
+            rng = np.random.default_rng(seed)
+            rows = rng.choice(n_users, size=min(sample, n_users), replace=False)
+            best = None
+            for k in candidate_clusters:
+                if not 1 < k < len(rows):
+                    continue
+                model = MiniBatchKMeans(n_clusters=k, batch_size=4096, n_init=3, random_state=seed).fit(scaled)
+                silhouettes[k] = float(silhouette_score(scaled[rows], model.labels_[rows]))
+                if best is None or silhouettes[k] > silhouettes[best[0]]:
+                    best = (k, model)
+            if best is None:
+                raise ValueError("Too few users for the candidate cluster counts.")
+            model = best[1]
+        else:
+            model = MiniBatchKMeans(n_clusters=n_clusters, batch_size=4096, n_init=3, random_state=seed).fit(scaled)
+
+        index = cls(matrix, svd.components_.T, scaler.mean_, scaler.scale_, model.cluster_centers_, model.labels_, probes)
+        index.silhouettes = silhouettes
+        return index
+
+    def save(self, path):
+        # Persist the cluster model to an .npz file (the rating matrix itself is not stored)
+        np.savez(
+            path,
+            components=self.components,
+            scaler_mean=self.scaler_mean,
+            scaler_scale=self.scaler_scale,
+            centers=self.centers,
+            labels=self.labels,
+            user_ids=self.matrix.user_ids,
+            params=np.array([self.probes]),
+        )
+
+    @classmethod
+    def load(cls, path, matrix):
+        # Load a cluster model saved with save() and attach it to the matrix it was built from
+        with np.load(path) as data:
+            if not np.array_equal(data['user_ids'], matrix.user_ids):
+                raise ValueError("Cluster model was built for a different rating matrix.")
+            return cls(
+                matrix, data['components'], data['scaler_mean'], data['scaler_scale'],
+                data['centers'], data['labels'], probes=int(data['params'][0]),
+            )
+
+    def transform(self, rows):
+        # Scaled reduced vectors of the users at the given row positions
+        reduced = self.matrix.normalized()[rows] @ self.components
+        return (np.asarray(reduced) - self.scaler_mean) / self.scaler_scale
+
+    def nearest_clusters(self, position):
+        # The user's own cluster followed by the `probes` clusters closest to its vector
+        distances = ((self.centers - self.transform([position])) ** 2).sum(axis=1)
+        distances[self.labels[position]] = -1.0
+        return np.argsort(distances)[:self.probes + 1]
+
+    def _check_version(self):
+        # Labels are per row position, so they are meaningless after upsert / drop_users changed the rows
+        if self.matrix.version != self.version:
+            raise ValueError("The rating matrix changed since the cluster index was built; rebuild it.")
+
+    def candidates(self, position):
+        # Row positions in the searched clusters, excluding the user itself
+        self._check_version()
+        clusters = self.nearest_clusters(position)
+        candidates = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in clusters])
+        return candidates[candidates != position]
+
+    def query(self, position, k=5):
+        # Top-k neighbors of a row position among the candidates.
+
+        # Parameters:
+        # - position (int): Row position of the query user.
+        # - k (int): Number of neighbors.
+
+        # Returns:
+        # - np.ndarray: Up to k neighbor row positions, best first.
+        # - np.ndarray: Matching cosine similarities.
+
+        self._check_version()
+        clusters = self.nearest_clusters(position)
+        blocks = self._cluster_rows()
+        query = self.matrix.normalized()[position].toarray().ravel()
+
+        candidates = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in clusters])
+        scores = np.concatenate([blocks[c] @ query for c in clusters])
+        keep = candidates != position
+        if not keep.any():
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        # Ascending row order so ties break like the exact search
+        ranked = np.argsort(candidates[keep])
+        candidates, scores = candidates[keep][ranked], scores[keep][ranked].astype(np.float32)
+        top = top_k_rows(scores[None, :], min(k, len(candidates)))[0]
+        return candidates[top], scores[top]
+
+    def _cluster_rows(self):
+        # Normalized rows of every cluster as its own CSR block, built on first use
+        if self._blocks is None:
+            clustered = self.matrix.normalized()[self.order]
+            self._blocks = [clustered[self.offsets[c]:self.offsets[c + 1]] for c in range(len(self.centers))]
+        return self._blocks
+
+    def recall(self, k=5, sample=500, seed=0):
+        # Measure recall@k against exact brute-force search, see ann_index.index_recall
+        return index_recall(self, k=k, sample=sample, seed=seed)
+
+
+def main():
+    from data_loader import filter_ratings, load_compact_ratings
+    from rating_matrix import SparseRatingMatrix
+
+    parser = argparse.ArgumentParser(description="Cluster users for pruned neighbor search.")
+    parser.add_argument('--out', default=CLUSTERS_PATH)
+    parser.add_argument('--clusters', type=int, default=None, help="Skip the silhouette search")
+    parser.add_argument('--components', type=int, default=32)
+    parser.add_argument('--probes', type=int, default=1)
+    args = parser.parse_args()
+
+    rating_matrix = SparseRatingMatrix.from_ratings(filter_ratings(load_compact_ratings()))
+    index = UserClusterIndex.build(rating_matrix, n_clusters=args.clusters, n_components=args.components,
+                                   probes=args.probes)
+    for k, score in index.silhouettes.items():
+        print(f"k={k}: silhouette {score:.4f}")
+    print(f"Using {len(index.centers)} clusters: {index.recall()}")
+    index.save(args.out)
+    print(f"Saved cluster model to {args.out}")
+
+
+if __name__ == '__main__':
+    main()